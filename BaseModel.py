@@ -1,3 +1,5 @@
+#Import ctypes for the offsets of the levels of detail
+import ctypes
 #Imports all openGL functions
 from OpenGL.GL import *
 #Import helper functions
@@ -7,13 +9,21 @@ from material import Material
 from mesh import Mesh
 from shaders import *
 from texture import Texture
+#Import the state tracking of the render queue
+from renderQueue import bind_vertex_array, bind_texture, drawing
+from frameTimer import count
+#Import the layouts of the vertex buffers
+from vertexLayout import float_layout
+#Import the bounding boxes used for culling
+from frustum import bounding_box, transform_bounds
+from transforms import update_model_transforms
 
 class BaseModel:
     '''
     Base class for all models, implementing the basic draw function for triangular meshes.
     Inherit from this to create new models.
     '''
-    def __init__(self, scene, M=poseMatrix(), mesh=Mesh(), color=[1., 1., 1.], primitive=GL_TRIANGLES, visible=True):
+    def __init__(self, scene, M=poseMatrix(), mesh=Mesh(), color=[1., 1., 1.], primitive=GL_TRIANGLES, visible=True, layout=None):
         '''
         Initialises the model data
         scene refers to the scene the model is in
@@ -22,6 +32,7 @@ class BaseModel:
         color refers to the colour of the model (prior to texturing/shading)
         primitive refers to the way the model is drawn, whether it is from triangles or squares
         visible refers to whether the model will initially be visible
+        layout refers to the VertexLayout of the vertex buffer, float32 attributes if not provided
         '''
         print('+ Initializing {}'.format(self.__class__.__name__))
         #Store the initialised information
@@ -29,38 +40,60 @@ class BaseModel:
         self.scene = scene
         self.primitive = primitive
         self.color = color
-        #Store the shader program for rendering this model
+        #Store the shader program for rendering this model, and its variants for passes with defines (see pass_shader())
         self.shader = None
+        self.shader_variants = {}
         #Store the mesh data
         self.mesh = mesh
         self.name = self.mesh.name
         #Create dictionaries to store visual buffer objects and attributes
         self.vbos = {}
         self.attributes = {}
+        self.layout = float_layout if layout is None else layout
+        #Size in bytes of the vertex and index buffers on the GPU
+        self.buffer_bytes = {'vertices': 0, 'indices': 0}
+        #Hierarchy of bounding volumes the model is in, if any, which is told when M is assigned (see BVH.move())
+        self.bvh = None
+        self.bvh_index = None
+        #Node of the scene graph whose world matrix is assigned to M, if any (see sceneGraph.py)
+        self.node = None
+        #Number of times M was assigned, and the matrices derived from it for the shaders (see transforms())
+        self.M_version = 0
+        self.transforms_version = -1
+        self.world = None
+        self.normal_matrix = None
         #Store the position of the model in the scene
         self.M = M
         #Use a vertex array to pack all buffers for GPU rendering
         self.vao = glGenVertexArrays(1)
         #If shared vertex representation is used, a buffer will be used to store the current location within the array
         self.index_buffer = None
+        self.index_type = GL_UNSIGNED_INT
+        self.index_count = 0
+        #Index ranges (count, offset in bytes) of each level of detail, their error in model coordinates (see
+        #simplify.generate_lods), and the level drawn, as well as the last one drawn in each pass (see select_level())
+        self.levels = []
+        self.lod_errors = []
+        self.level = 0
+        self.pass_levels = {}
+        #Largest error of the level of detail drawn, in pixels on screen, and the fraction of it a coarser level must
+        #be under before it replaces the level drawn
+        self.lod_error = 1.
+        self.lod_hysteresis = 0.75
+        #Bounding box of the vertices in model coordinates as (center, half extent), for frustum culling
+        self.bounds = None
 
-    def initialise_vbo(self, name, data):
-        if data is None:
-            print('(W) Warning in {}.bind_attribute(): Data array for attribute {} is None!'.format(
-                self.__class__.__name__, name))
-            return
-
-        #Bind the location of the attribute in the GLSL program to the next index
-        self.attributes[name] = len(self.vbos)
-        #Create a buffer object to store the attribute
-        self.vbos[name] = glGenBuffers(1)
-        glBindBuffer(GL_ARRAY_BUFFER, self.vbos[name])
-        glEnableVertexAttribArray(self.attributes[name])
-        #Associate the bound buffer to the corresponding input location in the shader
-        glVertexAttribPointer(index=self.attributes[name], size=data.shape[1], type=GL_FLOAT, normalized=False,
-                              stride=0, pointer=None)
-        #Put the vertex array data into the buffer
-        glBufferData(GL_ARRAY_BUFFER, data, GL_STATIC_DRAW)
+    @property
+    def M(self):
+        ''' The model matrix, giving the position of the model within the scene '''
+        return self._M
+
+    @M.setter
+    def M(self, M):
+        self._M = M
+        self.M_version += 1
+        if self.bvh is not None:
+            self.bvh.move(self)
 
     def bind_shader(self, shader):
         '''
@@ -72,35 +105,70 @@ class BaseModel:
                 self.shader = PhongShader(shader) #If there is, create a new shader of that type using the shader information
             else:
                 self.shader = shader #Use the new shader
+            self.shader_variants = {}
             #Bind all attributes and compile the shader
             self.shader.compile(self.attributes)
 
+    def pass_shader(self):
+        '''
+        Returns the shader drawing the model in the current pass: its own, or a variant of it with the defines of the
+        pass (see Scene.shader_defines), compiled the first time it is needed.
+        '''
+        defines = self.scene.shader_defines
+        if len(defines) == 0:
+            return self.shader
+        key = tuple(sorted(defines.items()))
+        if key not in self.shader_variants:
+            self.shader_variants[key] = self.shader.variant(defines)
+            self.shader_variants[key].compile(self.attributes)
+        return self.shader_variants[key]
+
     def bind(self):
         '''
         This method stores the vertex data in a Vertex Buffer Object (VBO) that can be uploaded
-        to the GPU at render time.
+        to the GPU at render time, with all attributes interleaved as described by the layout of the model.
         '''
         #Bind the VAO to retrieve all buffers and rendering context
         glBindVertexArray(self.vao)
         if self.mesh.vertices is None:
             print('(W) Warning in {}.bind(): No vertex array!'.format(self.__class__.__name__))
-        # initialise vertex position VBO and link to shader program attribute
-        self.initialise_vbo('position', self.mesh.vertices)
-        self.initialise_vbo('normal', self.mesh.normals)
-        self.initialise_vbo('color', self.mesh.colors)
-        self.initialise_vbo('texCoord', self.mesh.textureCoords)
-        self.initialise_vbo('tangent', self.mesh.tangents)
-        self.initialise_vbo('binormal', self.mesh.binormals)
+        #Initialise the vertex VBO and link its attributes to their locations in the shader program
+        self.vbos['vertices'], self.attributes, self.buffer_bytes['vertices'] = self.layout.create_vertex_buffer([self.mesh])
         #If indices are provided, put them in a buffer too
         if self.mesh.faces is not None:
-            self.index_buffer = glGenBuffers(1)
-            glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.index_buffer)
-            glBufferData(GL_ELEMENT_ARRAY_BUFFER, self.mesh.faces, GL_STATIC_DRAW)
+            #The levels of detail of the mesh follow the full mesh in the index buffer
+            faces = [self.mesh.faces] + list(self.mesh.lods)
+            self.index_buffer, self.index_type, itemsize, self.buffer_bytes['indices'] = self.layout.create_index_buffer(faces)
+            self.index_count = self.mesh.faces.size
+            offsets = np.cumsum([0] + [array.size for array in faces])*itemsize
+            self.levels = [(array.size, int(offset)) for (array, offset) in zip(faces, offsets)]
+            self.lod_errors = [0.] + list(self.mesh.lod_errors)
+        self.bounds = bounding_box(self.mesh.vertices)
         #Finally we unbind the VAO and VBO when we're done to avoid side effects
         glBindVertexArray(0)
         glBindBuffer(GL_ARRAY_BUFFER, 0)
 
-    def draw(self, Mp=poseMatrix()):
+    def transforms(self):
+        '''
+        Returns the float32 model matrix and normal matrix of the model, which are only computed again when M is
+        assigned, and are usually computed for all models of a pass at once (see Scene.draw_models()).
+        '''
+        update_model_transforms([self])
+        return self.world, self.normal_matrix
+
+    def pass_matrix(self, Mp=None):
+        '''
+        Returns the model matrix to draw the model with: its cached float32 matrix (see transforms()), unless the
+        scene does not cache them or a parent matrix is given.
+        :param Mp: [optional] the model matrix of the parent object, for composite objects
+        '''
+        if Mp is not None:
+            return np.matmul(Mp, self.M)
+        if not self.scene.cache_transforms:
+            return self.M
+        return self.transforms()[0]
+
+    def draw(self, Mp=None):
         '''
         Draws the model using OpenGL functions.
         Mp refers to the model matrix of the parent object, for composite objects.
@@ -109,26 +177,75 @@ class BaseModel:
             if self.mesh.vertices is None:
                 print('(W) Warning in {}.draw(): No vertex array!'.format(self.__class__.__name__))
             #Bind the Vertex Array Object so that all buffers are bound correctly and following operations affect them
-            glBindVertexArray(self.vao)
+            bind_vertex_array(self.vao)
+            M = self.pass_matrix(Mp)
+            self.level = self.select_level(M)
             #Setup the shader program and provide it the model and its position relative to where it is being drawn
             #For rendering this model
-            self.shader.bind(
+            self.pass_shader().bind(
                 model=self,
-                M=np.matmul(Mp, self.M)
+                M=M
             )
             #Bind all textures
             for unit, tex in enumerate(self.mesh.textures):
-                glActiveTexture(GL_TEXTURE0 + unit)
-                tex.bind()
-            #Check whether the data is stored as vertex array or index array
-            if self.mesh.faces is not None:
-                #Draw the data in the buffer using the index array
-                glDrawElements(self.primitive, self.mesh.faces.flatten().shape[0], GL_UNSIGNED_INT, None )
-            else:
-                #Draw the data in the buffer using the vertex array ordering only.
-                glDrawArrays(self.primitive, 0, self.mesh.vertices.shape[0])
-            #Unbind the shader to avoid side effects
-            glBindVertexArray(0)
+                bind_texture(unit, tex)
+            #Draw the data in the buffers
+            self.submit()
+            count('draw calls')
+            #Unbind the vertex array to avoid side effects, unless the render queue draws another model next
+            if not drawing():
+                glBindVertexArray(0)
+
+    def select_level(self, M):
+        '''
+        Returns the level of detail to draw in the current pass: the coarsest one whose error, projected at the point
+        of the bounds of the model nearest to the camera (see Scene.pixels_per_unit()), is at most lod_error pixels.
+        A coarser level than the one last drawn in the same pass (see Scene.pass_name) is only used once its error is
+        under lod_hysteresis times lod_error, so that models around a switch distance do not flicker between levels.
+        :param M: the model matrix the model is drawn with
+        '''
+        if len(self.levels) < 2 or self.bounds is None or len(self.lod_errors) < len(self.levels):
+            return 0
+        pixels = self.scene.pixels_per_unit(transform_bounds(self.bounds, M))*self.lod_scale(M)
+        if np.isinf(pixels):
+            #The camera is inside the bounds
+            level = 0
+        else:
+            #Levels are coarser and coarser, so the one drawn is the last of the first levels under the error
+            errors = np.asarray(self.lod_errors)*pixels
+            level = int(np.sum(np.cumprod(errors <= self.lod_error))) - 1
+            previous = self.pass_levels.get(self.scene.pass_name, 0)
+            if level > previous:
+                level = max(previous, int(np.sum(np.cumprod(errors <= self.lod_hysteresis*self.lod_error))) - 1)
+        self.pass_levels[self.scene.pass_name] = level
+        return level
+
+    def lod_scale(self, M):
+        ''' Returns the largest factor by which the model matrix M scales lengths, for the errors of the levels of detail '''
+        return float(np.max(np.linalg.norm(np.asarray(M)[:3, :3], axis=0)))
+
+    def world_bounds(self, Mp=None):
+        '''
+        Returns the axis aligned bounding box of the model in world coordinates, or None if it has no bounds.
+        Mp refers to the model matrix of the parent object, for composite objects.
+        '''
+        if self.bounds is None:
+            return None
+        return transform_bounds(self.bounds, self.M if Mp is None else np.matmul(Mp, self.M))
+
+    def submit(self):
+        '''
+        Issues the draw call of the model, once its vertex array, shader program and textures are bound.
+        '''
+        #Check whether the data is stored as vertex array or index array
+        if self.mesh.faces is not None:
+            #Draw the data in the buffer using the index array, at the level of detail selected
+            (number, offset) = self.levels[self.level]
+            glDrawElements(self.primitive, number, self.index_type, ctypes.c_void_p(offset))
+            count('triangles', number//3)
+        else:
+            #Draw the data in the buffer using the vertex array ordering only.
+            glDrawArrays(self.primitive, 0, self.mesh.vertices.shape[0])
 
     def vbo__del__(self):
         '''
@@ -144,12 +261,12 @@ class DrawModelFromMesh(BaseModel):
     Base class for all models, inherit from this to create new models
     '''
 
-    def __init__(self, scene, M, mesh, name=None, shader=None, visible=True):
+    def __init__(self, scene, M, mesh, name=None, shader=None, visible=True, layout=None):
         '''
         Initialises the model data
         '''
         #Create a model using the inputted information
-        BaseModel.__init__(self, scene=scene, M=M, mesh=mesh, visible=visible)
+        BaseModel.__init__(self, scene=scene, M=M, mesh=mesh, visible=visible, layout=layout)
         #Name the model if one is provided
         if name is not None:
             self.name = name
@@ -8,6 +8,9 @@ from BaseModel import DrawModelFromMesh
 from shaders import BaseShaderProgram,PhongShader
 from texture import Texture
 from framebuffer import Framebuffer
+#Import the state tracking of the render queue
+from renderQueue import bind_texture
+from frameTimer import count
 
 
 def normalize(v):
@@ -30,6 +33,22 @@ def lookAt(eye, center, up=np.array([0, 1, 0])):
     )
 
 
+def boxProjection(lower, upper):
+    '''
+    Returns the orthographic projection mapping a box in view coordinates to the cube [-1, 1]^3, the near plane being
+    at the upper z of the box as the view looks down -z.
+    :param lower: the lower corner of the box
+    :param upper: its upper corner
+    '''
+    P = np.identity(4)
+    for axis in range(3):
+        P[axis, axis] = 2./(upper[axis] - lower[axis])
+        P[axis, 3] = -(upper[axis] + lower[axis])/(upper[axis] - lower[axis])
+    #Depth increases away from the light, towards the lower z
+    P[2] *= -1.
+    return P
+
+
 class ShowTextureShader(BaseShaderProgram):
     '''
     Base class for rendering the flattened cube.
@@ -41,8 +60,11 @@ class ShowTextureShader(BaseShaderProgram):
 
 
 class ShadowMappingShader(PhongShader):
-    def __init__(self, shadow_map=None):
-        PhongShader.__init__(self, name='shadow_mapping')
+    def __init__(self, shadow_map=None, defines=None):
+        #Cascaded shadow maps are read from a texture array (see CascadedShadowMap)
+        if isinstance(shadow_map, CascadedShadowMap):
+            defines = dict({} if defines is None else defines, CASCADES=shadow_map.cascades)
+        PhongShader.__init__(self, name='shadow_mapping', defines=defines)
         #Create a shader with shadow mapping uniforms
         self.add_uniform('shadow_map')
         self.add_uniform('shadow_map_matrix')
@@ -51,15 +73,15 @@ class ShadowMappingShader(PhongShader):
     def bind(self, model, M):
         PhongShader.bind(self, model, M)
         self.uniforms['shadow_map'].bind(1)
-        glActiveTexture(GL_TEXTURE1)
-        self.shadow_map.bind()
+        bind_texture(1, self.shadow_map)
         glActiveTexture(GL_TEXTURE0)
-        #Setup the shadow map matrix
-        VsT = np.linalg.inv(model.scene.camera.V)
-        self.SM = np.matmul(self.shadow_map.V, VsT)
-        self.SM = np.matmul(self.shadow_map.P, self.SM)
-        self.SM = np.matmul(translationMatrix([1, 1, 1]), self.SM)
-        self.SM = np.matmul(scaleMatrix(0.5), self.SM)
+        #Setup the shadow map matrix, which is the same for all models of a pass
+        scene = model.scene
+        if scene.cache_transforms:
+            key = ('shadow map', id(self.shadow_map), self.shadow_map.version)
+            self.SM = scene.transforms.get(key, lambda transforms: self.shadow_map.lookup_matrix(transforms.V, transforms.V_inverse))
+        else:
+            self.SM = self.shadow_map.lookup_matrix(scene.camera.V)
         self.uniforms['shadow_map_matrix'].bind(self.SM)
 
 
@@ -108,45 +130,251 @@ class ShowTexture(DrawModelFromMesh):
 
 
 class ShadowMap(Texture):
-    def __init__(self, light=None, width=1000, height=1000):
+    '''
+    Depth of the shadow casters of a scene seen from the light (see JungleScene.shadow_casters()). With cache set, the
+    map is only drawn again when what it depends on changes: the light, the projection, or the casters, their
+    visibility or their transforms (as tracked by the BVH of the scene, see BVH.move()). With split set, the depth of
+    the static casters is cached in a second map, and the casters in dynamic are drawn over a copy of it, so that
+    moving casters do not cause the static ones to be drawn again.
+    '''
+    name = 'shadow'
+    target = GL_TEXTURE_2D
+
+    def __init__(self, light=None, width=1000, height=1000, cache=True, split=False):
         #Save the light source
         self.light = light
-        self.name = 'shadow'
+        self.cache = cache
+        self.split = split
+        #Models drawn over the cached static depth when split is set, they should be the casters that move
+        self.dynamic = set()
+        #Number of times the map was drawn, and what it was drawn from
+        self.version = 0
+        self.signatures = {}
         self.format = GL_DEPTH_COMPONENT
         self.type = GL_FLOAT
         self.wrap = GL_CLAMP_TO_EDGE
         self.sample = GL_LINEAR
-        self.target = GL_TEXTURE_2D
         self.width = width
         self.height = height
         #Create the texture
         self.textureid = glGenTextures(1)
         print('* Creating texture {} at ID {}'.format(self.name, self.textureid))
-        #Initialise the texture memory
-        self.bind()
-        glTexImage2D(self.target, 0, self.format, self.width, self.height, 0, self.format, self.type, None)
-        self.unbind()
         #Set parameters for wrapping and sampling
         self.set_wrap_parameter(self.wrap)
         self.set_sampling_parameter(self.sample)
         self.set_shadow_comparison()
-        #Set the framebuffer
-        self.fbo = Framebuffer(attachment=GL_DEPTH_ATTACHMENT, texture=self)
+        #Initialise the texture memory and the framebuffer drawing into it
+        self.allocate()
         self.V = None
+        #Map caching the depth of the static casters
+        self.static = ShadowMap(width=width, height=height, cache=False) if split else None
+
+    def allocate(self):
+        ''' Initialises the texture memory, and the framebuffer drawing the depth into it '''
+        self.bind()
+        glTexImage2D(self.target, 0, self.format, self.width, self.height, 0, self.format, self.type, None)
+        self.unbind()
+        self.fbo = Framebuffer(attachment=GL_DEPTH_ATTACHMENT, texture=self)
+
+    def lookup_matrix(self, V, V_inverse=None):
+        '''
+        Returns the matrix transforming positions in the view space of a pass into texture coordinates and depth in
+        the map.
+        :param V: the view matrix of the pass
+        :param V_inverse: [optional] its inverse, if already known
+        '''
+        VsT = np.linalg.inv(V) if V_inverse is None else V_inverse
+        SM = np.matmul(self.V, VsT)
+        SM = np.matmul(self.P, SM)
+        SM = np.matmul(translationMatrix([1, 1, 1]), SM)
+        return np.matmul(scaleMatrix(0.5), SM)
+
+    def signature(self, scene, models):
+        '''
+        Returns what the depth of some casters depends on: the view of the light, the projection of the pass (see
+        Scene.update_frame_uniforms()), and which models are drawn and how many times they moved.
+        '''
+        scene.bvh.add_models(models)
+        indices = np.array([model.bvh_index for model in models], dtype=np.int64)
+        versions = np.array(scene.bvh.versions, dtype=np.int64)[indices]
+        visible = np.array([model.visible for model in models], dtype=bool)
+        return (self.V.tobytes(), scene.P.tobytes(), indices.tobytes(), versions.tobytes(), visible.tobytes())
+
+    def changed(self, name, signature):
+        ''' Returns whether a part of the map must be drawn again, and remembers its new signature '''
+        if self.cache and self.signatures.get(name) == signature:
+            return False
+        self.signatures[name] = signature
+        return True
 
     def render(self, scene, target=[0, 0, 0]):
         if self.light is not None:
             self.P = frustumMatrix(-1.0, +1.0, -1.0, +1.0, 1.0, 20.0)
             self.V = lookAt(np.array(self.light.position), np.array(target))
+            casters = scene.shadow_casters()
+            if self.split:
+                dynamic = [model for model in casters if model in self.dynamic]
+                static = [model for model in casters if model not in self.dynamic]
+                draw_static = self.changed('static', self.signature(scene, static))
+                draw_dynamic = self.changed('dynamic', self.signature(scene, dynamic))
+                if not (draw_static or draw_dynamic):
+                    count('shadow map skipped')
+                    return
+            elif not self.changed('all', self.signature(scene, casters)):
+                count('shadow map skipped')
+                return
+            count('shadow map renders')
+            self.version += 1
             scene.camera.V = self.V
             #Update the viewport for the image size
             glViewport(0, 0, self.width, self.height)
+            scene.update_frame_uniforms()
             #Draw the shadow map with information within the frame buffer
-            self.fbo.bind()
-            scene.draw_shadow_map()
+            if self.split:
+                if draw_static:
+                    self.static.fbo.bind()
+                    scene.draw_shadow_map(static)
+                #Copy the static depth, then draw the dynamic casters over it
+                glBindFramebuffer(GL_READ_FRAMEBUFFER, self.static.fbo.fbo)
+                glBindFramebuffer(GL_DRAW_FRAMEBUFFER, self.fbo.fbo)
+                glBlitFramebuffer(0, 0, self.width, self.height, 0, 0, self.width, self.height, GL_DEPTH_BUFFER_BIT, GL_NEAREST)
+                self.fbo.bind()
+                scene.draw_shadow_map(dynamic, clear=False)
+            else:
+                self.fbo.bind()
+                scene.draw_shadow_map(casters)
             self.fbo.unbind()
             #Reset the viewport to the windows size
             glViewport(0, 0, scene.window_size[0], scene.window_size[1])
             #Restore the view matrix
             scene.camera.V = None
             scene.camera.update()
+            scene.update_frame_uniforms()
+
+
+class CascadedShadowMap(ShadowMap):
+    '''
+    Shadow map made of cascades: the view of the camera is split in depth ranges, closer ones being smaller, and each
+    is covered by an orthographic projection from the light fitted around it, so that the texels of the map are spent
+    where the camera looks, with more of them close to the camera. The cascades are the layers of a texture array,
+    and ShadowMappingShader reads the smallest cascade containing each fragment.
+    The light is treated as directional, shining from its position towards the target given to render().
+    '''
+    name = 'shadow cascades'
+    target = GL_TEXTURE_2D_ARRAY
+
+    def __init__(self, light=None, cascades=3, resolution=1024, distance=None, blend=0.5, cache=True):
+        '''
+        :param cascades: the number of cascades, at most 4
+        :param resolution: the width and height of each cascade, in texels
+        :param distance: the distance from the camera up to which shadows are drawn, the far plane of the camera by
+        default
+        :param blend: how the depth ranges are split, from 0 for ranges of equal length to 1 for ranges growing
+        geometrically, which keeps the size of the texels on screen constant
+        '''
+        if not 1 <= cascades <= 4:
+            raise ValueError('(E) Error in CascadedShadowMap.__init__(): {} cascades requested, between 1 and 4 are supported'.format(cascades))
+        self.cascades = cascades
+        self.distance = distance
+        self.blend = blend
+        ShadowMap.__init__(self, light=light, width=resolution, height=resolution, cache=cache)
+        self.P = np.tile(np.identity(4), (cascades, 1, 1))
+        self.V = np.tile(np.identity(4), (cascades, 1, 1))
+
+    def allocate(self):
+        ''' Initialises the texture with a layer per cascade, and a framebuffer drawing into each layer '''
+        self.bind()
+        glTexImage3D(self.target, 0, self.format, self.width, self.height, self.cascades, 0, self.format, self.type, None)
+        self.unbind()
+        self.fbos = []
+        for cascade in range(self.cascades):
+            fbo = Framebuffer(attachment=GL_DEPTH_ATTACHMENT)
+            fbo.prepare(self, layer=cascade)
+            self.fbos.append(fbo)
+
+    def splits(self, near, far):
+        '''
+        Returns the depths at which the view of the camera is split, from near to far (Zhang et al., parallel-split
+        shadow maps): a blend of uniform and geometric splits.
+        '''
+        ratios = np.arange(self.cascades + 1)/float(self.cascades)
+        return self.blend*near*(far/near)**ratios + (1. - self.blend)*(near + (far - near)*ratios)
+
+    def fit(self, scene, target):
+        '''
+        Sets the view and projection of each cascade around its part of the view of the camera, extended towards the
+        light to contain all shadow casters.
+        '''
+        P = scene.P
+        #Near and far planes of the perspective projection of the camera
+        near = P[2, 3]/(P[2, 2] - 1.)
+        far = P[2, 3]/(P[2, 2] + 1.)
+        if self.distance is not None:
+            far = min(far, self.distance)
+        depths = self.splits(near, far)
+        inverse = np.linalg.inv(np.matmul(P, scene.camera.V))
+        #Corners of the view at each split depth, in world coordinates
+        ndc = np.array([[x, y] for x in [-1., 1.] for y in [-1., 1.]])
+        corners = []
+        for depth in depths:
+            z = (P[2, 2]*-depth + P[2, 3])/depth
+            points = np.matmul(np.hstack([ndc, np.full((4, 1), z), np.ones((4, 1))]), inverse.T)
+            corners.append(points[:, :3]/points[:, 3:])
+        direction = np.asarray(target, dtype='f8') - np.asarray(self.light.position, dtype='f8')
+        direction /= np.linalg.norm(direction)
+        up = np.array([1., 0., 0.]) if abs(direction[1]) > 0.99 else np.array([0., 1., 0.])
+        #Corners of the box of all casters, which must stay in front of the near plane of each cascade
+        casters = scene.shadow_casters()
+        scene.bvh.add_models(casters)
+        scene.bvh.update()
+        items = [model.bvh_index for model in casters if scene.bvh.bounded[model.bvh_index]]
+        #Corners of the part of the view of the camera covered by each cascade, which must project inside it
+        self.corners = []
+        box = None
+        if len(items) > 0:
+            selection = np.array([[(corner >> axis) & 1 for axis in range(3)] for corner in range(8)], dtype=bool)
+            box = np.where(selection, scene.bvh.upper[items].max(axis=0), scene.bvh.lower[items].min(axis=0))
+        for cascade in range(self.cascades):
+            points = np.vstack([corners[cascade], corners[cascade + 1]])
+            self.corners.append(points)
+            center = points.mean(axis=0)
+            V = lookAt(center - direction, center, up)
+            points = np.matmul(np.hstack([points, np.ones((8, 1))]), V.T)[:, :3]
+            (lower, upper) = (points.min(axis=0), points.max(axis=0))
+            if box is not None:
+                upper[2] = max(upper[2], np.matmul(np.hstack([box, np.ones((8, 1))]), V.T)[:, 2].max())
+            self.P[cascade] = boxProjection(lower, upper)
+            self.V[cascade] = V
+
+    def lookup_matrix(self, V, V_inverse=None):
+        ''' Returns the (cascades, 4, 4) stack of the matrices of each cascade (see ShadowMap.lookup_matrix()) '''
+        bias = np.matmul(scaleMatrix(0.5), translationMatrix([1, 1, 1]))
+        VsT = np.linalg.inv(V) if V_inverse is None else V_inverse
+        return np.matmul(bias, np.matmul(self.P, np.matmul(self.V, VsT)))
+
+    def render(self, scene, target=[0, 0, 0]):
+        if self.light is None:
+            return
+        casters = scene.shadow_casters()
+        #The cascades follow the camera, so they are part of what the map depends on
+        self.fit(scene, target)
+        if not self.changed('all', (self.P.tobytes(),) + self.signature(scene, casters)):
+            count('shadow map skipped')
+            return
+        count('shadow map renders')
+        self.version += 1
+        Pscene = scene.P
+        glViewport(0, 0, self.width, self.height)
+        for cascade in range(self.cascades):
+            scene.P = self.P[cascade]
+            scene.camera.V = self.V[cascade]
+            scene.update_frame_uniforms()
+            self.fbos[cascade].bind()
+            scene.draw_shadow_map(casters)
+            self.fbos[cascade].unbind()
+        #Reset the viewport, the projection and the view
+        glViewport(0, 0, scene.window_size[0], scene.window_size[1])
+        scene.P = Pscene
+        scene.camera.V = None
+        scene.camera.update()
+        scene.update_frame_uniforms()
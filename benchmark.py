@@ -0,0 +1,997 @@
+#Import time and os for timing and listing the files to benchmark
+import inspect
+import json
+import os
+import sys
+import time
+#Pygame is used to create the OpenGL context needed by the textures of the meshes
+import pygame
+#Import numpy to compare the results
+import numpy as np
+#Imports all openGL functions
+from OpenGL.GL import *
+#Import the model loading functions
+import blender
+from mesh import Mesh
+#Import the headless contexts
+import offscreen
+
+
+def create_context(width=64, height=64):
+    '''
+    Creates a hidden window so that the OpenGL functions used when loading meshes (textures) can be called,
+    or a headless context if PyOpenGL was set to use EGL or OSMesa (see offscreen.py).
+    '''
+    backend = os.environ.get('PYOPENGL_PLATFORM')
+    if backend in offscreen.platforms:
+        return offscreen.create_context(backend, width, height)
+    pygame.init()
+    pygame.display.set_mode((width, height), pygame.OPENGL | pygame.DOUBLEBUF | pygame.HIDDEN, 24)
+
+
+def timed(function, *args, repeat=3):
+    '''
+    Calls a function several times and returns the best time in seconds along with the last result.
+    '''
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        result = function(*args)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+
+def quiet(function):
+    '''
+    Wraps a function so that it does not print anything, the loaders being very verbose.
+    '''
+    def wrapper(*args, **kwargs):
+        stdout = sys.stdout
+        with open(os.devnull, 'w') as devnull:
+            sys.stdout = devnull
+            try:
+                return function(*args, **kwargs)
+            finally:
+                sys.stdout = stdout
+    return wrapper
+
+
+def same_meshes(meshes_a, meshes_b):
+    '''
+    Checks whether two lists of meshes hold the same arrays and materials.
+    '''
+    if len(meshes_a) != len(meshes_b):
+        return False
+    for (a, b) in zip(meshes_a, meshes_b):
+        if a.material is not b.material and a.material.name != b.material.name:
+            return False
+        for name in ['vertices', 'faces', 'normals', 'textureCoords', 'tangents', 'binormals']:
+            x = getattr(a, name)
+            y = getattr(b, name)
+            if (x is None) != (y is None):
+                return False
+            if x is not None and (x.dtype != y.dtype or not np.array_equal(x, y, equal_nan=True)):
+                return False
+    return True
+
+
+def benchmark_obj_loading(folder='models', repeat=3):
+    '''
+    Compares the bulk OBJ parser (load_obj_file) against the line by line one (load_obj_file_by_line)
+    on every .obj file in a folder, and checks that both produce the same meshes.
+    '''
+    print('{:<20} {:>12} {:>12} {:>12} {:>8} {:>6}'.format('file', 'by line (s)', 'bulk (s)', 'read (s)', 'speedup', 'same'))
+    for file_name in sorted(os.listdir(folder)):
+        if not file_name.endswith('.obj'):
+            continue
+        path = os.path.join(folder, file_name)
+        try:
+            t_line, meshes_line = timed(quiet(blender.load_obj_file_by_line), path, repeat=repeat)
+            t_bulk, meshes_bulk = timed(quiet(lambda path: blender.load_obj_file(path, cache=False, optimize=False)), path, repeat=repeat)
+        except Exception as e:
+            print('(W) Warning, could not load {}: {}'.format(file_name, e))
+            continue
+        t_read, _ = timed(quiet(blender.read_obj_file), path, repeat=repeat)
+        print('{:<20} {:>12.4f} {:>12.4f} {:>12.4f} {:>7.2f}x {:>6}'.format(
+            file_name, t_line, t_bulk, t_read, t_line / t_bulk, str(same_meshes(meshes_line, meshes_bulk))))
+
+
+def benchmark_mesh_cache(files=['models/palmtree.obj', 'models/tree.obj', 'models/Suzanne.obj'], repeat=3):
+    '''
+    Compares the time needed to load meshes without a valid cache entry (cold: parsing, normals and writing
+    the entry) and with one (warm).
+    '''
+    print('{:<24} {:>10} {:>10} {:>8} {:>6}'.format('file', 'cold (s)', 'warm (s)', 'speedup', 'same'))
+    total_cold = 0.
+    total_warm = 0.
+    for path in files:
+        def cold(path):
+            blender.mesh_cache.clear(path)
+            return blender.load_obj_file(path)
+        t_cold, meshes_cold = timed(quiet(cold), path, repeat=repeat)
+        t_warm, meshes_warm = timed(quiet(blender.load_obj_file), path, repeat=repeat)
+        total_cold += t_cold
+        total_warm += t_warm
+        print('{:<24} {:>10.4f} {:>10.4f} {:>7.2f}x {:>6}'.format(
+            path, t_cold, t_warm, t_cold / t_warm, str(same_meshes(meshes_cold, meshes_warm))))
+    print('{:<24} {:>10.4f} {:>10.4f} {:>7.2f}x'.format('total', total_cold, total_warm, total_cold / total_warm))
+
+
+def calculate_normals_by_face(mesh):
+    '''
+    Reference implementation of Mesh.calculate_normals (normals only), looping over faces in Python.
+    '''
+    normals = np.zeros((mesh.vertices.shape[0], 3), dtype='f')
+    for f in range(mesh.faces.shape[0]):
+        a = mesh.vertices[mesh.faces[f, 1]] - mesh.vertices[mesh.faces[f, 0]]
+        b = mesh.vertices[mesh.faces[f, 2]] - mesh.vertices[mesh.faces[f, 0]]
+        face_normal = np.cross(a, b)
+        for j in range(3):
+            normals[mesh.faces[f, j], :] += face_normal
+    norms = np.linalg.norm(normals, axis=1, keepdims=True)
+    return normals / np.where(norms > 0, norms, 1)
+
+
+def check_tangent_basis():
+    '''
+    Checks the tangent basis of Mesh.calculate_normals on a square in the XY plane: the tangent must follow u,
+    the binormal v, including when the texture is mirrored.
+    '''
+    vertices = np.array([[0, 0, 0], [1, 0, 0], [1, 1, 0], [0, 1, 0]], dtype='f')
+    faces = np.array([[0, 1, 2], [0, 2, 3]], dtype=np.uint32)
+    for (uv, tangent, binormal) in [
+        (vertices[:, :2], [1, 0, 0], [0, 1, 0]),
+        (vertices[:, :2]*[-1, 1], [-1, 0, 0], [0, 1, 0]),
+        (vertices[:, 1::-1], [0, 1, 0], [1, 0, 0]),
+    ]:
+        mesh = quiet(Mesh)(vertices, faces, None, np.array(uv, dtype='f'))
+        assert np.allclose(mesh.normals, [0, 0, 1]), mesh.normals
+        assert np.allclose(mesh.tangents, tangent), mesh.tangents
+        assert np.allclose(mesh.binormals, binormal), mesh.binormals
+    print('Tangent basis: OK')
+
+
+def benchmark_normals(folder='models', repeat=3):
+    '''
+    Compares the vectorised Mesh.calculate_normals against the loop over faces on every .obj file in a folder,
+    and reports the largest difference between the normals they compute.
+    '''
+    check_tangent_basis()
+    print('{:<20} {:>12} {:>12} {:>12} {:>8} {:>12}'.format('file', 'faces', 'loop (s)', 'numpy (s)', 'speedup', 'max error'))
+    for file_name in sorted(os.listdir(folder)):
+        if not file_name.endswith('.obj'):
+            continue
+        try:
+            meshes = quiet(blender.load_obj_file)(os.path.join(folder, file_name))
+        except Exception as e:
+            print('(W) Warning, could not load {}: {}'.format(file_name, e))
+            continue
+        t_loop = 0.
+        t_numpy = 0.
+        error = 0.
+        for mesh in meshes:
+            t, normals = timed(calculate_normals_by_face, mesh, repeat=1)
+            t_loop += t
+            t, _ = timed(mesh.calculate_normals, repeat=repeat)
+            t_numpy += t
+            error = max(error, np.max(np.abs(normals - mesh.normals)))
+        print('{:<20} {:>12} {:>12.4f} {:>12.4f} {:>7.1f}x {:>12.2e}'.format(
+            file_name, sum([mesh.faces.shape[0] for mesh in meshes]), t_loop, t_numpy, t_loop / t_numpy, error))
+
+
+def fix_blender_textures_by_corner(textures, faces, vertices):
+    '''
+    Reference implementation of the previous texture indexing of create_mesh: a loop over all face corners, where
+    a vertex used with several texture coordinates keeps the last one.
+    '''
+    new_textures = np.zeros((vertices.shape[0], 2), dtype='f')
+    for f in range(faces.shape[0]):
+        for j in range(faces.shape[1]):
+            new_textures[faces[f, j, 0] - 1, :] = textures[faces[f, j, 1] - 1, :]
+    return new_textures
+
+
+def benchmark_unified_indices(files=['models/tree.obj', 'models/bunny_world.obj'], repeat=3):
+    '''
+    Compares blender.unify_blender_indices against the loop over face corners used before, and counts the
+    corners that ended up with wrong texture coordinates (UV seams) with the previous method.
+    '''
+    print('{:<24} {:>10} {:>10} {:>8} {:>10} {:>10} {:>10}'.format('file', 'loop (s)', 'numpy (s)', 'speedup', 'vertices', 'unified', 'wrong uv'))
+    for path in files:
+        varray, tarray, groups, library = quiet(blender.read_obj_file)(path)
+        t_loop = 0.
+        t_numpy = 0.
+        vertices = 0
+        unified = 0
+        wrong = 0
+        for (_, _, faces) in groups:
+            t, textures = timed(fix_blender_textures_by_corner, tarray, faces, varray, repeat=1)
+            t_loop += t
+            t, (corners, _) = timed(blender.unify_blender_indices, faces, repeat=repeat)
+            t_numpy += t
+            vertices += np.max(faces[:, :, 0]) - np.min(faces[:, :, 0]) + 1
+            unified += corners.shape[0]
+            wrong += np.count_nonzero(np.any(textures[faces[:, :, 0] - 1] != tarray[faces[:, :, 1] - 1], axis=2))
+        print('{:<24} {:>10.4f} {:>10.4f} {:>7.1f}x {:>10} {:>10} {:>10}'.format(
+            path, t_loop, t_numpy, t_loop / t_numpy, vertices, unified, wrong))
+
+
+def default_backend():
+    ''' Returns the backend used for scenes: headless if PyOpenGL was set to use EGL or OSMesa, a window otherwise '''
+    backend = os.environ.get('PYOPENGL_PLATFORM')
+    return backend if backend in offscreen.platforms else 'pygame'
+
+
+def benchmark_frames(frames=100, warmup=10, width=800, height=600, gpu=True):
+    '''
+    Draws the jungle scene for a fixed number of frames and reports the time spent in each pass.
+    :param frames: the number of frames measured
+    :param warmup: the number of frames drawn before measuring (shader compilation, driver caches...)
+    :param gpu: whether to use GL timer queries as well as the CPU clock
+    :return: the FrameTimer report, in milliseconds
+    '''
+    #Imported here as the jungle scene pulls in everything else
+    from jungle import JungleScene
+    from frameTimer import FrameTimer
+    scene = quiet(JungleScene)(width, height, default_backend())
+    quiet(scene.run)(warmup)
+    scene.timer = FrameTimer(gpu=gpu)
+    quiet(scene.run)(frames)
+    report = scene.timer.report()
+    scene.timer.print_report(report)
+    return {
+        'renderer': glGetString(GL_RENDERER).decode(),
+        'width': width,
+        'height': height,
+        'passes': report,
+    }
+
+
+def measure_frames(scene, frames, warmup):
+    '''
+    Draws a scene for a number of frames after a warm up, and returns the CPU frame time statistics and the
+    counters per frame (see FrameTimer.report()).
+    '''
+    from frameTimer import FrameTimer
+    quiet(scene.run)(warmup)
+    scene.timer = FrameTimer(gpu=False)
+    quiet(scene.run)(frames)
+    report = scene.timer.report()
+    scene.timer = None
+    return {'frame': report['frame']['cpu'], 'counters': report['counters']}
+
+
+def print_comparison(results):
+    '''
+    Prints the counters per frame and the mean frame time of several cases side by side.
+    :param results: a dictionary {case: result of measure_frames()}
+    '''
+    cases = list(results)
+    names = sorted(set([name for case in cases for name in results[case]['counters']]))
+    print(('{:<30}' + ' {:>12}'*len(cases)).format('per frame', *cases))
+    for name in names:
+        print(('{:<30}' + ' {:>12.1f}'*len(cases)).format(name, *[results[case]['counters'].get(name, 0) for case in cases]))
+    print(('{:<30}' + ' {:>12.3f}'*len(cases)).format('frame cpu (ms)', *[results[case]['frame']['mean'] for case in cases]))
+
+
+def benchmark_draw_queue(frames=20, warmup=5, width=800, height=600):
+    '''
+    Draws the jungle scene with its models in order, then sorted by state through the render queue, and compares
+    the number of program switches, texture binds, uniform uploads and draw calls per frame, and the frame time.
+    :return: the counters and the CPU frame time statistics for each case
+    '''
+    from jungle import JungleScene
+    scene = quiet(JungleScene)(width, height, default_backend(), packed=False)
+    results = {}
+    for sort_draws in [False, True]:
+        scene.sort_draws = sort_draws
+        results['sorted' if sort_draws else 'in order'] = measure_frames(scene, frames, warmup)
+    print_comparison(results)
+    return results
+
+
+def benchmark_packed_models(frames=20, warmup=5, width=800, height=600, runs=5):
+    '''
+    Draws the jungle scene with one model per sub-mesh, then with each object packed in a single PackedModel,
+    and compares the draw calls and state changes per frame and the frame time. The two cases are measured in
+    turn several times, and the median of the mean frame times of the runs is reported, as a single run is too
+    noisy to compare them.
+    :param runs: the number of measurements of each case
+    :return: the counters and the CPU frame time statistics for each case, with the mean frame time of each run
+    '''
+    from jungle import JungleScene
+    cases = {'per mesh': False, 'packed': True}
+    #Each scene is created again for every run, as a scene owns the context it draws to
+    runs = [{case: measure_frames(quiet(JungleScene)(width, height, default_backend(), packed=packed), frames, warmup) for (case, packed) in cases.items()} for run in range(runs)]
+    results = {}
+    for case in cases:
+        means = [run[case]['frame']['mean'] for run in runs]
+        results[case] = {'frame': dict(runs[-1][case]['frame'], mean=float(np.median(means)), runs=means), 'counters': runs[-1][case]['counters']}
+        print('{:<30} {}'.format(case + ' runs (ms)', ' '.join(['{:.3f}'.format(mean) for mean in means])))
+    print_comparison(results)
+    return results
+
+
+def check_vertex_packing():
+    '''
+    Checks that vectors packed by vertexLayout.pack_2_10_10_10 decode to the original values within the precision
+    of the format, including the sign of w.
+    '''
+    from vertexLayout import pack_2_10_10_10
+    data = np.random.default_rng(0).uniform(-1, 1, (1000, 4))
+    data[:, 3] = np.sign(data[:, 3])
+    packed = pack_2_10_10_10(data)
+    #Sign extend each field, then normalise it as OpenGL does
+    fields = np.stack([(packed >> shift) & mask for (shift, mask) in [(0, 0x3FF), (10, 0x3FF), (20, 0x3FF), (30, 0x3)]], axis=1).astype(np.int64)
+    limits = np.array([512, 512, 512, 2])
+    fields = np.where(fields >= limits, fields - 2*limits, fields)
+    decoded = np.maximum(fields / (limits - 1.), -1.)
+    assert np.max(np.abs(decoded[:, :3] - data[:, :3])) <= 0.5/511 + 1e-9, np.max(np.abs(decoded[:, :3] - data[:, :3]))
+    assert np.array_equal(decoded[:, 3], data[:, 3])
+    print('Vertex packing: OK')
+
+
+def benchmark_vertex_layout(frames=20, warmup=5, width=800, height=600):
+    '''
+    Creates the jungle scene with float32 vertex attributes then with the compact layout, and compares the size of
+    the vertex and index buffers of each loaded object, the frame time and, offscreen, the rendered frames.
+    :return: the buffer sizes per model and the frame time statistics for each layout
+    '''
+    from jungle import JungleScene
+    from vertexLayout import float_layout, compact_layout
+    check_vertex_packing()
+    results = {}
+    frames_drawn = {}
+    sizes = {}
+    for layout in [float_layout, compact_layout]:
+        scene = quiet(JungleScene)(width, height, default_backend(), layout=layout)
+        models = scene.models + scene.island + scene.tree
+        sizes[layout.name] = [(model.name, model.buffer_bytes['vertices'], model.buffer_bytes['indices']) for model in models]
+        results[layout.name] = measure_frames(scene, frames, warmup)
+        results[layout.name]['buffers'] = {name: {'vertices': vertices, 'indices': indices} for (name, vertices, indices) in sizes[layout.name]}
+        if scene.target is not None:
+            frames_drawn[layout.name] = scene.read_frame().astype(int)
+    print('{:<12} {:>14} {:>14} {:>14} {:>14} {:>8}'.format('model', 'float vbo', 'float ibo', 'compact vbo', 'compact ibo', 'ratio'))
+    for ((name, vertices, indices), (_, compact_vertices, compact_indices)) in zip(sizes['float'], sizes['compact']):
+        print('{:<12} {:>14} {:>14} {:>14} {:>14} {:>7.2f}x'.format(name, vertices, indices, compact_vertices, compact_indices,
+                                                                 (vertices + indices) / float(compact_vertices + compact_indices)))
+    total = [sum([size[i] for size in sizes[layout]]) for layout in ['float', 'compact'] for i in [1, 2]]
+    print('{:<12} {:>14} {:>14} {:>14} {:>14} {:>7.2f}x'.format('total', *total, (total[0] + total[1]) / float(total[2] + total[3])))
+    print('{:<12} {:>14.3f} {:>44.3f}'.format('frame (ms)', results['float']['frame']['mean'], results['compact']['frame']['mean']))
+    if len(frames_drawn) == 2:
+        difference = np.abs(frames_drawn['float'] - frames_drawn['compact']).max(axis=2)
+        print('Rendered frames: max difference {}, {} pixels differ'.format(difference.max(), np.count_nonzero(difference)))
+    return results
+
+
+def benchmark_startup(width=320, height=240):
+    '''
+    Measures the time needed to create the jungle scene (loading the meshes and compiling the shaders) when every
+    model compiles its own shader program, with the shader registry only, and with the program binaries of a
+    previous run. Each scene gets its own OpenGL context, the meshes come from the mesh cache in all cases.
+    :return: the time until the scene is created and until its first frame is drawn, and the number of programs
+    compiled, loaded and shared for each case
+    '''
+    from jungle import JungleScene
+    import shaders
+    cache = shaders.shader_cache
+    quiet(JungleScene)(width, height, default_backend())
+    results = {}
+    print('{:<20} {:>10} {:>12} {:>10} {:>10} {:>10}'.format('shaders', 'scene (s)', 'frame 1 (s)', 'compiled', 'loaded', 'shared'))
+    for (name, enabled, binaries) in [('no registry', False, False), ('registry', True, False), ('registry, cold', True, True), ('registry, warm', True, True)]:
+        cache.enabled = enabled
+        cache.binaries = binaries
+        cache.clear(binaries=(name == 'registry, cold'))
+        start = time.perf_counter()
+        scene = quiet(JungleScene)(width, height, default_backend())
+        created = time.perf_counter() - start
+        #Some drivers only finish compiling the programs when they are first used
+        quiet(scene.run)(1)
+        elapsed = time.perf_counter() - start
+        results[name] = {'scene': created, 'first frame': elapsed, 'compiled': cache.compiled, 'loaded': cache.loaded, 'shared': cache.reused}
+        print('{:<20} {:>10.3f} {:>12.3f} {:>10} {:>10} {:>10}'.format(name, created, elapsed, cache.compiled, cache.loaded, cache.reused))
+    cache.enabled = True
+    cache.binaries = True
+    return results
+
+
+def benchmark_instancing(trees=1000, frames=10, warmup=2, width=800, height=600):
+    '''
+    Scatters palm trees on the island of the jungle scene, drawn with one model per tree and sub-mesh, then with one
+    InstancedModel per sub-mesh, for an increasing number of trees, and compares the draw calls and frame time.
+    :param trees: the largest number of trees, also drawn with a tenth and a hundredth of it
+    :return: the counters and the CPU frame time statistics for each case
+    '''
+    from jungle import JungleScene
+    scene = quiet(JungleScene)(width, height, default_backend())
+    island = scene.island
+    results = {}
+    for number in [max(trees//100, 1), max(trees//10, 1), trees]:
+        for instanced in [False, True]:
+            scene.island = island + quiet(scene.create_forest)(number, instanced=instanced)
+            results['{} {}'.format(number, 'instanced' if instanced else 'models')] = measure_frames(scene, frames, warmup)
+    scene.island = island
+    print_comparison(results)
+    return results
+
+
+def benchmark_culling(trees=200, frames=10, warmup=2, width=800, height=600):
+    '''
+    Draws the jungle scene, with palm trees scattered on the island as separate models, without then with frustum
+    culling, and compares the models drawn and culled in each pass, the draw calls and the frame time.
+    :return: the counters and the CPU frame time statistics for each case
+    '''
+    from jungle import JungleScene
+    scene = quiet(JungleScene)(width, height, default_backend())
+    scene.island = scene.island + quiet(scene.create_forest)(trees, instanced=False)
+    results = {}
+    for cull in [False, True]:
+        scene.cull = cull
+        results['culled' if cull else 'all drawn'] = measure_frames(scene, frames, warmup)
+    print_comparison(results)
+    #Trees removed from the scene must leave the BVH
+    forest = scene.island[1:]
+    scene.island = scene.island[:1]
+    for model in forest:
+        scene.remove_model(model)
+    quiet(scene.run)(1)
+    assert len(scene.bvh.models) == len(scene.models + scene.island + scene.tree), len(scene.bvh.models)
+    print('Models removed from the BVH: OK')
+    return results
+
+
+def random_box_models(number, seed=0):
+    '''
+    Returns models with random bounding boxes scattered in a cube of 100 units, without any vertex data.
+    '''
+    from BaseModel import BaseModel
+    from matutils import translationMatrix
+    generator = np.random.default_rng(seed)
+    models = []
+    for (position, size) in zip(generator.uniform(-50., 50., (number, 3)), generator.uniform(0.1, 2., (number, 3))):
+        model = quiet(BaseModel)(scene=None, M=translationMatrix(position))
+        model.bounds = (np.zeros(3), size)
+        models.append(model)
+    return models
+
+
+def check_bvh(number=500, queries=20):
+    '''
+    Checks the frustum, ray and nearest neighbour queries of the BVH against testing every model, including after
+    moving some of them.
+    '''
+    from bvh import BVH
+    from frustum import Frustum
+    from matutils import frustumMatrix, translationMatrix, rotationMatrixY, rotationMatrixX
+    generator = np.random.default_rng(1)
+    models = random_box_models(number)
+    bvh = BVH()
+    bvh.add_models(models)
+    for query in range(queries):
+        if query == queries//2:
+            for model in models[::7]:
+                model.M = translationMatrix(generator.uniform(-50., 50., 3))
+        V = np.matmul(np.matmul(rotationMatrixX(generator.uniform(-1, 1)), rotationMatrixY(generator.uniform(0, 6.3))), translationMatrix(generator.uniform(-20., 20., 3)))
+        frustum = Frustum(np.matmul(frustumMatrix(-1., 1., -1., 1., 1., 60.), V))
+        expected = np.array([frustum.visible(model) for model in models])
+        assert np.array_equal(bvh.intersect_frustum(frustum)[:number], expected), query
+        (origin, direction) = (generator.uniform(-60., 60., 3), generator.normal(size=3))
+        hits = bvh.intersect_ray(origin, direction)
+        boxes = [model.world_bounds() for model in models]
+        expected = [model for (model, (center, extent)) in zip(models, boxes) if ray_hits_box(origin, direction, center - extent, center + extent)]
+        assert set(map(id, [model for (_, model) in hits])) == set(map(id, expected)), query
+        assert all([hits[i][0] <= hits[i + 1][0] for i in range(len(hits) - 1)])
+        point = generator.uniform(-50., 50., 3)
+        distances = sorted([np.linalg.norm(np.maximum(np.maximum(center - extent - point, point - center - extent), 0.)) for (center, extent) in boxes])
+        assert np.allclose([distance for (distance, _) in bvh.nearest(point, 5)], distances[:5]), query
+    #Removed models are renumbered out of the queries
+    for model in models[::5]:
+        bvh.remove(model)
+    models = [model for (i, model) in enumerate(models) if i % 5 != 0]
+    assert [model.bvh_index for model in models] == list(range(len(models)))
+    expected = np.array([frustum.visible(model) for model in models])
+    assert np.array_equal(bvh.intersect_frustum(frustum), expected)
+    print('BVH queries: OK')
+
+
+def ray_hits_box(origin, direction, lower, upper, steps=20000):
+    ''' Tests whether a ray hits a box by sampling points along it, as a reference for check_bvh() '''
+    t = np.linspace(0., 300., steps)[:, None]
+    points = origin + t*direction/np.linalg.norm(direction)
+    return bool(np.any(np.all((points >= lower) & (points <= upper), axis=1)))
+
+
+def benchmark_bvh(number=5000, repeat=20):
+    '''
+    Compares culling a large number of models against a frustum one model at a time and with the BVH, and times the
+    ray and nearest neighbour queries.
+    :return: the best times in milliseconds
+    '''
+    from bvh import BVH
+    from frustum import Frustum
+    from matutils import frustumMatrix, translationMatrix
+    check_bvh()
+    models = random_box_models(number)
+    bvh = BVH()
+    bvh.add_models(models)
+    start = time.perf_counter()
+    bvh.update()
+    build = time.perf_counter() - start
+    frustum = Frustum(np.matmul(frustumMatrix(-1., 1., -1., 1., 1., 40.), translationMatrix([0., 0., -10.])))
+    results = {
+        'build': build*1000.,
+        'linear frustum': timed(lambda: [frustum.visible(model) for model in models], repeat=3)[0]*1000.,
+        'bvh frustum': timed(bvh.intersect_frustum, frustum, repeat=repeat)[0]*1000.,
+        'bvh ray': timed(bvh.intersect_ray, [0., 0., 60.], [0.1, 0., -1.], repeat=repeat)[0]*1000.,
+        'bvh nearest 10': timed(bvh.nearest, [0., 0., 0.], 10, repeat=repeat)[0]*1000.,
+    }
+    for (name, value) in results.items():
+        print('{:<20} {:>10.3f} ms'.format(name, value))
+    return results
+
+
+def benchmark_lods(frames=10, warmup=2, width=800, height=600, errors=(1., 16.)):
+    '''
+    Draws the jungle scene with the tree always in full then with its levels of detail, under several bounds of their
+    error on screen, with the camera at several distances, and compares the triangles drawn per frame, the frame time
+    and, offscreen, the rendered frames. Also times the generation of the levels of detail of the tree.
+    :param errors: the largest errors of the levels of detail drawn in pixels (see BaseModel.lod_error)
+    :return: the counters and the CPU frame time statistics for each case
+    '''
+    from jungle import JungleScene
+    from simplify import generate_lods
+    meshes = quiet(blender.load_obj_file)('models/tree.obj', cache=False)
+    (elapsed, _) = timed(lambda: [generate_lods(mesh) for mesh in meshes], repeat=1)
+    print('Levels of detail of tree.obj: {} faces, {} per level, generated in {:.3f}s'.format(
+        sum([mesh.faces.shape[0] for mesh in meshes]), [sum([lod.shape[0] for lod in levels]) for levels in zip(*[mesh.lods for mesh in meshes])], elapsed))
+    results = {}
+    for distance in [5., 10., 20.]:
+        full = None
+        for error in (None,) + tuple(errors):
+            scene = quiet(JungleScene)(width, height, default_backend(), lods=() if error is None else (0.5, 0.25, 0.125))
+            scene.camera.distance = distance
+            name = '{:g} {}'.format(distance, 'full' if error is None else '{:g}px'.format(error))
+            for model in scene.tree:
+                model.lod_error = 1. if error is None else error
+            results[name] = measure_frames(scene, frames, warmup)
+            if scene.target is None:
+                continue
+            frame = scene.read_frame().astype(np.int32)
+            if error is None:
+                full = frame
+            else:
+                difference = np.max(np.abs(frame - full), axis=2)
+                print('Camera at {:g}, error under {:g} pixels: level {}, {} pixels differ, by at most {}'.format(
+                    distance, error, [model.pass_levels.get('models', 0) for model in scene.tree], int(np.sum(difference > 0)), int(np.max(difference))))
+    print_comparison(results)
+    return results
+
+
+def benchmark_vertex_cache(folder='models'):
+    '''
+    Reorders the meshes of every .obj file in a folder for the vertex cache (see meshOptimizer.py), checks that they
+    still hold the same triangles, and reports the average cache miss ratio (ACMR) and the average transform to vertex
+    ratio (ATVR) of each mesh before and after, for a FIFO cache of meshOptimizer.cache_size vertices.
+    :return: the statistics of each mesh
+    '''
+    from meshOptimizer import optimize_mesh, acmr, atvr
+    print('{:<24} {:>8} {:>13} {:>13} {:>9}'.format('mesh', 'faces', 'ACMR', 'ATVR', 'time (s)'))
+    results = {}
+    for file_name in sorted(os.listdir(folder)):
+        if not file_name.endswith('.obj'):
+            continue
+        try:
+            meshes = quiet(blender.load_obj_file)(os.path.join(folder, file_name), cache=False, optimize=False)
+        except Exception as e:
+            print('(W) Warning, could not load {}: {}'.format(file_name, e))
+            continue
+        total = np.zeros(4)
+        for (i, mesh) in enumerate(meshes):
+            if mesh.faces is None or mesh.faces.shape[1] != 3:
+                continue
+            triangles = np.sort(np.sort(mesh.vertices[mesh.faces].reshape(-1, 9), axis=1), axis=0)
+            before = (acmr(mesh.faces), atvr(mesh.faces))
+            (elapsed, _) = timed(optimize_mesh, mesh, repeat=1)
+            after = (acmr(mesh.faces), atvr(mesh.faces))
+            assert np.array_equal(triangles, np.sort(np.sort(mesh.vertices[mesh.faces].reshape(-1, 9), axis=1), axis=0)), file_name
+            name = '{}[{}]'.format(file_name, i)
+            results[name] = {'faces': int(mesh.faces.shape[0]), 'acmr': before + after[:1], 'atvr': before[1:] + after[1:], 'time': elapsed}
+            print('{:<24} {:>8} {:>6.3f}>{:<6.3f} {:>6.3f}>{:<6.3f} {:>9.4f}'.format(name, mesh.faces.shape[0], before[0], after[0], before[1], after[1], elapsed))
+            #Vertices transformed before and after, faces and vertices used
+            total += [before[0]*mesh.faces.shape[0], after[0]*mesh.faces.shape[0], mesh.faces.shape[0], len(np.unique(mesh.faces))]
+        if len(meshes) > 1 and total[2] > 0:
+            print('{:<24} {:>8} {:>6.3f}>{:<6.3f} {:>6.3f}>{:<6.3f}'.format(file_name + ' total', int(total[2]), total[0]/total[2], total[1]/total[2], total[0]/total[3], total[1]/total[3]))
+    return results
+
+
+def benchmark_environment_updates(frames=20, warmup=2, width=800, height=600):
+    '''
+    Draws the jungle scene with each update policy of the environment map, first with a still scene, then with the
+    tree moving every frame, and compares the faces of the map drawn and the frame time.
+    :return: the counters and the CPU frame time statistics for each case
+    '''
+    from jungle import JungleScene
+    from environmentMapping import UpdatePolicy, StaticUpdate, RoundRobinUpdate, DirtyUpdate, DistanceRateLimit
+    from matutils import translationMatrix
+    policies = {
+        'every frame': UpdatePolicy,
+        'static': StaticUpdate,
+        'round robin': lambda: RoundRobinUpdate(faces_per_frame=2),
+        'dirty': DirtyUpdate,
+        'distance': lambda: DistanceRateLimit(DirtyUpdate(), distance=2.),
+    }
+    scene = quiet(JungleScene)(width, height, default_backend())
+    draw = scene.draw
+    def draw_moving(framebuffer=False):
+        ''' Moves the tree back and forth before drawing '''
+        scene.tree[0].M = np.matmul(translationMatrix([0., 0., 0.02*np.sin(scene.frame/5.)]), M)
+        draw(framebuffer)
+    M = scene.tree[0].M
+    results = {}
+    for moving in [False, True]:
+        case = 'tree moving' if moving else 'still scene'
+        results[case] = {}
+        scene.draw = draw_moving if moving else draw
+        for (name, policy) in policies.items():
+            scene.environment.policy = policy()
+            scene.environment.done = False
+            results[case][name] = measure_frames(scene, frames, warmup)
+        print(case)
+        print_comparison(results[case])
+    scene.draw = draw
+    scene.tree[0].M = M
+    check_shadow_updates(scene)
+    return results
+
+
+def check_shadow_updates(scene):
+    '''
+    Checks that DirtyUpdate draws again the faces of the environment map seeing the shadows of a caster that moves
+    outside of them: the faces showing the island but not the tree, when the tree moves.
+    '''
+    from environmentMapping import DirtyUpdate
+    from matutils import translationMatrix
+    policy = DirtyUpdate()
+    scene.environment.policy = policy
+    scene.environment.done = False
+    quiet(scene.run)(1)
+    M = scene.tree[0].M
+    def faces_without_tree():
+        faces = []
+        for face in scene.environment.fbos.keys():
+            inside = scene.bvh.intersect_frustum(scene.environment.frustum(face))
+            if any([inside[model.bvh_index] for model in scene.island]) and not any([inside[model.bvh_index] for model in scene.tree]):
+                faces.append(face)
+        return faces
+    faces = faces_without_tree()
+    scene.tree[0].M = np.matmul(translationMatrix([0., 0., 0.2]), M)
+    faces = [face for face in faces if face in faces_without_tree()]
+    quiet(scene.shadows.render)(scene)
+    selected = policy.select(scene.environment, scene)
+    scene.tree[0].M = M
+    assert len(faces) > 0, 'no face of the environment map shows the island without the tree'
+    assert all([face in selected for face in faces]), 'faces {} not drawn again, {} selected'.format(faces, selected)
+    print('Environment map faces with moving shadows: OK ({} faces)'.format(len(faces)))
+
+
+def benchmark_layered_environment(trees=200, frames=10, warmup=2, width=800, height=600):
+    '''
+    Draws the jungle scene with palm trees scattered on the island, updating all faces of the environment map every
+    frame, one pass per face then in a single layered pass, and compares the draw calls and the frame time.
+    :return: the counters and the CPU frame time statistics for each case
+    '''
+    from jungle import JungleScene
+    from environmentMapping import UpdatePolicy, layered_supported
+    scene = quiet(JungleScene)(width, height, default_backend(), forest=trees, environment_policy=UpdatePolicy())
+    if not layered_supported():
+        print('(W) Warning: the context has no geometry shaders, the environment map can only be drawn face by face')
+        return {}
+    results = {}
+    for layered in [False, True]:
+        scene.environment.layered = layered
+        results['layered' if layered else 'six passes'] = measure_frames(scene, frames, warmup)
+    print_comparison(results)
+    return results
+
+
+def benchmark_shadow_cache(trees=200, frames=10, warmup=2, width=800, height=600):
+    '''
+    Draws the jungle scene with palm trees scattered on the island, with the shadow map drawn every frame, cached,
+    and cached with the tree as the only dynamic caster, first with a still scene then with the tree moving every
+    frame, and compares the shadow map renders and the frame time. The environment map is only drawn once.
+    :return: the counters and the CPU frame time statistics for each case
+    '''
+    from jungle import JungleScene
+    from environmentMapping import StaticUpdate
+    from ShadowMapping import ShadowMap
+    from matutils import translationMatrix
+    scene = quiet(JungleScene)(width, height, default_backend(), forest=trees, environment_policy=StaticUpdate())
+    shadows = scene.shadows
+    shadows.static = ShadowMap(width=shadows.width, height=shadows.height, cache=False)
+    shadows.dynamic = set(scene.tree)
+    draw = scene.draw
+    M = scene.tree[0].M
+    def draw_moving(framebuffer=False):
+        ''' Moves the tree back and forth before drawing '''
+        scene.tree[0].M = np.matmul(translationMatrix([0., 0., 0.02*np.sin(scene.frame/5.)]), M)
+        draw(framebuffer)
+    results = {}
+    for moving in [False, True]:
+        case = 'tree moving' if moving else 'still scene'
+        results[case] = {}
+        scene.draw = draw_moving if moving else draw
+        for (name, cache, split) in [('every frame', False, False), ('cached', True, False), ('split', True, True)]:
+            (shadows.cache, shadows.split) = (cache, split)
+            shadows.signatures = {}
+            results[case][name] = measure_frames(scene, frames, warmup)
+        print(case)
+        print_comparison(results[case])
+    scene.draw = draw
+    scene.tree[0].M = M
+    return results
+
+
+def benchmark_shadow_cascades(trees=200, frames=10, warmup=2, width=800, height=600):
+    '''
+    Draws the jungle scene with palm trees scattered on the island, with a single shadow map then with cascaded
+    shadow maps of several counts and resolutions, drawing the shadows every frame, and compares the frame time and
+    the density of the shadow texels close to the camera.
+    :return: the counters and the CPU frame time statistics for each case
+    '''
+    from jungle import JungleScene
+    results = {}
+    density = {}
+    for (cascades, resolution) in [(0, 1000), (1, 1024), (2, 1024), (3, 512), (3, 1024), (4, 1024)]:
+        name = 'single {}'.format(resolution) if cascades == 0 else '{} x {}'.format(cascades, resolution)
+        scene = quiet(JungleScene)(width, height, default_backend(), forest=trees, shadow_cascades=cascades, shadow_resolution=resolution)
+        scene.shadows.cache = False
+        results[name] = measure_frames(scene, frames, warmup)
+        if cascades > 0:
+            #The part of the view of the camera given to each cascade must be entirely inside it
+            for (cascade, points) in enumerate(scene.shadows.corners):
+                ndc = np.matmul(np.hstack([points, np.ones((8, 1))]), np.matmul(scene.shadows.P[cascade], scene.shadows.V[cascade]).T)
+                ndc = ndc[:, :3]/ndc[:, 3:]
+                assert np.all(np.abs(ndc) <= 1. + 1e-6), 'cascade {} of {} covers {} to {}'.format(cascade, name, ndc.min(axis=0), ndc.max(axis=0))
+        #Texels per unit of length across the light, at the target of the light or in the first cascade
+        if cascades == 0:
+            density[name] = resolution*scene.shadows.P[0, 0]/(2.*np.linalg.norm(scene.light.position))
+        else:
+            density[name] = resolution*scene.shadows.P[0, 0, 0]/2.
+    print_comparison(results)
+    print(('{:<30}' + ' {:>12.1f}'*len(results)).format('texels per unit (near)', *[density[name] for name in results]))
+    return results
+
+
+def benchmark_transforms(trees=300, frames=10, warmup=2, width=800, height=600):
+    '''
+    Draws the jungle scene with palm trees scattered on the island as separate models, with the model, normal and
+    shadow map matrices computed in every draw then cached per model and per pass (see transforms.py), first with a
+    still scene then with all trees moving every frame, and compares the time spent binding the shaders and the
+    frame time.
+    :return: the counters and the CPU frame time statistics for each case
+    '''
+    from jungle import JungleScene
+    from shaders import BaseShaderProgram
+    from frameTimer import count
+    from matutils import translationMatrix
+    scene = quiet(JungleScene)(width, height, default_backend())
+    forest = quiet(scene.create_forest)(trees, instanced=False)
+    scene.island = scene.island + forest
+    #Measure the time spent in the bind() of every shader class, counting nested calls to the parent classes once
+    classes = [BaseShaderProgram]
+    for shader_class in classes:
+        classes += [subclass for subclass in shader_class.__subclasses__() if subclass not in classes]
+    binds = dict([(shader_class, shader_class.__dict__['bind']) for shader_class in classes if 'bind' in shader_class.__dict__])
+    depth = [0]
+    def timed_bind(bind):
+        def wrapper(self, model, M):
+            depth[0] += 1
+            start = time.perf_counter()
+            try:
+                return bind(self, model, M)
+            finally:
+                depth[0] -= 1
+                if depth[0] == 0:
+                    count('shader bind (ms)', 1000.*(time.perf_counter() - start))
+        return wrapper
+    for (shader_class, bind) in binds.items():
+        shader_class.bind = timed_bind(bind)
+    draw = scene.draw
+    matrices = [model.M for model in forest]
+    def draw_moving(framebuffer=False):
+        ''' Moves all trees back and forth before drawing '''
+        offset = translationMatrix([0., 0.02*np.sin(scene.frame/5.), 0.])
+        for (model, M) in zip(forest, matrices):
+            model.M = np.matmul(offset, M)
+        draw(framebuffer)
+    results = {}
+    try:
+        for moving in [False, True]:
+            case = 'trees moving' if moving else 'still scene'
+            results[case] = {}
+            scene.draw = draw_moving if moving else draw
+            for cache in [False, True]:
+                scene.cache_transforms = cache
+                results[case]['cached' if cache else 'per draw'] = measure_frames(scene, frames, warmup)
+            print(case)
+            print_comparison(results[case])
+    finally:
+        for (shader_class, bind) in binds.items():
+            shader_class.bind = bind
+        scene.draw = draw
+    return results
+
+
+def benchmark_scene_graph(nodes=10000, seed=0):
+    '''
+    Builds a random scene graph, and compares the time of computing the world matrices of all nodes recursively
+    from their parent, as a hierarchy of Python objects would, with SceneGraph.update() when no node moved, when a
+    tenth of the leaves moved, and when the roots moved, which moves every node.
+    :return: the time in seconds of each case
+    '''
+    from sceneGraph import SceneGraph
+    from matutils import translationMatrix, rotationMatrixY
+    generator = np.random.default_rng(seed)
+    graph = SceneGraph()
+    roots = [graph.add_node(translationMatrix(generator.uniform(-10., 10., 3))) for i in range(10)]
+    for i in range(nodes - len(roots)):
+        #Attach each node to a random earlier one, which gives a tree of logarithmic depth
+        parent = graph.nodes[generator.integers(len(graph.nodes))]
+        parent.add_child(np.matmul(translationMatrix(generator.uniform(-1., 1., 3)), rotationMatrixY(generator.uniform(0., 6.28))))
+    graph.update()
+    leaves = [node.id for node in graph.nodes if len(node.children) == 0]
+    moved = generator.choice(leaves, len(leaves)//10, replace=False)
+    def recursive():
+        ''' Computes every world matrix from the one of its parent, nodes being created after their parent '''
+        world = [None]*len(graph.nodes)
+        for node in graph.nodes:
+            world[node.id] = node.local if node.parent is None else np.matmul(world[node.parent.id], node.local)
+        return world
+    def update(ids):
+        if len(ids) > 0:
+            graph.touch(ids)
+        return graph.update()
+    results = {}
+    (results['recursive'], world) = timed(recursive)
+    (results['static'], updated) = timed(update, [])
+    (results['tenth of leaves'], updated) = timed(update, moved)
+    assert len(updated) == len(moved)
+    (results['roots'], updated) = timed(update, [root.id for root in roots])
+    assert len(updated) == nodes and np.allclose(np.array(world), graph.world[:nodes])
+    print('{} nodes, depth {}, {} leaves'.format(nodes, int(graph.depth[:nodes].max()), len(leaves)))
+    for (name, elapsed) in results.items():
+        print('{:<30} {:>10.3f} ms'.format(name, 1000.*elapsed))
+    return results
+
+
+def benchmark_matutils(number=10000, seed=0):
+    '''
+    Builds the TRS matrices of random poses one by one with the matrix functions of matutils, then all at once with
+    poseMatrices(), from Euler angles and from quaternions, allocating the result or writing into an existing array.
+    :return: the time in seconds of each case
+    '''
+    from matutils import translationMatrix, rotationMatrixX, rotationMatrixY, rotationMatrixZ, scaleMatrix, poseMatrices
+    generator = np.random.default_rng(seed)
+    positions = generator.uniform(-10., 10., (number, 3))
+    angles = generator.uniform(0., 2.*np.pi, (number, 3))
+    scales = generator.uniform(0.5, 2., (number, 3))
+    #Quaternions giving the same rotations as the angles around the Y axis only
+    quaternions = np.zeros((number, 4))
+    quaternions[:, 1] = np.sin(angles[:, 1]/2.)
+    quaternions[:, 3] = np.cos(angles[:, 1]/2.)
+    def scalar():
+        return np.array([np.matmul(np.matmul(np.matmul(np.matmul(translationMatrix(p), rotationMatrixX(a[0])), rotationMatrixY(a[1])), rotationMatrixZ(a[2])), scaleMatrix(s))
+                         for (p, a, s) in zip(positions, angles, scales)], dtype='f')
+    out = np.empty((number, 4, 4), dtype='f')
+    results = {}
+    (results['scalar functions'], reference) = timed(scalar)
+    (results['poseMatrices'], batched) = timed(poseMatrices, positions, angles, scales)
+    assert np.allclose(batched, reference, atol=1e-5)
+    (results['poseMatrices out='], batched) = timed(lambda: poseMatrices(positions, angles, scales, out=out))
+    assert batched is out and np.allclose(out, reference, atol=1e-5)
+    yaw = np.zeros((number, 3))
+    yaw[:, 1] = angles[:, 1]
+    (results['poseMatrices quaternions'], batched) = timed(lambda: poseMatrices(positions, scales=scales, quaternions=quaternions, out=out))
+    assert np.allclose(batched, poseMatrices(positions, yaw, scales), atol=1e-5)
+    print('{} transforms'.format(number))
+    for (name, elapsed) in results.items():
+        print('{:<30} {:>10.3f} ms {:>8.1f}x'.format(name, 1000.*elapsed, results['scalar functions']/elapsed))
+    return results
+
+
+def benchmark_textures(files=['Beach2.bmp', 'Cat_Palm.bmp', 'PalmLeaves.bmp'], draws=20, width=800, height=600):
+    '''
+    Compares the time needed to load textures as before (decoding the image, level 0 only), converting them into the
+    texture cache (mip chain, RGBA or block compressed) and loading them from it, then the time of drawing each of
+    them minified on a quad, as an estimate of the bandwidth of sampling them, and their size on the GPU.
+    :param draws: the number of times the quad is drawn for each texture
+    :return: the times in seconds and sizes in bytes of each case, for each file
+    '''
+    import texture
+    from scene import Scene
+    from ShadowMapping import ShowTexture
+    scene = quiet(Scene)(width, height, backend=default_backend())
+    cache = texture.texture_cache
+    cases = [('decoded', False, None), ('mipmaps', True, None), ('compressed', True, 'auto')]
+    results = {}
+    print('{:<16} {:<12} {:>10} {:>10} {:>10} {:>12} {:>8}'.format('file', 'case', 'cold (s)', 'warm (s)', 'draw (ms)', 'GPU bytes', 'levels'))
+    for name in files:
+        results[name] = {}
+        path = './textures/{}'.format(name)
+        for (case, mipmaps, compression) in cases:
+            cache.compression = compression
+            def cold():
+                if os.path.exists(cache.path(path, compression)):
+                    os.remove(cache.path(path, compression))
+                loaded = texture.Texture(name, mipmaps=mipmaps)
+                glFinish()
+                return loaded
+            def warm():
+                loaded = texture.Texture(name, mipmaps=mipmaps)
+                glFinish()
+                return loaded
+            (t_cold, loaded) = timed(quiet(cold), repeat=1)
+            (t_warm, loaded) = timed(quiet(warm))
+            #Draw the texture on a quad covering a quarter of the window, much smaller than the texture
+            quad = quiet(ShowTexture)(scene, loaded)
+            quad.visible = True
+            quad.draw()
+            glFinish()
+            start = time.perf_counter()
+            for i in range(draws):
+                quad.draw()
+            glFinish()
+            t_draw = (time.perf_counter() - start)/draws
+            results[name][case] = {'cold': t_cold, 'warm': t_warm, 'draw': t_draw, 'bytes': loaded.bytes, 'levels': loaded.levels}
+            print('{:<16} {:<12} {:>10.4f} {:>10.4f} {:>10.3f} {:>12} {:>8}'.format(name, case, t_cold, t_warm, 1000.*t_draw, loaded.bytes, loaded.levels))
+    cache.compression = None
+    return results
+
+
+#Benchmarks that can be selected from the command line, eg. python benchmark.py obj cache
+benchmarks = {
+    'obj': benchmark_obj_loading,
+    'cache': benchmark_mesh_cache,
+    'normals': benchmark_normals,
+    'indices': benchmark_unified_indices,
+    'frames': benchmark_frames,
+    'startup': benchmark_startup,
+    'queue': benchmark_draw_queue,
+    'packed': benchmark_packed_models,
+    'layout': benchmark_vertex_layout,
+    'instancing': benchmark_instancing,
+    'culling': benchmark_culling,
+    'bvh': benchmark_bvh,
+    'lod': benchmark_lods,
+    'vcache': benchmark_vertex_cache,
+    'envmap': benchmark_environment_updates,
+    'layered': benchmark_layered_environment,
+    'shadows': benchmark_shadow_cache,
+    'cascades': benchmark_shadow_cascades,
+    'transforms': benchmark_transforms,
+    'graph': benchmark_scene_graph,
+    'matutils': benchmark_matutils,
+    'textures': benchmark_textures,
+}
+
+if __name__ == '__main__':
+    #Options are given as --name=value and passed on to the benchmarks that take them, eg. --frames=500,
+    #--json=file.json saves the results of the benchmarks that return some, for regression tracking
+    names = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    options = dict([arg[2:].split('=', 1) for arg in sys.argv[1:] if arg.startswith('--')])
+    output = options.pop('json', None)
+    create_context()
+    results = {}
+    for name in names or benchmarks.keys():
+        print('=== {}'.format(name))
+        parameters = inspect.signature(benchmarks[name]).parameters
+        kwargs = {key: type(parameters[key].default)(value) for (key, value) in options.items() if key in parameters}
+        result = benchmarks[name](**kwargs)
+        if result is not None:
+            results[name] = result
+    if output is not None:
+        with open(output, 'w') as file:
+            json.dump(results, file, indent=2)
+        print('Results saved to {}'.format(output))
@@ -1,7 +1,15 @@
+import re
+
 import numpy as np
 
 from material import Material,MaterialLibrary
 from mesh import Mesh
+from meshCache import MeshCache
+from simplify import generate_lods
+from meshOptimizer import optimize_mesh
+
+# compiled meshes, so that each file is only parsed once (see meshCache.py)
+mesh_cache = MeshCache()
 
 '''
 Functions for reading models from blender. 
@@ -79,7 +87,7 @@ def process_line(line):
 
 
 def load_material_library(file_name):
-	library = MaterialLibrary()
+	library = MaterialLibrary(file_name)
 	material = None
 
 	print('-- Loading material library {}'.format(file_name))
@@ -118,10 +126,194 @@ def load_material_library(file_name):
 	return library
 
 
-def load_obj_file(file_name):
+# regular expressions for the records read by read_obj_file, each one captures the rest of the line
+VERTEX_RECORD = re.compile(r'^v[ \t]+([^\n]*)', re.M)
+TEXTURE_RECORD = re.compile(r'^vt[ \t]+([^\n]*)', re.M)
+FACE_RECORD = re.compile(r'^f[ \t]+([^\n]*)', re.M)
+LIBRARY_RECORD = re.compile(r'^mtllib[ \t]+([^\n]*)', re.M)
+MATERIAL_RECORD = re.compile(r'^usemtl[ \t]+([^\n]*)', re.M)
+
+
+def parse_float_block(records, columns, label):
+	'''
+	Converts a block of records made of floating point values into an array in a single pass.
+	:param records: list of record payloads (the text after the record label)
+	:param columns: the number of values expected for each record
+	:param label: the record name, used in error messages
+	:return: a (N, columns) float32 array
+	'''
+	data = np.fromstring(' '.join(records), dtype=np.float64, sep=' ')
+	if data.size != columns * len(records):
+		# at least one record is malformed, so we drop those one by one as process_line does
+		valid = [record for record in records if len(record.split()) == columns]
+		print('(E) Error, {} entries expected for {}, {} record(s) ignored'.format(columns, label, len(records) - len(valid)))
+		data = np.fromstring(' '.join(valid), dtype=np.float64, sep=' ')
+	# values are parsed as doubles first so that they are rounded exactly as float(token) would be
+	return data.astype('f').reshape(-1, columns)
+
+
+def parse_face_block(records):
+	'''
+	Converts a block of face records into an array of triangles in a single pass. Quads are split
+	into the triangles (0, 1, 2) and (0, 2, 3), in the same order as process_line/load_obj_file_by_line.
+	:param records: list of face payloads, eg. '586/1 1860/2 1781/3'
+	:return: a (N, 3, k) uint32 array where k is the number of indices per corner (vertex/texture/normal)
+	'''
+	counts = np.array([len(record.split()) for record in records], dtype=np.int64)
+	if not np.all((counts == 3) | (counts == 4)):
+		print('(E) Error, 3 or 4 entries expected for faces, {} record(s) ignored'.format(np.count_nonzero((counts != 3) & (counts != 4))))
+		records = [record for (record, count) in zip(records, counts) if count == 3 or count == 4]
+		counts = counts[(counts == 3) | (counts == 4)]
+
+	# all corners must use the same format, eg. vi/ti, as OpenGL arrays cannot be ragged
+	k = records[0].split()[0].count('/') + 1
+	indices = np.fromstring(' '.join(records).replace('/', ' '), dtype=np.int64, sep=' ')
+	if indices.size != k * counts.sum():
+		raise ValueError('(E) Error, face records mix different index formats, expected {} indices per corner'.format(k))
+	corners = indices.reshape(-1, k)
+
+	# one triangle per face, and a second one for quads
+	starts = np.cumsum(counts) - counts
+	source = np.repeat(np.arange(counts.shape[0]), counts - 2)
+	second = np.zeros(source.shape[0], dtype=bool)
+	second[1:] = source[1:] == source[:-1]
+	pattern = np.where(second[:, None], [0, 2, 3], [0, 1, 2])
+	return corners[starts[source][:, None] + pattern].astype(np.uint32)
+
+
+def read_obj_file(file_name):
+	'''
+	Reads a Blender3D object file in one go and converts each type of record to numpy arrays in bulk.
+	Faces are grouped by material: every usemtl record starts a new group, as in load_obj_file_by_line.
+	The vn records are skipped: the normals of the meshes are computed from their faces, as in load_obj_file_by_line,
+	so parsing them would only add to the loading time.
+	:param file_name: the .obj file to read
+	:return: a tuple (varray, tarray, groups, library) where groups is a list of (material index, line number, faces)
+	'''
+	with open(file_name) as objfile:
+		text = objfile.read()
+
+	varray = parse_float_block(VERTEX_RECORD.findall(text), 3, 'vertex')
+	tarray = parse_float_block(TEXTURE_RECORD.findall(text), 2, 'vertex texture')
+
+	library = None
+	mtllib = LIBRARY_RECORD.search(text)
+	if mtllib is not None:
+		library = load_material_library('models/{}'.format(mtllib.group(1).strip()))
+
+	# split the file in sections starting at each usemtl record
+	materials = list(MATERIAL_RECORD.finditer(text))
+	if FACE_RECORD.search(text, 0, materials[0].start() if len(materials) > 0 else len(text)) is not None:
+		print('(W) Warning, faces found before any material are ignored')
+
+	groups = []
+	line_nb = 1
+	line_pos = 0
+	for (i, match) in enumerate(materials):
+		# count line numbers incrementally, for easier error locating
+		line_nb += text.count('\n', line_pos, match.start())
+		line_pos = match.start()
+		name = match.group(1).strip()
+		print('[l.{}] Loading mesh with material: {}'.format(line_nb, name))
+		material = library.names[name]
+
+		end = materials[i + 1].start() if i + 1 < len(materials) else len(text)
+		records = FACE_RECORD.findall(text, match.end(), end)
+		if len(records) == 0:
+			continue
+		first = FACE_RECORD.search(text, match.end(), end).start()
+		groups.append((material, line_nb + text.count('\n', line_pos, first), parse_face_block(records)))
+
+	return varray, tarray, groups, library
+
+
+def load_obj_file(file_name, cache=True, lods=(), optimize=True):
 	'''
 	Function for loading a Blender3D object file. minimalistic, and partial,
 	but sufficient for this course. You do not really need to worry about it.
+	The file is parsed in bulk by read_obj_file, and produces the same meshes as load_obj_file_by_line.
+	:param cache: whether to use the compiled meshes of mesh_cache when they are valid, and to store them otherwise
+	:param lods: the fraction of the faces kept at each level of detail generated for the meshes (see simplify.py),
+	which are stored in the cache along with the meshes
+	:param optimize: whether to reorder the faces and vertices of the meshes for the vertex cache (see meshOptimizer.py),
+	meshes from the cache that were already reordered are kept as they are
+	'''
+	print('Loading mesh(es) from Blender file: {}'.format(file_name))
+
+	if cache:
+		cached = mesh_cache.load(file_name)
+		if cached is not None:
+			meshes = create_meshes_from_cache(*cached)
+			if prepare_meshes(meshes, lods, optimize):
+				#The meshes in the cache were not prepared as requested
+				mesh_cache.store(file_name, cached[0], meshes)
+			return meshes
+
+	varray, tarray, groups, library = read_obj_file(file_name)
+
+	print('File read. Found {} vertices and {} faces.'.format(varray.shape[0], sum([faces.shape[0] for (_, _, faces) in groups])))
+
+	meshes = create_meshes_from_groups(varray, tarray, groups, library)
+	prepare_meshes(meshes, lods, optimize)
+	if cache and library is not None:
+		mesh_cache.store(file_name, library.file_name, meshes)
+	return meshes
+
+
+def prepare_meshes(meshes, lods, optimize):
+	'''
+	Generates the levels of detail of the meshes and reorders them for the vertex cache, when they are not already.
+	Levels of detail that are not requested are only dropped from the meshes, not from the cache.
+	:return: whether any mesh changed, in which case its cache entry is out of date
+	'''
+	changed = False
+	for mesh in meshes:
+		if len(lods) == 0:
+			mesh.lods = []
+			mesh.lod_ratios = ()
+			mesh.lod_errors = []
+		elif mesh.lod_ratios != tuple(lods):
+			generate_lods(mesh, lods)
+			#The new levels are reordered with the mesh
+			mesh.optimized = False
+			changed = True
+		if optimize and not mesh.optimized:
+			optimize_mesh(mesh)
+			changed = True
+	return changed
+
+
+def create_meshes_from_cache(library_file, records):
+	'''
+	Creates the meshes from the arrays stored in the mesh cache, without computing normals again.
+	:param library_file: the material library of the meshes
+	:param records: a list of dictionaries holding the arrays and material name of each mesh
+	'''
+	library = load_material_library(library_file)
+	meshes = []
+	for record in records:
+		mesh = Mesh(
+			vertices=record['vertices'],
+			faces=record['faces'],
+			normals=record['normals'],
+			textureCoords=record['textureCoords'],
+			material=library.materials[library.names[record['material']]],
+			tangents=record['tangents'],
+			binormals=record['binormals']
+		)
+		mesh.lods = record['lods']
+		mesh.lod_ratios = record['lod_ratios']
+		mesh.lod_errors = record['lod_errors']
+		mesh.optimized = record['optimized']
+		meshes.append(mesh)
+	print('--- Created {} mesh(es) from cache.'.format(len(meshes)))
+	return meshes
+
+
+def load_obj_file_by_line(file_name):
+	'''
+	Function for loading a Blender3D object file, one line at a time through process_line. minimalistic,
+	partial and slow, but kept as the reference implementation for load_obj_file (see benchmark.py).
 	'''
 	print('Loading mesh(es) from Blender file: {}'.format(file_name))
 
@@ -236,46 +428,62 @@ def create_meshes_from_blender(vlist, flist, mlist, tlist, library, mesh_list, l
 	return meshes
 
 
+def create_meshes_from_groups(varray, tarray, groups, library):
+	'''
+	Creates one mesh per group of faces returned by read_obj_file.
+	'''
+	meshes = []
+	fstart = 0
+
+	for (material, line_nb, farray) in groups:
+		print('Creating new mesh %i, faces %i-%i, line %i, with material %i: %s' % (len(meshes) + 1, fstart, fstart + farray.shape[0], line_nb, material, library.materials[material].name))
+		try:
+			meshes.append(create_mesh(varray, tarray, farray, 0, farray.shape[0], library, material))
+		except Exception as e:
+			print('(W) could not load mesh!')
+			print(e)
+			raise
+		fstart += farray.shape[0]
+
+	print('--- Created {} mesh(es) from Blender file.'.format(len(meshes)))
+	return meshes
+
+
 def create_mesh(varray, tarray, flist, fstart, f, library, material):
 	# select faces for this mesh
 	farray = np.array(flist[fstart:f], dtype=np.uint32)
 
-	# and vertices
-	vmax = np.max(farray[:, :, 0].flatten())
-	vmin = np.min(farray[:, :, 0].flatten()) - 1
+	# fix blender multiple indexing, only keeping the vertices used by these faces
+	corners, faces = unify_blender_indices(farray)
 
-	# fix blender texture intexing
-	textures = fix_blender_textures(tarray, farray, varray)
-	if textures is not None:
-		textures = textures[vmin:vmax, :]
+	textures = None
+	if corners.shape[1] == 1:
+		print('(W) No texture indices provided, setting texture coordinate array as None!')
+	else:
+		textures = tarray[corners[:, 1]]
 
 	return Mesh(
-			vertices=varray[vmin:vmax, :],
-			faces=farray[:, :, 0] - vmin - 1,
+			vertices=varray[corners[:, 0]],
+			faces=faces,
 			material=library.materials[material],
 			textureCoords=textures
 		)
 
 
-def fix_blender_textures(textures, faces, vertices):
+def unify_blender_indices(faces):
 	'''
-	Corrects the indexing of textures in Blender file for OpenGL.
-	Blender allows for multiple indexing of vertices and textures, which is not supported by OpenGL.
-	This function ensures that indexing is consistent.
-	:param textures: Original Blender texture UV values
-	:param faces: Blender faces multiple-index
-	:return: a new texture array indexed according to vertices.
+	Corrects the multiple indexing of Blender files for OpenGL.
+	Blender allows for multiple indexing of vertices and textures (and normals), which is not supported by OpenGL.
+	Each distinct combination of indices used by a face corner becomes one vertex, so that vertices used with
+	different texture coordinates (eg. on UV seams) are duplicated rather than overwritten.
+	:param faces: Blender faces multiple-index, (N, 3, k) array of 1-based (vertex, texture, normal) indices
+	:return: a tuple (corners, new_faces) where corners is a (M, k) array of the 0-based indices of each new vertex,
+	sorted by vertex index, and new_faces a (N, 3) uint32 array of indices in corners.
 	'''
 	# (OpenGL, unlike Blender, does not allow for multiple indexing!)
-
-	if faces.shape[2] == 1:
-		print('(W) No texture indices provided, setting texture coordinate array as None!')
-		return None
-
-	new_textures = np.zeros((vertices.shape[0], 2), dtype='f')
-
-	for f in range(faces.shape[0]):
-		for j in range(faces.shape[1]):
-			new_textures[faces[f, j, 0] - 1, :] = textures[faces[f, j, 1] - 1, :]
-
-	return new_textures
+	corners = faces.reshape(-1, faces.shape[2]).astype(np.int64)
+	# each combination is packed in a single integer, which is the same as np.unique(corners, axis=0) but much faster
+	shape = corners.max(axis=0) + 1
+	keys, inverse = np.unique(np.ravel_multi_index(corners.T, shape), return_inverse=True)
+	corners = np.stack(np.unravel_index(keys, shape), axis=1)
+	return corners - 1, inverse.reshape(faces.shape[0], 3).astype(np.uint32)
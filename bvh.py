@@ -0,0 +1,287 @@
+#Import heapq for the nearest neighbour search
+import heapq
+#Import numpy for the node arrays
+import numpy as np
+
+
+def ranges_mask(first, count, size):
+    '''
+    Returns a boolean array of a given size, set on the ranges [first, first + count) of indices.
+    '''
+    marks = np.zeros(size + 1, dtype=np.int64)
+    np.add.at(marks, first, 1)
+    np.add.at(marks, first + count, -1)
+    return np.cumsum(marks[:-1]) > 0
+
+
+def ray_boxes(origin, inverse, lower, upper):
+    '''
+    Intersects a ray with boxes, with the slab method.
+    :param origin: the origin of the ray
+    :param inverse: the inverse of each component of the direction of the ray
+    :param lower: the (N, 3) array of the lower corners of the boxes
+    :param upper: the (N, 3) array of their upper corners
+    :return: a tuple (hit, distance) of (N,) arrays, where distance is the distance along the ray at which it enters
+    each box, 0 if the origin is inside
+    '''
+    with np.errstate(invalid='ignore'):
+        t1 = (lower - origin)*inverse
+        t2 = (upper - origin)*inverse
+        #A ray parallel to a slab and on its edge gives nan, which counts as inside
+        near = np.nanmax(np.minimum(t1, t2), axis=1, initial=-np.inf)
+        far = np.nanmin(np.maximum(t1, t2), axis=1, initial=np.inf)
+    near = np.maximum(near, 0.)
+    return far >= near, near
+
+
+class BVH:
+    '''
+    Bounding volume hierarchy over the world space bounding boxes of models (see BaseModel.world_bounds()), for
+    frustum culling, ray picking and nearest neighbour queries without testing every model.
+
+    The nodes are stored in arrays rather than as Python objects: node i has the box lower[i], upper[i], the children
+    children[i] (-1 for leaves) and the models order[first[i]:first[i] + count[i]], which are contiguous for every
+    subtree. Queries process a whole level of nodes at once with numpy.
+
+    Models are added once and the tree is built at the next query. A model whose matrix M is assigned is refitted
+    (the boxes of its leaf and of the nodes above it grow or shrink), which keeps the tree valid but lets its quality
+    degrade if models move far, in which case rebuild() can be called. Changes made to M in place are not seen.
+    Models without bounds are never culled. Models no longer drawn must be removed (see remove()), which renumbers
+    the models after them.
+    '''
+    def __init__(self, leaf_size=4):
+        '''
+        :param leaf_size: the largest number of models in a leaf
+        '''
+        self.leaf_size = leaf_size
+        #Number of times models were renumbered, so that other code can tell when their bvh_index changed
+        self.generation = 0
+        self.clear()
+
+    def clear(self):
+        ''' Removes all models '''
+        for model in getattr(self, 'models', []):
+            model.bvh = None
+        self.models = []
+        #Number of times each model moved, so that other code can tell what changed (see environmentMapping.DirtyUpdate)
+        self.versions = []
+        #World space box of each model, and whether it has one
+        self.lower = np.zeros((0, 3))
+        self.upper = np.zeros((0, 3))
+        self.bounded = np.zeros(0, dtype=bool)
+        self.moved = set()
+        self.built = False
+        self.first = np.zeros(0, dtype=np.int64)
+        self.generation += 1
+
+    def add(self, model):
+        ''' Adds a model, unless it is already in the hierarchy '''
+        if model.bvh is self:
+            return
+        model.bvh = self
+        model.bvh_index = len(self.models)
+        self.models.append(model)
+        self.versions.append(0)
+        self.built = False
+
+    def add_models(self, models):
+        for model in models:
+            self.add(model)
+
+    def remove(self, model):
+        ''' Removes a model, if it is in the hierarchy, the tree is built again at the next query '''
+        if model.bvh is not self:
+            return
+        index = model.bvh_index
+        del self.models[index]
+        del self.versions[index]
+        for (i, other) in enumerate(self.models[index:], index):
+            other.bvh_index = i
+        model.bvh = None
+        model.bvh_index = None
+        self.moved = set()
+        self.built = False
+        self.generation += 1
+
+    def move(self, model):
+        ''' Records that the model matrix of a model changed, its box is updated at the next query '''
+        self.moved.add(model.bvh_index)
+        self.versions[model.bvh_index] += 1
+
+    def item_bounds(self, items):
+        ''' Updates the world space boxes of some models '''
+        for item in items:
+            bounds = self.models[item].world_bounds()
+            self.bounded[item] = bounds is not None
+            if bounds is not None:
+                self.lower[item] = bounds[0] - bounds[1]
+                self.upper[item] = bounds[0] + bounds[1]
+
+    def rebuild(self):
+        '''
+        Builds the tree top down, splitting the models of each node in two halves along the longest axis of their
+        centers.
+        '''
+        size = len(self.models)
+        self.lower = np.zeros((size, 3))
+        self.upper = np.zeros((size, 3))
+        self.bounded = np.zeros(size, dtype=bool)
+        self.item_bounds(range(size))
+        self.moved = set()
+        nodes = {'lower': [], 'upper': [], 'children': [], 'first': [], 'count': [], 'parent': []}
+        self.order = []
+        self.leaf = np.full(size, -1, dtype=np.int64)
+        items = np.flatnonzero(self.bounded)
+        if len(items) > 0:
+            self.build_node(items, -1, nodes)
+        self.node_lower = np.array(nodes['lower']).reshape(-1, 3)
+        self.node_upper = np.array(nodes['upper']).reshape(-1, 3)
+        self.children = np.array(nodes['children'], dtype=np.int64).reshape(-1, 2)
+        self.first = np.array(nodes['first'], dtype=np.int64)
+        self.count = np.array(nodes['count'], dtype=np.int64)
+        self.parent = np.array(nodes['parent'], dtype=np.int64)
+        self.order = np.array(self.order, dtype=np.int64)
+        self.built = True
+
+    def build_node(self, items, parent, nodes):
+        ''' Adds the node containing some models, and its subtree '''
+        index = len(nodes['parent'])
+        nodes['lower'].append(self.lower[items].min(axis=0))
+        nodes['upper'].append(self.upper[items].max(axis=0))
+        nodes['children'].append([-1, -1])
+        nodes['first'].append(len(self.order))
+        nodes['count'].append(len(items))
+        nodes['parent'].append(parent)
+        if len(items) <= self.leaf_size:
+            self.order.extend(items)
+            self.leaf[items] = index
+        else:
+            centers = self.lower[items] + self.upper[items]
+            axis = np.argmax(centers.max(axis=0) - centers.min(axis=0))
+            items = items[np.argsort(centers[:, axis], kind='stable')]
+            half = len(items)//2
+            left = self.build_node(items[:half], index, nodes)
+            right = self.build_node(items[half:], index, nodes)
+            nodes['children'][index] = [left, right]
+        return index
+
+    def refit(self):
+        ''' Updates the boxes of the models that moved, and of the nodes above them '''
+        moved = sorted(self.moved)
+        self.moved = set()
+        bounded = self.bounded[moved]
+        self.item_bounds(moved)
+        if np.any(bounded != self.bounded[moved]):
+            #A model gained or lost its bounds
+            self.rebuild()
+            return
+        nodes = set([self.leaf[item] for item in moved if self.leaf[item] >= 0])
+        while len(nodes) > 0:
+            parents = set()
+            for node in nodes:
+                (left, right) = self.children[node]
+                if left < 0:
+                    items = self.order[self.first[node]:self.first[node] + self.count[node]]
+                    self.node_lower[node] = self.lower[items].min(axis=0)
+                    self.node_upper[node] = self.upper[items].max(axis=0)
+                else:
+                    self.node_lower[node] = np.minimum(self.node_lower[left], self.node_lower[right])
+                    self.node_upper[node] = np.maximum(self.node_upper[left], self.node_upper[right])
+                if self.parent[node] >= 0:
+                    parents.add(self.parent[node])
+            nodes = parents
+
+    def update(self):
+        ''' Builds or refits the tree if models were added or moved since the last query '''
+        if not self.built:
+            self.rebuild()
+        elif len(self.moved) > 0:
+            self.refit()
+
+    def intersect_frustum(self, frustum):
+        '''
+        Returns which models may be inside a frustum.
+        :param frustum: the Frustum of the pass
+        :return: a boolean array indexed by the bvh_index of the models
+        '''
+        self.update()
+        visible = ~self.bounded
+        if len(self.first) == 0:
+            return visible
+        #Models whose own box is tested, by position in order, and nodes entirely inside the frustum
+        tested = np.zeros(len(self.order), dtype=bool)
+        inside_first = []
+        inside_count = []
+        frontier = np.array([0])
+        while len(frontier) > 0:
+            center = (self.node_lower[frontier] + self.node_upper[frontier])/2.
+            extent = (self.node_upper[frontier] - self.node_lower[frontier])/2.
+            distance = np.matmul(center, frustum.normals.T) + frustum.distances
+            radius = np.matmul(extent, frustum.extents.T)
+            outside = np.any(distance + radius < 0., axis=1)
+            inside = np.all(distance - radius >= 0., axis=1)
+            inside_first.append(self.first[frontier[inside]])
+            inside_count.append(self.count[frontier[inside]])
+            partial = frontier[~inside & ~outside]
+            leaves = partial[self.children[partial, 0] < 0]
+            tested |= ranges_mask(self.first[leaves], self.count[leaves], len(self.order))
+            frontier = self.children[partial[self.children[partial, 0] >= 0]].ravel()
+        visible[self.order[ranges_mask(np.concatenate(inside_first), np.concatenate(inside_count), len(self.order))]] = True
+        items = self.order[tested]
+        center = (self.lower[items] + self.upper[items])/2.
+        extent = (self.upper[items] - self.lower[items])/2.
+        distance = np.matmul(center, frustum.normals.T) + frustum.distances + np.matmul(extent, frustum.extents.T)
+        visible[items[np.all(distance >= 0., axis=1)]] = True
+        return visible
+
+    def intersect_ray(self, origin, direction):
+        '''
+        Returns the models whose box is hit by a ray.
+        :return: the list of (distance, model), nearest first, where distance is measured along the ray, in units of
+        the length of the direction, to the point where it enters the box
+        '''
+        self.update()
+        if len(self.first) == 0:
+            return []
+        origin = np.asarray(origin, dtype='f8')[:3]
+        with np.errstate(divide='ignore'):
+            inverse = 1./np.asarray(direction, dtype='f8')[:3]
+        hits = []
+        frontier = np.array([0])
+        while len(frontier) > 0:
+            (hit, _) = ray_boxes(origin, inverse, self.node_lower[frontier], self.node_upper[frontier])
+            frontier = frontier[hit]
+            leaves = frontier[self.children[frontier, 0] < 0]
+            items = self.order[ranges_mask(self.first[leaves], self.count[leaves], len(self.order))]
+            (hit, distance) = ray_boxes(origin, inverse, self.lower[items], self.upper[items])
+            hits += zip(distance[hit], items[hit])
+            frontier = self.children[frontier[self.children[frontier, 0] >= 0]].ravel()
+        return [(float(distance), self.models[item]) for (distance, item) in sorted(hits)]
+
+    def nearest(self, point, number=1):
+        '''
+        Returns the models nearest to a point, by the distance from the point to their box (0 inside the box).
+        :param number: the number of models returned
+        :return: the list of (distance, model), nearest first
+        '''
+        self.update()
+        if len(self.first) == 0:
+            return []
+        point = np.asarray(point, dtype='f8')[:3]
+        def distance(lower, upper):
+            return float(np.linalg.norm(np.maximum(np.maximum(lower - point, point - upper), 0.)))
+        #Best first search: nodes and models are visited by increasing distance, so the first models popped are
+        #the nearest ones
+        queue = [(distance(self.node_lower[0], self.node_upper[0]), 0, 0)]
+        found = []
+        while len(queue) > 0 and len(found) < number:
+            (d, is_item, index) = heapq.heappop(queue)
+            if is_item:
+                found.append((d, self.models[index]))
+            elif self.children[index, 0] < 0:
+                for item in self.order[self.first[index]:self.first[index] + self.count[index]]:
+                    heapq.heappush(queue, (distance(self.lower[item], self.upper[item]), 1, int(item)))
+            else:
+                for child in self.children[index]:
+                    heapq.heappush(queue, (distance(self.node_lower[child], self.node_upper[child]), 0, int(child)))
+        return found
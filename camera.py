@@ -8,7 +8,9 @@ class Camera:
     '''
 
     def __init__(self):
-        self.V = np.identity(4)
+        #The view matrix is computed in the same array every frame
+        self.view = np.identity(4)
+        self.V = self.view
         self.phi = 0.               #Azimuth angle
         self.psi = 0.               #Zenith angle
         self.distance = 5.         #Distance of the camera to the centre point
@@ -19,11 +21,9 @@ class Camera:
         '''
         Function to update the camera view matrix from parameters.
         '''
-        #Calculate the translation matrix for the view center (the point we look at)
-        T0 = translationMatrix(self.center)
         #Calculate the rotation matrix from the angles phi (azimuth) and psi (zenith) angles.
-        R = np.matmul(rotationMatrixX(self.psi), rotationMatrixY(self.phi))
-        #Calculate translation for the camera distance to the center point
-        T = translationMatrix([0., 0., -self.distance])
-        #Combine the three matrices for the final transformation
-        self.V = np.matmul(np.matmul(T, R), T0)
\ No newline at end of file
+        V = rotationMatrices([[self.psi, self.phi, 0.]], out=self.view[np.newaxis])[0]
+        #Translate to the view center (the point we look at) before rotating, then by the camera distance after
+        V[:3, 3] = np.matmul(V[:3, :3], self.center)
+        V[2, 3] -= self.distance
+        self.V = self.view
\ No newline at end of file
@@ -6,41 +6,153 @@ from shaders import *
 #Import modules for framebuffer usage
 from framebuffer import Framebuffer
 from OpenGL.GL.framebufferobjects import *
+#Import the state tracking of the render queue
+from renderQueue import use_program, bind_texture
+from frameTimer import count
+#Import the view frustum to find the models seen by each face
+from frustum import Frustum
 
 class EnvironmentShader(BaseShaderProgram):
     def __init__(self, name='environment', map=None):
         #Create a shader program with uniforms "sampler cube" and a collection of matrix uniforms
         BaseShaderProgram.__init__(self, name=name)
         self.add_uniform('sampler_cube')
-        self.add_uniform('VM')
-        self.add_uniform('VMiT')
-        self.add_uniform('VT')
+        self.add_uniform('MiT')
         self.map = map
 
     def bind(self, model, M):
-        glUseProgram(self.program) #Use the shader program
+        use_program(self.program) #Use the shader program
         if self.map is not None: #Map the current texture of the cube map into the 'sampler_cube' uniform
             unit = len(model.mesh.textures)
-            glActiveTexture(GL_TEXTURE0)
-            self.map.bind()
+            bind_texture(0, self.map)
             self.uniforms['sampler_cube'].bind(0)
-        P = model.scene.P  #Get the projection matrix from the scene
-        V = model.scene.camera.V  #Get the view matrix from the camera
-        #Bind the PVM uniforms
-        self.uniforms['PVM'].bind(np.matmul(P, np.matmul(V, M)))
-        self.uniforms['VM'].bind(np.matmul(V, M))
-        self.uniforms['VMiT'].bind(np.linalg.inv(np.matmul(V, M))[:3, :3].transpose())
-        self.uniforms['VT'].bind(V.transpose()[:3, :3])
+        #Bind the model matrix uniforms, the projection and view are in the Frame block (see FrameUniforms)
+        if self.uniforms['M'].bind(M):
+            self.uniforms['MiT'].bind(normal_matrix(model, M))
+
+
+class UpdatePolicy:
+    '''
+    Base class of the policies deciding which faces of an environment map are drawn again in each frame. This one
+    draws all six faces every frame.
+    '''
+    def select(self, environment, scene):
+        '''
+        Returns the faces of an environment map to draw in this frame.
+        :param environment: the EnvironmentMappingTexture
+        :param scene: the scene, whose camera is the one of the main view
+        '''
+        return list(environment.fbos.keys())
+
+
+class StaticUpdate(UpdatePolicy):
+    '''
+    Draws the environment map once, for scenes in which nothing seen by the reflections moves.
+    '''
+    def select(self, environment, scene):
+        environment.done = True
+        return list(environment.fbos.keys())
+
+
+class RoundRobinUpdate(UpdatePolicy):
+    '''
+    Draws all faces the first frame, then a few faces each frame in turn, so that reflections lag by a few frames.
+    '''
+    def __init__(self, faces_per_frame=1):
+        self.faces_per_frame = faces_per_frame
+        self.next = None
+
+    def select(self, environment, scene):
+        faces = list(environment.fbos.keys())
+        if self.next is None:
+            self.next = 0
+            return faces
+        selected = [faces[(self.next + i) % len(faces)] for i in range(min(self.faces_per_frame, len(faces)))]
+        self.next = (self.next + self.faces_per_frame) % len(faces)
+        return selected
+
+
+class DirtyUpdate(UpdatePolicy):
+    '''
+    Draws a face only when what it sees changed: the models inside its frustum, whether they are visible, their
+    moves (model matrices assigned, see BVH.move()), the shadow maps they are drawn with (see ShadowMap.version), or
+    the light. Shadows can change without anything inside the face moving, eg. when a caster outside of it moves or
+    when cascades follow the camera. The models are the ones in the BVH of the scene, which holds every model drawn
+    with culling, so all faces are drawn while it is empty.
+    '''
+    def __init__(self):
+        self.signatures = {}
+
+    def select(self, environment, scene):
+        bvh = scene.bvh
+        if len(bvh.models) == 0:
+            self.signatures = {}
+            return list(environment.fbos.keys())
+        versions = np.array(bvh.versions)
+        visible = np.array([model.visible for model in bvh.models])
+        #Version of the shadow map each model is drawn with, -1 for models drawn without one
+        shadows = np.array([getattr(getattr(model.shader, 'shadow_map', None), 'version', -1) for model in bvh.models])
+        light = np.asarray(scene.light.position, dtype='f').tobytes()
+        selected = []
+        for face in environment.fbos.keys():
+            inside = bvh.intersect_frustum(environment.frustum(face))
+            signature = (inside.tobytes(), versions[inside].tobytes(), visible[inside].tobytes(), shadows[inside].tobytes(), light)
+            if self.signatures.get(face) != signature:
+                self.signatures[face] = signature
+                selected.append(face)
+        return selected
+
+
+class DistanceRateLimit(UpdatePolicy):
+    '''
+    Limits how often another policy draws the environment map, according to the distance of the camera to the map:
+    every frame up to a given distance, then every other frame up to twice that distance, etc.
+    '''
+    def __init__(self, policy=None, distance=5., max_interval=8):
+        '''
+        :param policy: the policy applied when an update is due, all faces by default
+        :param distance: the distance up to which the map is updated every frame
+        :param max_interval: the largest number of frames between two updates
+        '''
+        self.policy = UpdatePolicy() if policy is None else policy
+        self.distance = distance
+        self.max_interval = max_interval
+        self.last = None
+
+    def select(self, environment, scene):
+        camera = np.linalg.inv(scene.camera.V)[:3, 3]
+        interval = int(min(max(np.linalg.norm(camera - environment.position)/self.distance, 1.), self.max_interval))
+        if self.last is not None and scene.frame - self.last < interval:
+            return []
+        self.last = scene.frame
+        return self.policy.select(environment, scene)
+
+
+def layered_supported():
+    ''' Returns whether the context has geometry shaders, needed to draw the faces of a cube map in one pass '''
+    return (glGetIntegerv(GL_MAJOR_VERSION), glGetIntegerv(GL_MINOR_VERSION)) >= (3, 2)
 
 
 class EnvironmentMappingTexture(CubeMap):
-    def __init__(self, width=200, height=200):
+    def __init__(self, width=200, height=200, policy=None, layered=None):
+        '''
+        :param policy: [optional] the UpdatePolicy choosing the faces drawn each frame, all of them by default
+        :param layered: whether the faces are drawn in a single pass over the scene, through a layered framebuffer
+        and geometry shaders (see shaders.layered_shaders()), rather than one pass per face. By default they are if
+        the context supports it.
+        '''
         #Create a cube map
         CubeMap.__init__(self)
         #Note that the environment mapping is not done, and store the width and height
         self.done = False
         self.width = width
         self.height = height
+        self.policy = UpdatePolicy() if policy is None else policy
+        #Projection of the faces, and position from which the environment is seen
+        self.far = 20.0
+        self.P = frustumMatrix(-1.0, +1.0, -1.0, +1.0, 1.0, self.far)
+        self.position = np.zeros(3)
+        self.layered = layered_supported() if layered is None else layered
         #Create frame buffers for each face of the cube
         self.fbos = {
             GL_TEXTURE_CUBE_MAP_NEGATIVE_X: Framebuffer(),
@@ -66,25 +178,72 @@ class EnvironmentMappingTexture(CubeMap):
         for (face, fbo) in self.fbos.items():
             glTexImage2D(face, 0, self.format, width, height, 0, self.format, self.type, None)
             fbo.prepare(self, face)
+        #Prepare a framebuffer object for all faces, which are its layers in the order of their targets
+        if self.layered:
+            self.layered_fbo = Framebuffer()
+            self.layered_fbo.prepare(self, layered=True)
+            self.layer_uniforms = LayerUniforms()
         self.unbind()
 
+    def frustum(self, face):
+        ''' Returns the frustum seen by a face '''
+        return Frustum(np.matmul(self.P, self.views[face]))
+
     def update(self, scene):
         if self.done:
             return
+        #Select the faces drawn in this frame
+        faces = self.policy.select(self, scene)
+        count('environment faces', len(faces))
+        if len(faces) == 0:
+            return
         #Bind the information
         self.bind()
         #Get the projection of the scene
         Pscene = scene.P
-        scene.P = frustumMatrix(-1.0, +1.0, -1.0, +1.0, 1.0, 20.0)
+        scene.P = self.P
         glViewport(0, 0, self.width, self.height)
-        #Draw the reflections and update the camera for each face of the cube
-        for (face, fbo) in self.fbos.items():
-            fbo.bind()
-            scene.camera.V = self.views[face]
-            scene.draw_reflections()
-            scene.camera.update()
-            fbo.unbind()
+        if self.layered:
+            self.draw_layers(scene, faces)
+        else:
+            #Draw the reflections and update the camera for each face of the cube
+            for face in faces:
+                fbo = self.fbos[face]
+                fbo.bind()
+                scene.camera.V = self.views[face]
+                scene.update_frame_uniforms()
+                scene.draw_reflections()
+                scene.camera.update()
+                fbo.unbind()
         #Reset the viewport
         glViewport(0, 0, scene.window_size[0], scene.window_size[1])
         scene.P = Pscene
+        scene.update_frame_uniforms()
         self.unbind()
+
+    def draw_layers(self, scene, faces):
+        '''
+        Draws the reflections in some faces in a single pass: the scene is drawn once with the view of the +Z face,
+        which has no rotation, and the geometry shaders rotate each triangle into the view of the other faces.
+        The lighting is computed in that view, which only differs from the view of each face by a rotation.
+        The models are culled against the union of the views of the faces, and each triangle against the view of
+        each face. The levels of detail are selected from the depth in the view of the +Z face, which is at most the
+        depth in the face a model is in, so they are never coarser than when the faces are drawn one by one.
+        '''
+        V = self.views[GL_TEXTURE_CUBE_MAP_POSITIVE_Z]
+        inverse = np.linalg.inv(np.matmul(self.P, V))
+        matrices = [np.matmul(np.matmul(self.P, self.views[GL_TEXTURE_CUBE_MAP_POSITIVE_X + layer]), inverse) for layer in range(6)]
+        mask = sum([1 << (face - GL_TEXTURE_CUBE_MAP_POSITIVE_X) for face in faces])
+        self.layer_uniforms.update(matrices, mask)
+        self.layered_fbo.bind()
+        scene.camera.V = V
+        scene.update_frame_uniforms()
+        #The faces together see the cube within the far plane around the centre
+        scene.frustum = Frustum(np.matmul(orthoMatrix(-self.far, self.far, self.far, -self.far, -self.far, self.far), V))
+        scene.shader_defines = {'LAYERED': 1}
+        try:
+            scene.draw_reflections()
+        finally:
+            scene.shader_defines = {}
+        scene.camera.update()
+        self.layered_fbo.unbind()
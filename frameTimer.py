@@ -0,0 +1,169 @@
+#Import time for the CPU clock
+import ctypes
+import time
+#Imports all openGL functions
+from OpenGL.GL import *
+#The wrapped glGetQueryObjectui64v of PyOpenGL cannot convert its output, so the raw function is used
+from OpenGL.raw.GL.VERSION.GL_3_3 import glGetQueryObjectui64v
+#Import numpy for the statistics
+import numpy as np
+
+
+#Number of events of each kind in the current frame (uniform uploads, draw calls...), see count()
+counters = {}
+
+
+def count(name, number=1):
+    '''
+    Counts an event in the current frame, the counts of each frame are kept by the FrameTimer if there is one.
+    '''
+    counters[name] = counters.get(name, 0) + number
+
+
+class PassTimer:
+    '''
+    Context manager measuring one pass of a frame, see FrameTimer.measure().
+    '''
+    def __init__(self, timer, name, gpu):
+        self.timer = timer
+        self.name = name
+        self.gpu = gpu
+        self.query = None
+
+    def __enter__(self):
+        #GL_TIME_ELAPSED queries cannot be nested, so only the outermost pass is measured on the GPU
+        if self.gpu and self.timer.gpu and self.timer.active_query is None:
+            self.query = self.timer.new_query()
+            glBeginQuery(GL_TIME_ELAPSED, self.query)
+            self.timer.active_query = self.query
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.timer.add_cpu(self.name, time.perf_counter() - self.start)
+        if self.query is not None:
+            glEndQuery(GL_TIME_ELAPSED)
+            self.timer.active_query = None
+            self.timer.current.append((self.timer.frames, self.name, self.query))
+
+
+class FrameTimer:
+    '''
+    Measures the time spent in each pass of a frame, both on the CPU (wall-clock time spent issuing the OpenGL calls)
+    and on the GPU (GL_TIME_ELAPSED timer queries), and reports statistics over all measured frames.
+    GPU results are read one frame late so that waiting for them does not stall the frame being measured.
+    '''
+    def __init__(self, gpu=True):
+        '''
+        :param gpu: whether to use timer queries, otherwise only the CPU time is measured
+        '''
+        self.gpu = gpu
+        self.cpu_times = {}
+        self.gpu_times = {}
+        self.counts = {}
+        self.frames = 0
+        self.queries = []
+        self.active_query = None
+        #Queries of the frame being drawn, and of the previous one (not read yet)
+        self.current = []
+        self.pending = []
+        self.frame_start = None
+
+    def new_query(self):
+        ''' Returns an unused query object, creating one if needed '''
+        if len(self.queries) > 0:
+            return self.queries.pop()
+        return int(glGenQueries(1)[0])
+
+    def measure(self, name, gpu=True):
+        '''
+        Returns a context manager measuring the time spent in a pass, eg.
+            with timer.measure('skybox'):
+                self.skybox.draw()
+        :param name: the name of the pass, passes with the same name in a frame are added together
+        :param gpu: whether to also measure this pass on the GPU
+        '''
+        return PassTimer(self, name, gpu)
+
+    def add_cpu(self, name, seconds):
+        self.cpu_times.setdefault(name, {})
+        times = self.cpu_times[name]
+        times[self.frames] = times.get(self.frames, 0.) + seconds
+
+    def begin_frame(self):
+        self.frame_start = time.perf_counter()
+        counters.clear()
+
+    def end_frame(self):
+        '''
+        Records the total time and the counters of the frame, and reads the GPU results of the previous frame.
+        '''
+        if self.frame_start is not None:
+            self.add_cpu('frame', time.perf_counter() - self.frame_start)
+        for (name, number) in counters.items():
+            self.counts.setdefault(name, {})[self.frames] = number
+        counters.clear()
+        self.read_queries(self.pending)
+        self.pending = self.current
+        self.current = []
+        self.frames += 1
+
+    def read_queries(self, queries):
+        ''' Reads the results of a list of (frame, pass, query) and recycles the queries '''
+        result = ctypes.c_uint64()
+        for (frame, name, query) in queries:
+            glGetQueryObjectui64v(query, GL_QUERY_RESULT, ctypes.byref(result))
+            nanoseconds = result.value
+            self.gpu_times.setdefault(name, {})
+            self.gpu_times[name][frame] = self.gpu_times[name].get(frame, 0.) + nanoseconds*1e-9
+            self.gpu_times.setdefault('frame', {})
+            self.gpu_times['frame'][frame] = self.gpu_times['frame'].get(frame, 0.) + nanoseconds*1e-9
+            self.queries.append(query)
+
+    def flush(self):
+        ''' Reads the GPU results that are still pending '''
+        self.read_queries(self.pending)
+        self.pending = []
+
+    @staticmethod
+    def statistics(times):
+        ''' Returns the mean and percentiles of a dictionary of times per frame, in milliseconds '''
+        values = np.array(list(times.values()))*1000.
+        return {
+            'mean': float(np.mean(values)),
+            'p50': float(np.percentile(values, 50)),
+            'p95': float(np.percentile(values, 95)),
+            'p99': float(np.percentile(values, 99)),
+            'frames': int(values.shape[0]),
+        }
+
+    def report(self):
+        '''
+        Returns the statistics of all passes, as a dictionary {pass: {'cpu': {...}, 'gpu': {...}}} in milliseconds,
+        and the mean number per frame of each counter under 'counters'.
+        '''
+        self.flush()
+        report = {}
+        for name in self.cpu_times:
+            report[name] = {'cpu': self.statistics(self.cpu_times[name])}
+            if name in self.gpu_times:
+                report[name]['gpu'] = self.statistics(self.gpu_times[name])
+        report['counters'] = {}
+        for (name, numbers) in self.counts.items():
+            report['counters'][name] = sum(numbers.values()) / float(self.frames)
+        return report
+
+    def print_report(self, report=None):
+        if report is None:
+            report = self.report()
+        print('{:<14} {:>9} {:>9} {:>9} {:>9}   {:>9} {:>9} {:>9} {:>9}'.format(
+            'pass (ms)', 'cpu mean', 'p50', 'p95', 'p99', 'gpu mean', 'p50', 'p95', 'p99'))
+        for (name, times) in report.items():
+            if name == 'counters':
+                continue
+            line = '{:<14} {:>9.3f} {:>9.3f} {:>9.3f} {:>9.3f}'.format(name, *[times['cpu'][key] for key in ['mean', 'p50', 'p95', 'p99']])
+            if 'gpu' in times:
+                line += '   {:>9.3f} {:>9.3f} {:>9.3f} {:>9.3f}'.format(*[times['gpu'][key] for key in ['mean', 'p50', 'p95', 'p99']])
+            print(line)
+        for (name, number) in sorted(report['counters'].items()):
+            print('{:<30} {:>12.1f} per frame'.format(name, number))
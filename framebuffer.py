@@ -5,6 +5,9 @@ class Framebuffer:
     '''
     Basic class to handle rendering to texture using a framebuffer object.
     '''
+    #The framebuffer bound when rendering to a framebuffer is done: 0 is the window, a headless scene replaces it
+    #with its offscreen framebuffer (see offscreen.RenderTarget)
+    default = 0
 
     def __init__(self, attachment=GL_COLOR_ATTACHMENT0, texture=None):
         '''
@@ -21,22 +24,45 @@ class Framebuffer:
         glBindFramebuffer(GL_FRAMEBUFFER, self.fbo)
 
     def unbind(self):
-        glBindFramebuffer(GL_FRAMEBUFFER, 0)
+        glBindFramebuffer(GL_FRAMEBUFFER, Framebuffer.default)
 
-    def prepare(self, texture, target=None, level=0):
+    def prepare(self, texture, target=None, level=0, layered=False, layer=None):
         '''
         Prepare the Framebuffer by linking its output to a texture
         :param texture: The texture object to render to
         :param target: The target of the rendering, if not the default for the texture (use for cube maps)
         :param level: The mipmap level (ignore)
+        :param layered: whether to link all layers of the texture (eg. the six faces of a cube map), in which case
+        the shaders choose the layer of each primitive (see shaders.layered_shaders())
+        :param layer: if provided, the layer of a texture array to link
         :return:
         '''
         if target is None:
             target = texture.target
         self.bind()
-        glFramebufferTexture2D(GL_FRAMEBUFFER, self.attachment, target, texture.textureid, level)
+        if layered:
+            glFramebufferTexture(GL_FRAMEBUFFER, self.attachment, texture.textureid, level)
+        elif layer is not None:
+            glFramebufferTextureLayer(GL_FRAMEBUFFER, self.attachment, texture.textureid, level, layer)
+        else:
+            glFramebufferTexture2D(GL_FRAMEBUFFER, self.attachment, target, texture.textureid, level)
         if self.attachment == GL_DEPTH_ATTACHMENT:
             glDrawBuffer(GL_NONE)
             glReadBuffer(GL_NONE)
 
-        self.unbind()
\ No newline at end of file
+        self.unbind()
+
+    def attach_renderbuffer(self, attachment, format, width, height):
+        '''
+        Creates a renderbuffer and links it to one output of this framebuffer, for outputs that are not read as a texture.
+        The framebuffer must be bound.
+        :param attachment: Which output of the rendering process to store (GL_COLOR_ATTACHMENT0, GL_DEPTH_ATTACHMENT, ...)
+        :param format: The internal format of the renderbuffer (GL_RGBA8, GL_DEPTH_COMPONENT24, ...)
+        :return: the renderbuffer ID
+        '''
+        renderbuffer = glGenRenderbuffers(1)
+        glBindRenderbuffer(GL_RENDERBUFFER, renderbuffer)
+        glRenderbufferStorage(GL_RENDERBUFFER, format, width, height)
+        glFramebufferRenderbuffer(GL_FRAMEBUFFER, attachment, GL_RENDERBUFFER, renderbuffer)
+        glBindRenderbuffer(GL_RENDERBUFFER, 0)
+        return renderbuffer
@@ -0,0 +1,71 @@
+#Import numpy for the plane and bounding box calculations
+import numpy as np
+
+
+#Bounding boxes are stored as a tuple (center, half extent) of 3D vectors, which is cheap to transform and to test
+#against a plane (see Frustum.intersects())
+
+def bounding_box(points):
+    '''
+    Returns the axis aligned bounding box of a set of points.
+    :param points: a (N, 3) array
+    :return: a tuple (center, half extent), or None if there are no points
+    '''
+    if points is None or len(points) == 0:
+        return None
+    lower = np.min(points[:, :3], axis=0)
+    upper = np.max(points[:, :3], axis=0)
+    return (upper + lower)/2., (upper - lower)/2.
+
+
+def transform_bounds(bounds, M):
+    '''
+    Returns the axis aligned bounding box containing a bounding box transformed by an affine matrix.
+    :param M: a 4x4 matrix, or a (N, 4, 4) stack of matrices to transform the box by each of them
+    :return: a tuple (center, half extent), of (N, 3) arrays for a stack of matrices
+    '''
+    (center, extent) = bounds
+    R = M[..., :3, :3]
+    return np.matmul(R, center) + M[..., :3, 3], np.matmul(np.abs(R), extent)
+
+
+def merge_bounds(centers, extents):
+    '''
+    Returns the bounding box containing several bounding boxes.
+    :param centers: a (N, 3) array of the centers of the boxes
+    :param extents: a (N, 3) array of their half extents
+    '''
+    if len(centers) == 0:
+        return None
+    return bounding_box(np.vstack([centers - extents, centers + extents]))
+
+
+class Frustum:
+    '''
+    The six planes of the volume seen through a projection and view matrix, for culling the models that are entirely
+    outside of it. The planes are extracted from the rows of P·V and point inwards.
+    '''
+    def __init__(self, PV):
+        '''
+        :param PV: the 4x4 product of the projection and view matrices
+        '''
+        planes = np.array([PV[3] + PV[0], PV[3] - PV[0], PV[3] + PV[1], PV[3] - PV[1], PV[3] + PV[2], PV[3] - PV[2]], dtype='f8')
+        planes /= np.linalg.norm(planes[:, :3], axis=1)[:, None]
+        self.normals = planes[:, :3]
+        self.distances = planes[:, 3]
+        self.extents = np.abs(self.normals)
+
+    def intersects(self, bounds):
+        '''
+        Returns whether a bounding box in world coordinates is at least partly inside the frustum. Boxes near a corner
+        of the frustum may be reported inside when they are not, which only costs a draw.
+        :param bounds: a tuple (center, half extent), None for objects without bounds which are always inside
+        '''
+        if bounds is None:
+            return True
+        (center, extent) = bounds
+        return bool(np.all(np.matmul(self.normals, center) + self.distances + np.matmul(self.extents, extent) >= 0.))
+
+    def visible(self, model):
+        ''' Returns whether a model may be visible, from its bounds (see BaseModel.world_bounds()) '''
+        return self.intersects(model.world_bounds())
@@ -0,0 +1,146 @@
+#Import ctypes for the offsets of the attributes
+import ctypes
+#Imports all openGL functions
+from OpenGL.GL import *
+#Import helper functions
+from matutils import *
+#Import the model and shader classes
+from BaseModel import DrawModelFromMesh
+from shaders import PhongShader
+from frameTimer import count
+from frustum import bounding_box, transform_bounds, merge_bounds
+
+
+def scatter(number, radius, scale=(1., 1.), seed=0, out=None):
+    '''
+    Returns the model matrices of objects scattered at random on a disc in the XZ plane, each rotated around the
+    Y axis and uniformly scaled.
+    :param number: the number of matrices
+    :param radius: the radius of the disc
+    :param scale: the range of the random scale factors
+    :param seed: the seed of the random generator, so that the same objects are placed on each run
+    :param out: [optional] the (number, 4, 4) array to write the matrices into
+    :return: a (number, 4, 4) float32 array
+    '''
+    generator = np.random.default_rng(seed)
+    distance = radius*np.sqrt(generator.uniform(0., 1., number))
+    direction = generator.uniform(0., 2.*np.pi, number)
+    angle = generator.uniform(0., 2.*np.pi, number)
+    factor = generator.uniform(scale[0], scale[1], number)
+    positions = np.zeros((number, 3))
+    positions[:, 0] = distance*np.cos(direction)
+    positions[:, 2] = distance*np.sin(direction)
+    angles = np.zeros((number, 3))
+    angles[:, 1] = angle
+    return poseMatrices(positions, angles, factor, out=out)
+
+
+class InstanceBuffer:
+    '''
+    Per-instance attributes of an instanced object: the model matrix of each instance, relative to the model matrix
+    of the object, and a tint multiplying its texture. The models drawing the parts of an object (eg. the trunk and
+    the leaves of a tree) share the same buffer.
+    Instance matrices may only rotate, translate and uniformly scale, as they also transform the normals.
+    '''
+    #Floats per instance: the matrix, stored by columns as GLSL reads it from four locations, then the tint
+    size = 20
+
+    def __init__(self, matrices, tints=None):
+        '''
+        :param matrices: the (N, 4, 4) array of the model matrices of the instances
+        :param tints: [optional] the (N, 3) or (N, 4) array of the colours of the instances, white by default
+        '''
+        self.vbo = glGenBuffers(1)
+        #The interleaved instance data, kept to be filled again when the instances are updated
+        self.data = None
+        self.update(matrices, tints)
+
+    def update(self, matrices, tints=None):
+        '''
+        Replaces the instances, eg. to move them. The models drawing them must then update their bounds (see
+        InstancedModel.update_bounds()).
+        '''
+        self.matrices = np.asarray(matrices, dtype='f').reshape(-1, 4, 4)
+        self.count = self.matrices.shape[0]
+        if self.data is None or self.data.shape[0] != self.count:
+            self.data = np.empty((self.count, self.size), dtype='f')
+        data = self.data
+        #Copy the matrices by columns straight into the interleaved array
+        np.copyto(data[:, :16].reshape(self.count, 4, 4), self.matrices.transpose(0, 2, 1))
+        data[:, 16:] = 1.
+        if tints is not None:
+            tints = np.asarray(tints, dtype='f')
+            data[:, 16:16 + tints.shape[1]] = tints
+        self.bytes = data.nbytes
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glBufferData(GL_ARRAY_BUFFER, data.nbytes, data, GL_DYNAMIC_DRAW)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    def attach(self, location):
+        '''
+        Sets the per-instance attributes of the vertex array that is bound, from a given location: the matrix uses
+        four consecutive locations, and the tint the next one.
+        :return: the dictionary {name: location} of the instance attributes
+        '''
+        stride = self.size*4
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        for column in range(5):
+            glEnableVertexAttribArray(location + column)
+            glVertexAttribPointer(index=location + column, size=4, type=GL_FLOAT, normalized=False,
+                                  stride=stride, pointer=ctypes.c_void_p(16*column))
+            glVertexAttribDivisor(location + column, 1)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        return {'instance_M': location, 'instance_tint': location + 4}
+
+
+class InstancedModel(DrawModelFromMesh):
+    '''
+    Model drawing many copies of a mesh with a single draw call (glDrawElementsInstanced): the mesh is uploaded once
+    and the model matrix and tint of each copy are read from an InstanceBuffer, in every pass the model is drawn in
+    (including the shadow map). The shader must be created with InstancedModel.defines, eg.
+        ShadowMappingShader(shadow_map=shadows, defines=InstancedModel.defines)
+    '''
+    defines = {'INSTANCED': 1}
+
+    def __init__(self, scene, M, mesh, instances, name=None, shader=None, visible=True, layout=None):
+        '''
+        Initialises the model data
+        :param instances: the InstanceBuffer, or the (N, 4, 4) array of the model matrices of the instances
+        '''
+        self.instances = instances if isinstance(instances, InstanceBuffer) else InstanceBuffer(instances)
+        DrawModelFromMesh.__init__(self, scene=scene, M=M, mesh=mesh, name=name, shader=shader, visible=visible, layout=layout)
+
+    def bind(self):
+        ''' Stores the mesh in its buffers, then adds the per-instance attributes after the vertex attributes '''
+        DrawModelFromMesh.bind(self)
+        glBindVertexArray(self.vao)
+        self.attributes.update(self.instances.attach(len(self.attributes)))
+        glBindVertexArray(0)
+        self.update_bounds()
+
+    def update_bounds(self):
+        ''' Sets the bounds of the model to contain all of its instances, for frustum culling '''
+        self.bounds = merge_bounds(*transform_bounds(bounding_box(self.mesh.vertices), self.instances.matrices))
+
+    def lod_scale(self, M):
+        ''' Returns the largest factor by which M and the matrix of an instance scale lengths (see BaseModel.lod_scale()) '''
+        return DrawModelFromMesh.lod_scale(self, M)*float(np.max(np.linalg.norm(self.instances.matrices[:, :3, 0], axis=1)))
+        if self.bvh is not None:
+            self.bvh.move(self)
+
+    def bind_shader(self, shader):
+        if isinstance(shader, str):
+            shader = PhongShader(shader, defines=self.defines)
+        elif 'INSTANCED' not in shader.defines:
+            raise ValueError('(E) Error in InstancedModel.bind_shader(): shader {} must be created with InstancedModel.defines'.format(shader.name))
+        DrawModelFromMesh.bind_shader(self, shader)
+
+    def submit(self):
+        ''' Draws all instances at once '''
+        if self.mesh.faces is not None:
+            (number, offset) = self.levels[self.level]
+            glDrawElementsInstanced(self.primitive, number, self.index_type, ctypes.c_void_p(offset), self.instances.count)
+            count('triangles', number//3*self.instances.count)
+        else:
+            glDrawArraysInstanced(self.primitive, 0, self.mesh.vertices.shape[0], self.instances.count)
+        count('instances', self.instances.count)
@@ -6,6 +6,9 @@ from scene import Scene
 #Import model related classes and functions
 from blender import load_obj_file
 from BaseModel import DrawModelFromMesh
+from packedModel import PackedModel
+from vertexLayout import compact_layout
+from instancedModel import InstancedModel, InstanceBuffer, scatter
 from sphereModel import Sphere
 #Import the environment mapping classes and functions
 from environmentMapping import *
@@ -17,59 +20,107 @@ from lightSource import LightSource
 from skyBox import *
 
 class JungleScene(Scene):
-    def __init__(self):
+    def __init__(self, width=800, height=600, backend='pygame', packed=True, layout=compact_layout, forest=0, lods=(0.5, 0.25, 0.125), environment_policy=None, shadow_cascades=0, shadow_resolution=1000):
+        '''
+        :param packed: whether each loaded object is drawn as one PackedModel (one vertex buffer, one draw call per
+        material) rather than one model per sub-mesh
+        :param layout: the VertexLayout of the loaded objects, None for float32 attributes
+        :param forest: the number of palm trees scattered on the island, drawn with instancing
+        :param lods: the fraction of the faces kept at each level of detail of the tree, () to always draw it in full
+        :param environment_policy: the UpdatePolicy of the environment map, by default its faces are drawn again
+        only when what they see changed
+        :param shadow_cascades: the number of cascades of the shadow map (see CascadedShadowMap), 0 for a single
+        shadow map from the light towards the centre of the scene
+        :param shadow_resolution: the width and height of the shadow map, or of each cascade
+        '''
         #Initialise the scene using the scene class
-        Scene.__init__(self)
+        Scene.__init__(self, width=width, height=height, backend=backend)
         #Create a lightsource for the scene
         self.light = LightSource(self, position=[3., 4., -3.])
         #Use the phong shader within the scene
         self.shaders='phong'
         #Create and show the shadow map
-        self.shadows = ShadowMap(light=self.light)
-        self.show_shadow_map = ShowTexture(self, self.shadows)
+        if shadow_cascades > 0:
+            self.shadows = CascadedShadowMap(light=self.light, cascades=shadow_cascades, resolution=shadow_resolution)
+            #The cascades are in a texture array, which cannot be shown
+            self.show_shadow_map = ShowTexture(self)
+        else:
+            self.shadows = ShadowMap(light=self.light, width=shadow_resolution, height=shadow_resolution)
+            self.show_shadow_map = ShowTexture(self, self.shadows)
         #Load a series of files and models to be used within the scene
         meshes = load_obj_file('models/palmtree.obj')
-        self.add_models_list(
-            [DrawModelFromMesh(scene=self, M=np.matmul(translationMatrix([-3,-1,0]),scaleMatrix([2.,2.,2.])), mesh=mesh, shader=ShadowMappingShader(shadow_map=self.shadows), name='palmtree') for mesh in meshes]
-        )
+        self.add_models_list(self.create_models(meshes, M=np.matmul(translationMatrix([-3,-1,0]),scaleMatrix([2.,2.,2.])), shader=ShadowMappingShader(shadow_map=self.shadows), name='palmtree', packed=packed, layout=layout))
         island = load_obj_file('models/island.obj')
-        self.island = [DrawModelFromMesh(scene=self, M=np.matmul(translationMatrix([-3,-1,0]),scaleMatrix([0.25,0.25,0.25])), mesh=mesh, shader=ShadowMappingShader(shadow_map=self.shadows), name='island') for mesh in island]
-        tree = load_obj_file('models/tree.obj')
-        self.tree = [DrawModelFromMesh(scene=self, M=np.matmul(translationMatrix([1,-1,0]),scaleMatrix([0.1,0.1,0.1])), mesh=mesh, shader=self.shaders, name='box') for mesh in tree]
+        self.island = self.create_models(island, M=np.matmul(translationMatrix([-3,-1,0]),scaleMatrix([0.25,0.25,0.25])), shader=ShadowMappingShader(shadow_map=self.shadows), name='island', packed=packed, layout=layout)
+        tree = load_obj_file('models/tree.obj', lods=lods)
+        self.tree = self.create_models(tree, M=np.matmul(translationMatrix([1,-1,0]),scaleMatrix([0.1,0.1,0.1])), shader=self.shaders, name='box', packed=packed, layout=layout)
+        #Scatter palm trees on the island, drawn with the island in every pass
+        self.palmtree = meshes
+        self.layout = layout
+        if forest > 0:
+            self.island += self.create_forest(forest)
         #Draw a skybox for the horizon
         self.skybox = SkyBox(scene=self)
         #Create a light visible at the position the light is coming from within the scene
         self.show_light = DrawModelFromMesh(scene=self, M=poseMatrix(position=self.light.position, scale=0.2), mesh=Sphere(material=Material(Ka=[10,10,10])), shader=FlatShader())
         #After that, draw a texture from the environment for environment mapping
-        self.environment = EnvironmentMappingTexture(width=400, height=400)
+        self.environment = EnvironmentMappingTexture(width=400, height=400, policy=DirtyUpdate() if environment_policy is None else environment_policy)
         #Create a monkey use the environment shader to begin with, which draws from the environment mapping texture
         monkey = load_obj_file('models/Suzanne.obj')
         self.monkey = DrawModelFromMesh(scene=self, M=np.matmul(translationMatrix([0,-1,0]), scaleMatrix([0.25,0.25,0.25])), mesh=monkey[0], shader=EnvironmentShader(map=self.environment))
+        #The monkey is moved through a node of the scene graph
+        self.monkey_node = self.graph.add_node(self.monkey.M, name='monkey')
+        self.monkey_node.attach(self.monkey)
         #Create a flattened cube map of the environment
         self.flattened_cube = FlattenCubeMap(scene=self, cube=self.environment)
 
-    def draw_shadow_map(self):
-        '''Draws a shadow map'''
+    def create_models(self, meshes, M, shader, name, packed=True, layout=None):
+        '''
+        Creates the models drawing the meshes of an object: a single PackedModel, or one model per mesh.
+        '''
+        if packed:
+            return [PackedModel(scene=self, M=M, meshes=meshes, shader=shader, name=name, layout=layout)]
+        return [DrawModelFromMesh(scene=self, M=M, mesh=mesh, shader=shader, name=name, layout=layout) for mesh in meshes]
+
+    def create_forest(self, number, instanced=True, seed=0):
+        '''
+        Creates the models of palm trees scattered on the island.
+        :param number: the number of palm trees
+        :param instanced: whether all trees are drawn at once with an InstancedModel per mesh, or with one model per
+        tree and mesh
+        '''
+        M = translationMatrix([-3,-1,0])
+        matrices = scatter(number, radius=4., scale=(0.5, 1.), seed=seed)
+        #Vary the colour of the trees slightly
+        tints = np.random.default_rng(seed).uniform(0.8, 1., (number, 3))
+        if instanced:
+            instances = InstanceBuffer(matrices, tints)
+            shader = ShadowMappingShader(shadow_map=self.shadows, defines=InstancedModel.defines)
+            return [InstancedModel(scene=self, M=M, mesh=mesh, instances=instances, shader=shader, name='forest', layout=self.layout) for mesh in self.palmtree]
+        shader = ShadowMappingShader(shadow_map=self.shadows)
+        return [DrawModelFromMesh(scene=self, M=np.matmul(M, matrix), mesh=mesh, shader=shader, name='forest', layout=self.layout) for matrix in matrices for mesh in self.palmtree]
+
+    def shadow_casters(self):
+        '''Returns the models drawn in the shadow map'''
+        return self.island + self.tree
+
+    def draw_shadow_map(self, models=None, clear=True):
+        '''
+        Draws a shadow map
+        :param models: the models drawn, all shadow casters by default
+        :param clear: whether the buffer is cleared first, False to draw over the depth of other casters
+        '''
         #First the buffer is cleared
-        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
-        #Then these two models are drawn for the purpose of the shadow map
-        for model in self.island:
-            model.draw()
-        for model in self.tree:
-            model.draw()
+        if clear:
+            glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+        #Then the casters, the island and the tree, are drawn for the purpose of the shadow map
+        self.draw_models(self.shadow_casters() if models is None else models, name='shadow map')
 
     def draw_reflections(self):
         #Draw the dedicated skybox
         self.skybox.draw()
-        #Draw all models
-        for model in self.models:
-            model.draw()
-        # also all models from the island
-        for model in self.island:
-            model.draw()
-        # and for the tree
-        for model in self.tree:
-            model.draw()
+        #Draw all models, also all models from the island and the tree
+        self.draw_models(self.models, self.island, self.tree, name='reflections')
 
 
     def draw(self, framebuffer=False):
@@ -82,36 +133,40 @@ class JungleScene(Scene):
         #When using a framebuffer, we do not update the camera to allow for arbitrary viewpoint.
         if not framebuffer:
             self.camera.update()
+            self.graph.update()
+        self.update_frame_uniforms()
 
         #First, the skybox and shadows are drawn and rendered
-        self.skybox.draw()
-        self.shadows.render(self)
+        with self.measure('skybox'):
+            self.skybox.draw()
+        with self.measure('shadows'):
+            self.shadows.render(self)
 
         # when rendering the framebuffer we ignore the reflective object
         if not framebuffer:
             #Update the appearance of the environment
-            self.environment.update(self)
-            self.monkey.draw()
-            #Draw the flattened cube used to simulate the environment for a reflective surface
-            self.flattened_cube.draw()
-            #Draw the shadow map after the reflections
-            self.show_shadow_map.draw()
-
-        #The models are then drawn
-        for model in self.models:
-            model.draw()
-        for model in self.island:
-            model.draw()
-        for model in self.tree:
-            model.draw()
+            with self.measure('environment'):
+                self.environment.update(self)
+            with self.measure('monkey'):
+                self.monkey.draw()
+            with self.measure('overlays'):
+                #Draw the flattened cube used to simulate the environment for a reflective surface
+                self.flattened_cube.draw()
+                #Draw the shadow map after the reflections
+                self.show_shadow_map.draw()
+
+        #The models are then drawn, including the island and the tree, sorted by state
+        with self.measure('models'):
+            self.draw_models(self.models, self.island, self.tree)
         #With the light drawn after
-        self.show_light.draw()
+        with self.measure('light'):
+            self.show_light.draw()
 
         #Once this is done, the displayed frame is flipped
         #Essentially, this means the frame we are drawing on is displayed, and the previously displayed frame is now used for drawing again
         #This prevents viewing of the drawing process
         if not framebuffer:
-            pygame.display.flip()
+            self.present()
 
     def keyboard(self, event):
         '''
@@ -134,10 +189,10 @@ class JungleScene(Scene):
                 self.show_shadow_map.visible = True
 
         if event.key == pygame.K_1: #If 1 is pressed, translate the  monkey upwards
-            self.monkey.M=np.matmul(translationMatrix([0,1,0]), self.monkey.M)
+            self.monkey_node.local=np.matmul(translationMatrix([0,1,0]), self.monkey_node.local)
 
         if event.key == pygame.K_2: #If 2 is pressed, rotate the monkey around the X axis
-            self.monkey.M=np.matmul(rotationMatrixX(1), self.monkey.M)
+            self.monkey_node.local=np.matmul(rotationMatrixX(1), self.monkey_node.local)
 
 
 if __name__ == '__main__':
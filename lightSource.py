@@ -15,9 +15,10 @@ class LightSource:
         :param visible: Whether the light should be represented as a sphere in the scene (default: False)
         '''
         self.position = np.array(position, 'f')
-        self.Ia = Ia
-        self.Id = Id
-        self.Is = Is
+        #Colours are stored as float32 arrays once, so that they can be uploaded to the shaders as they are
+        self.Ia = np.array(Ia, 'f')
+        self.Id = np.array(Id, 'f')
+        self.Is = np.array(Is, 'f')
 
     def update(self, position=None):
         '''
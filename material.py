@@ -1,15 +1,20 @@
+import numpy as np
+
+
 class Material:
     def __init__(self, name=None, Ka=[1.,1.,1.], Kd=[1.,1.,1.], Ks=[1.,1.,1.], Ns=10.0, texture=None):
         self.name = name
-        self.Ka = Ka
-        self.Kd = Kd
-        self.Ks = Ks
+        #Colours are stored as float32 arrays once, so that they can be uploaded to the shaders as they are
+        self.Ka = np.array(Ka, 'f')
+        self.Kd = np.array(Kd, 'f')
+        self.Ks = np.array(Ks, 'f')
         self.Ns = Ns
         self.texture = texture
         self.alpha = 1.0
 
 class MaterialLibrary:
-    def __init__(self):
+    def __init__(self, file_name=None):
+        self.file_name = file_name
         self.materials = []
         self.names = {}
 
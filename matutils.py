@@ -5,8 +5,8 @@ def scaleMatrix(scale):
     ''' Create a scalar vector based on a single value '''
     if np.isscalar(scale):
         scale = [scale, scale, scale]
-    scale.append(1)
-    return np.diag(scale)
+    #Copy the scale factors, appending to the list given would change it for the caller (eg. a default argument)
+    return np.diag(list(scale) + [1])
 
 
 def translationMatrix(t):
@@ -67,6 +67,121 @@ def poseMatrix(position=[0,0,0], orientation=0, scale=1):
     return np.matmul(np.matmul(T,R),S)
 
 
+#Batched versions of the functions above, building (N, 4, 4) float32 stacks of matrices from arrays of parameters.
+#They all take an optional out array of that shape to write into, so that matrices updated every frame (camera,
+#instances) do not need a new array each time.
+def matrixStack(number, out=None):
+    ''' Returns out, or a new (number, 4, 4) float32 array, after checking its shape '''
+    if out is None:
+        return np.empty((number, 4, 4), dtype='f')
+    if out.shape != (number, 4, 4):
+        raise ValueError('(E) Error in matrixStack(): expected an output array of shape {}, found {}'.format((number, 4, 4), out.shape))
+    return out
+
+
+def axisRotations(angles, axis):
+    ''' Returns the (N, 3, 3) rotations around one axis, with the conventions of rotationMatrixX/Y/Z '''
+    c = np.cos(angles)
+    s = np.sin(angles)
+    R = np.zeros((len(angles), 3, 3))
+    (i, j) = {'X': (1, 2), 'Y': (0, 2), 'Z': (0, 1)}[axis]
+    R[:, i, i] = c
+    R[:, i, j] = s
+    R[:, j, i] = -s
+    R[:, j, j] = c
+    R[:, 3 - i - j, 3 - i - j] = 1.
+    return R
+
+
+def eulerRotations(angles, order='XYZ'):
+    '''
+    Returns the (N, 3, 3) rotations given by Euler angles.
+    :param angles: a (N, 3) array of the angles around the X, Y and Z axes
+    :param order: the order in which the rotations around each axis are multiplied, eg. 'XYZ' for
+    rotationMatrixX(x)*rotationMatrixY(y)*rotationMatrixZ(z), which rotates around Z first
+    '''
+    angles = np.asarray(angles, dtype='f8').reshape(-1, 3)
+    R = None
+    for axis in order:
+        rotation = axisRotations(angles[:, 'XYZ'.index(axis)], axis)
+        R = rotation if R is None else np.matmul(R, rotation)
+    return R
+
+
+def quaternionRotations(quaternions):
+    '''
+    Returns the (N, 3, 3) rotations given by quaternions.
+    :param quaternions: a (N, 4) array of quaternions (x, y, z, w), normalised here. A quaternion of angle a around
+    the Y axis gives rotationMatrixY(a), but around the X and Z axes it gives rotationMatrixX(-a) and
+    rotationMatrixZ(-a), whose angles turn the other way.
+    '''
+    q = np.asarray(quaternions, dtype='f8').reshape(-1, 4)
+    q = q/np.linalg.norm(q, axis=1)[:, None]
+    (x, y, z, w) = q.T
+    R = np.empty((q.shape[0], 3, 3))
+    R[:, 0, 0] = 1. - 2.*(y*y + z*z)
+    R[:, 0, 1] = 2.*(x*y - z*w)
+    R[:, 0, 2] = 2.*(x*z + y*w)
+    R[:, 1, 0] = 2.*(x*y + z*w)
+    R[:, 1, 1] = 1. - 2.*(x*x + z*z)
+    R[:, 1, 2] = 2.*(y*z - x*w)
+    R[:, 2, 0] = 2.*(x*z - y*w)
+    R[:, 2, 1] = 2.*(y*z + x*w)
+    R[:, 2, 2] = 1. - 2.*(x*x + y*y)
+    return R
+
+
+def poseMatrices(positions=None, angles=None, scales=None, quaternions=None, order='XYZ', number=None, out=None):
+    '''
+    Returns the TRS matrices of several poses, like poseMatrix() but with any rotation.
+    :param positions: [optional] a (N, 3) array of positions, the origin by default
+    :param angles: [optional] a (N, 3) array of Euler angles around the X, Y and Z axes (see eulerRotations())
+    :param scales: [optional] a (N,) array of uniform scale factors or a (N, 3) array of scale factors per axis
+    :param quaternions: [optional] a (N, 4) array of quaternions (see quaternionRotations()), instead of angles
+    :param order: the order of the Euler rotations
+    :param number: the number of matrices, only needed if no parameter is given
+    :param out: [optional] the (N, 4, 4) array to write the matrices into
+    :return: a (N, 4, 4) float32 array
+    '''
+    if angles is not None and quaternions is not None:
+        raise ValueError('(E) Error in poseMatrices(): give either angles or quaternions')
+    for array in [positions, angles, quaternions, scales]:
+        if number is None and array is not None:
+            number = len(array)
+    if number is None:
+        raise ValueError('(E) Error in poseMatrices(): the number of matrices is needed when no parameter is given')
+    M = matrixStack(number, out)
+    if angles is not None:
+        R = eulerRotations(angles, order)
+    elif quaternions is not None:
+        R = quaternionRotations(quaternions)
+    else:
+        R = np.identity(3)
+    #Scaling first multiplies the columns of the rotation
+    if scales is not None:
+        R = R*np.asarray(scales, dtype='f8').reshape(number, -1)[:, None, :]
+    M[:, :3, :3] = R
+    M[:, :3, 3] = 0. if positions is None else np.asarray(positions).reshape(number, 3)
+    M[:, 3, :3] = 0.
+    M[:, 3, 3] = 1.
+    return M
+
+
+def translationMatrices(positions, out=None):
+    ''' Returns the (N, 4, 4) translation matrices of a (N, 3) array of positions '''
+    return poseMatrices(positions=positions, out=out)
+
+
+def rotationMatrices(angles, order='XYZ', out=None):
+    ''' Returns the (N, 4, 4) rotation matrices of a (N, 3) array of Euler angles (see eulerRotations()) '''
+    return poseMatrices(angles=angles, order=order, out=out)
+
+
+def scaleMatrices(scales, out=None):
+    ''' Returns the (N, 4, 4) scale matrices of a (N,) or (N, 3) array of scale factors '''
+    return poseMatrices(scales=scales, out=out)
+
+
 def orthoMatrix(l,r,t,b,n,f):
     '''
     Returns an orthographic projection matrix
@@ -9,13 +9,15 @@ class Mesh:
     Simple class to hold a mesh data. For now we will only focus on vertices, faces (indices of vertices for each face)
     and normals.
     '''
-    def __init__(self, vertices=None, faces=None, normals=None, textureCoords=None, material=Material()):
+    def __init__(self, vertices=None, faces=None, normals=None, textureCoords=None, material=Material(), tangents=None, binormals=None):
         '''
         Initialises a mesh object.
         :param vertices: A numpy array containing all vertices
         :param faces: [optional] An int array containing the vertex indices for all faces.
         :param normals: [optional] An array of normal vectors, calculated from the faces if not provided.
         :param material: [optional] An object containing the material information for this object
+        :param tangents: [optional] An array of tangent vectors, only used when the normals are provided
+        :param binormals: [optional] An array of binormal vectors, only used when the normals are provided
         '''
         #Store all information relevant to the mesh
         self.name = 'Unknown'
@@ -27,6 +29,13 @@ class Mesh:
         self.textures = []
         self.tangents = None
         self.binormals = None
+        #Coarser levels of detail, as face arrays indexing the same vertices, the fraction of the faces each one
+        #keeps and how far each one moves the surface (see simplify.generate_lods)
+        self.lods = []
+        self.lod_ratios = ()
+        self.lod_errors = []
+        #Whether the faces and vertices were reordered for the vertex cache (see meshOptimizer.optimize_mesh)
+        self.optimized = False
         #Create a mesh from the set of inputted vertices
         if vertices is not None:
             print('Creating mesh')
@@ -41,41 +50,90 @@ class Mesh:
                 self.calculate_normals()
         else:
             self.normals = normals
+            self.tangents = tangents
+            self.binormals = binormals
         #If a texture is supplied, apply it
         if material.texture is not None:
-            self.textures.append(Texture(material.texture))
+            self.textures.append(Texture(material.texture, mipmaps=True))
 
 
-    def calculate_normals(self):
-        ''' Method to calculate normals from the mesh faces '''
-        #Create an array of empty matrices for the normals
-        self.normals = np.zeros((self.vertices.shape[0], 3), dtype='f')
-        #If there are texture co-ordinates, create an array of empty matrices for the binormals and tangents as well
-        if self.textureCoords is not None:
-            self.tangents = np.zeros((self.vertices.shape[0], 3), dtype='f')
-            self.binormals = np.zeros((self.vertices.shape[0], 3), dtype='f')
-        for f in range(self.faces.shape[0]):
-            #Calculate the face normal using the cross product of the triangle's sides
-            a = self.vertices[self.faces[f, 1]] - self.vertices[self.faces[f, 0]]
-            b = self.vertices[self.faces[f, 2]] - self.vertices[self.faces[f, 0]]
-            face_normal = np.cross(a, b)
-            #Calculate the tangents and binormals by using the previously calculated normals 
-            if self.textureCoords is not None:
-                txa = self.textureCoords[self.faces[f, 1], :] - self.textureCoords[self.faces[f, 0], :]
-                txb = self.textureCoords[self.faces[f, 2], :] - self.textureCoords[self.faces[f, 2], :]
-                face_tangent = txb[0]*a - txa[0]*b
-                face_binormal = -txb[1]*a + txa[1]*b
-            #Blend the normal on all 3 vertices
-            for j in range(3):
-                self.normals[self.faces[f, j], :] += face_normal
-                if self.textureCoords is not None:
-                    self.tangents[self.faces[f, j], :] += face_tangent
-                    self.binormals[self.faces[f, j], :] += face_binormal
-        #Finally, the vectors are normalised
-        self.normals /= np.linalg.norm(self.normals, axis=1, keepdims=True)
+    def calculate_normals(self, weighting='area'):
+        '''
+        Method to calculate normals from the mesh faces, and tangents and binormals if there are texture co-ordinates.
+        The vectors of all faces are computed at once and then accumulated on their vertices.
+        The tangent points towards increasing u and the binormal towards increasing v, both are made orthogonal to the normal.
+        :param weighting: how faces are blended on each vertex: 'area' (by face area, the default), 'angle' (by the angle
+        of the face at that vertex) or 'uniform' (all faces count the same)
+        '''
+        faces = self.faces[:, :3].astype(np.intp)
+        #Calculate the face normals using the cross product of the triangles' sides, their length is twice the face area
+        corners = self.vertices[faces]
+        a = corners[:, 1] - corners[:, 0]
+        b = corners[:, 2] - corners[:, 0]
+        face_normals = np.cross(a, b)
+        weights = self.corner_weights(corners, weighting)
+        if weighting != 'area':
+            face_normals = normalize_rows(face_normals)
+        #Blend the normals on all 3 vertices of each face, and normalise them
+        self.normals = normalize_rows(scatter_to_vertices(face_normals, weights, faces, self.vertices.shape[0]))
+        #Calculate the tangents and binormals from the texture co-ordinates of each face
         if self.textureCoords is not None:
-            self.tangents /= np.linalg.norm(self.tangents, axis=1, keepdims=True)
-            self.binormals /= np.linalg.norm(self.binormals, axis=1, keepdims=True)
+            uv = self.textureCoords[faces]
+            txa = uv[:, 1] - uv[:, 0]
+            txb = uv[:, 2] - uv[:, 0]
+            #Solving [a b] = [T B] [txa txb] gives T and B multiplied by the determinant, we only keep its sign so that
+            #faces are weighted by their area in texture space (and faces with degenerate texture co-ordinates ignored)
+            det = np.sign(txa[:, 0]*txb[:, 1] - txb[:, 0]*txa[:, 1])[:, None]
+            face_tangents = det*(txb[:, 1, None]*a - txa[:, 1, None]*b)
+            face_binormals = det*(txa[:, 0, None]*b - txb[:, 0, None]*a)
+            if weighting != 'area':
+                face_tangents = normalize_rows(face_tangents)
+                face_binormals = normalize_rows(face_binormals)
+            tangents = scatter_to_vertices(face_tangents, weights, faces, self.vertices.shape[0])
+            binormals = scatter_to_vertices(face_binormals, weights, faces, self.vertices.shape[0])
+            #Make the tangent orthogonal to the normal (Gram-Schmidt), the binormal completes the basis with the handedness
+            #of the texture co-ordinates
+            self.tangents = normalize_rows(tangents - self.normals*np.sum(self.normals*tangents, axis=1, keepdims=True))
+            self.binormals = np.cross(self.normals, self.tangents)
+            self.binormals *= np.where(np.sum(self.binormals*binormals, axis=1, keepdims=True) < 0, -1, 1).astype('f')
+
+    @staticmethod
+    def corner_weights(corners, weighting):
+        '''
+        Returns the weight of each face on each of its 3 vertices.
+        :param corners: (faces, 3, 3) array of the positions of the corners of each face
+        :param weighting: 'area', 'angle' or 'uniform', see calculate_normals
+        '''
+        if weighting == 'angle':
+            #Angle between the two sides of the face that meet at each corner
+            a = normalize_rows(np.roll(corners, -1, axis=1) - corners)
+            b = normalize_rows(np.roll(corners, -2, axis=1) - corners)
+            return np.arccos(np.clip(np.sum(a*b, axis=2), -1, 1))
+        elif weighting == 'area' or weighting == 'uniform':
+            return np.ones(corners.shape[:2])
+        else:
+            raise ValueError('(E) Error in Mesh.calculate_normals(): unknown weighting {}'.format(weighting))
+
+
+def normalize_rows(vectors):
+    '''
+    Normalises each row of an array, rows of length 0 are left as they are.
+    '''
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return (vectors / np.where(norms > 0, norms, 1)).astype('f')
+
+
+def scatter_to_vertices(face_values, weights, faces, count):
+    '''
+    Accumulates one vector per face on the vertices of this face.
+    :param face_values: (faces, 3) array of the vectors of each face
+    :param weights: (faces, 3) array of the weight of each face on each of its vertices
+    :param faces: (faces, 3) array of vertex indices
+    :param count: the number of vertices
+    :return: a (count, 3) array
+    '''
+    values = face_values[:, None, :]*weights[:, :, None]
+    return np.stack([np.bincount(faces.ravel(), weights=values[:, :, k].ravel(), minlength=count) for k in range(3)], axis=1)
 
 
 class CubeMesh(Mesh):
@@ -0,0 +1,184 @@
+#Import hashlib and os to identify the source files
+import hashlib
+import os
+#Import numpy to store the arrays
+import numpy as np
+
+
+class MeshCache:
+    '''
+    Cache of the meshes loaded from Blender files, so that each .obj file is only parsed once.
+    Each source file gets one uncompressed .npz file holding the final arrays of all its meshes
+    (vertices, faces, normals, texture coordinates, tangents and binormals), their levels of detail if any were
+    generated (see simplify.py), whether they were reordered for the vertex cache (see meshOptimizer.py) and their
+    material names.
+
+    An entry is valid when it was written by the same version of the cache for the same source path and
+    size, and either the modification time or the content hash of the source file matches. Entries are
+    invalidated and rewritten otherwise. When the folder grows past max_bytes, entries whose source file
+    is gone are removed first, then the least recently used ones.
+    '''
+    version = 4
+    #Extension of the entries in the cache folder
+    extension = '.npz'
+    arrays = ['vertices', 'faces', 'normals', 'textureCoords', 'tangents', 'binormals']
+
+    def __init__(self, folder='cache', max_bytes=256*1024*1024, enabled=True):
+        '''
+        Initialises the cache
+        :param folder: the folder in which the compiled meshes are stored
+        :param max_bytes: the maximum size of the folder before entries are evicted
+        :param enabled: whether the cache is used at all
+        '''
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+
+    def path(self, file_name):
+        ''' Returns the name of the cache file for a given source file '''
+        source = os.path.abspath(file_name)
+        key = hashlib.sha1(source.encode('utf-8')).hexdigest()[:12]
+        return os.path.join(self.folder, '{}.{}{}'.format(os.path.basename(file_name), key, self.extension))
+
+    def key(self, file_name, content_hash=False):
+        '''
+        Returns the values identifying the current version of a source file.
+        :param content_hash: whether to also hash the content of the file (slower)
+        '''
+        stat = os.stat(file_name)
+        key = {
+            'version': self.version,
+            'source': os.path.abspath(file_name),
+            'size': stat.st_size,
+            'mtime': stat.st_mtime_ns,
+        }
+        if content_hash:
+            with open(file_name, 'rb') as source:
+                key['hash'] = hashlib.sha1(source.read()).hexdigest()
+        return key
+
+    def load(self, file_name):
+        '''
+        Loads the meshes of a source file from the cache.
+        :return: a tuple (library, records) where library is the material library file and records a list of
+        dictionaries holding the arrays and material name of each mesh, or None if there is no valid entry.
+        '''
+        if not self.enabled:
+            return None
+        path = self.path(file_name)
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as data:
+                entry = {name: data[name] for name in data.files}
+        except Exception as e:
+            print('(W) Warning, could not read mesh cache {}: {}'.format(path, e))
+            return None
+
+        key = self.key(file_name)
+        if entry['version'] != key['version'] or str(entry['source']) != key['source'] or entry['size'] != key['size']:
+            return None
+        if entry['mtime'] != key['mtime']:
+            #The file was touched, check whether its content actually changed
+            key = self.key(file_name, content_hash=True)
+            if str(entry['hash']) != key['hash']:
+                return None
+            entry.update(key)
+            self.write(path, entry)
+
+        #Mark the entry as recently used for eviction
+        os.utime(path)
+        print('Loaded {} mesh(es) from cache: {}'.format(int(entry['count']), path))
+
+        records = []
+        for i in range(int(entry['count'])):
+            record = {'material': str(entry['mesh{}_material'.format(i)])}
+            for name in self.arrays:
+                record[name] = entry.get('mesh{}_{}'.format(i, name))
+            record['lod_ratios'] = tuple([float(ratio) for ratio in entry.get('mesh{}_lod_ratios'.format(i), [])])
+            record['lods'] = [entry['mesh{}_lod{}'.format(i, level)] for level in range(len(record['lod_ratios']))]
+            record['lod_errors'] = [float(error) for error in entry.get('mesh{}_lod_errors'.format(i), [])]
+            record['optimized'] = bool(entry.get('mesh{}_optimized'.format(i), False))
+            records.append(record)
+        return str(entry['library']), records
+
+    def store(self, file_name, library, meshes):
+        '''
+        Stores the meshes loaded from a source file in the cache.
+        :param library: the material library file used by the meshes
+        :param meshes: the list of meshes loaded from the file
+        '''
+        if not self.enabled:
+            return
+        entry = self.key(file_name, content_hash=True)
+        entry['library'] = library
+        entry['count'] = len(meshes)
+        for (i, mesh) in enumerate(meshes):
+            entry['mesh{}_material'.format(i)] = mesh.material.name
+            for name in self.arrays:
+                if getattr(mesh, name) is not None:
+                    entry['mesh{}_{}'.format(i, name)] = getattr(mesh, name)
+            entry['mesh{}_lod_ratios'.format(i)] = np.array(mesh.lod_ratios, dtype='f8')
+            entry['mesh{}_lod_errors'.format(i)] = np.array(mesh.lod_errors, dtype='f8')
+            for (level, faces) in enumerate(mesh.lods):
+                entry['mesh{}_lod{}'.format(i, level)] = faces
+            entry['mesh{}_optimized'.format(i)] = mesh.optimized
+
+        os.makedirs(self.folder, exist_ok=True)
+        self.write(self.path(file_name), entry)
+        self.evict()
+
+    def write(self, path, entry):
+        ''' Writes an entry to a temporary file first, so that an interrupted write never leaves a corrupt entry '''
+        temporary = path + '.tmp'
+        with open(temporary, 'wb') as file:
+            np.savez(file, **entry)
+        os.replace(temporary, path)
+
+    def source(self, path):
+        ''' Returns the source file of an entry, or None if the entry cannot be read '''
+        try:
+            with np.load(path) as data:
+                return str(data['source'])
+        except Exception:
+            return None
+
+    def evict(self):
+        '''
+        Removes the entries whose source file no longer exists, then the least recently used ones
+        until the cache folder fits in max_bytes.
+        '''
+        entries = []
+        for name in os.listdir(self.folder):
+            if not name.endswith(self.extension):
+                continue
+            path = os.path.join(self.folder, name)
+            source = self.source(path)
+            if source is None or not os.path.exists(source):
+                print('Evicting cache entry {}'.format(path))
+                os.remove(path)
+                continue
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum([size for (_, size, _) in entries])
+        for (_, size, path) in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            print('Evicting cache entry {}'.format(path))
+            os.remove(path)
+            total -= size
+
+    def clear(self, file_name=None):
+        '''
+        Removes the entry of a source file, or all entries if no file is given.
+        '''
+        if file_name is not None:
+            paths = [self.path(file_name)]
+        elif os.path.isdir(self.folder):
+            paths = [os.path.join(self.folder, name) for name in os.listdir(self.folder) if name.endswith(self.extension)]
+        else:
+            paths = []
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
@@ -0,0 +1,165 @@
+#Import collections for the simulated vertex cache
+import collections
+#Import numpy for the index arrays
+import numpy as np
+
+
+#Number of vertices the post-transform cache is assumed to hold, for reordering and for the statistics
+cache_size = 16
+
+
+def cache_misses(faces, size=cache_size):
+    '''
+    Simulates a FIFO post-transform vertex cache over the indices of a mesh.
+    :return: the number of vertices transformed, ie. the indices that missed the cache
+    '''
+    cache = collections.deque()
+    cached = set()
+    misses = 0
+    for index in faces.ravel().tolist():
+        if index in cached:
+            continue
+        misses += 1
+        cache.append(index)
+        cached.add(index)
+        if len(cache) > size:
+            cached.discard(cache.popleft())
+    return misses
+
+
+def acmr(faces, size=cache_size):
+    ''' Average cache miss ratio: the vertices transformed per triangle, from 3 (no reuse) down to about 0.5 '''
+    return cache_misses(faces, size)/float(max(faces.shape[0], 1))
+
+
+def atvr(faces, size=cache_size):
+    ''' Average transform to vertex ratio: the vertices transformed per vertex used, 1 being optimal '''
+    return cache_misses(faces, size)/float(max(len(np.unique(faces)), 1))
+
+
+def tipsify(faces, vertex_count, size=cache_size):
+    '''
+    Reorders triangles for the post-transform vertex cache with the Tipsify algorithm (Sander, Nehab and Barczak,
+    2007): the triangles around a fanning vertex are emitted together, and the next fanning vertex is the one among
+    the vertices just emitted that will still be in the cache, preferring the oldest ones.
+    :param faces: the (F, 3) array of the triangles
+    :param vertex_count: the number of vertices
+    :param size: the size of the cache
+    :return: a tuple (order, clusters) where order gives the triangles in their new order, and clusters the positions
+    in the new order at which the algorithm had to jump to a vertex that was not in the cache
+    '''
+    faces = np.asarray(faces, dtype=np.int64)
+    triangle_count = faces.shape[0]
+    corners = faces.ravel()
+    #Triangles around each vertex, in compressed rows
+    adjacency = (np.argsort(corners, kind='stable')//3).tolist()
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(corners, minlength=vertex_count))]).tolist()
+    live = np.bincount(corners, minlength=vertex_count).tolist()
+    triangles = faces.tolist()
+    cache_time = [0]*vertex_count
+    emitted = [False]*triangle_count
+    dead_end = []
+    order = []
+    clusters = [0]
+    timestamp = size + 1
+    cursor = 0
+    fanning = 0
+    while fanning >= 0:
+        candidates = []
+        for triangle in adjacency[offsets[fanning]:offsets[fanning + 1]]:
+            if emitted[triangle]:
+                continue
+            emitted[triangle] = True
+            order.append(triangle)
+            for vertex in triangles[triangle]:
+                dead_end.append(vertex)
+                candidates.append(vertex)
+                live[vertex] -= 1
+                if timestamp - cache_time[vertex] > size:
+                    cache_time[vertex] = timestamp
+                    timestamp += 1
+        #Next fanning vertex: the oldest candidate that will still be in the cache once its triangles are emitted
+        fanning = -1
+        best = -1
+        for vertex in candidates:
+            if live[vertex] > 0:
+                priority = 0
+                if timestamp - cache_time[vertex] + 2*live[vertex] <= size:
+                    priority = timestamp - cache_time[vertex]
+                if priority > best:
+                    best = priority
+                    fanning = vertex
+        if fanning >= 0 or len(order) == triangle_count:
+            continue
+        #Dead end: go back to a recently emitted vertex, or to the next vertex with triangles left
+        while len(dead_end) > 0 and fanning < 0:
+            vertex = dead_end.pop()
+            if live[vertex] > 0:
+                fanning = vertex
+        while fanning < 0 and cursor < vertex_count:
+            if live[cursor] > 0:
+                fanning = cursor
+            cursor += 1
+        if fanning >= 0:
+            clusters.append(len(order))
+    return np.array(order, dtype=np.int64), clusters
+
+
+def order_clusters(vertices, faces, clusters):
+    '''
+    Orders clusters of triangles so that the ones facing outwards from the center of the mesh come first, as they
+    are the most likely to hide the others, which reduces overdraw whatever the view (Sander et al.).
+    :param vertices: the (V, 3) array of the vertex positions
+    :param faces: the (F, 3) array of the triangles, in the order of the clusters
+    :param clusters: the positions at which each cluster starts
+    :return: the order of the triangles
+    '''
+    corners = vertices[faces]
+    normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+    areas = np.linalg.norm(normals, axis=1)
+    centers = corners.mean(axis=1)
+    center = np.sum(centers*areas[:, None], axis=0)/max(np.sum(areas), 1e-12)
+    starts = np.array(clusters, dtype=np.int64)
+    #Area weighted center and normal of each cluster
+    weight = np.maximum(np.add.reduceat(areas, starts), 1e-12)
+    cluster_centers = np.add.reduceat(centers*areas[:, None], starts, axis=0)/weight[:, None]
+    cluster_normals = np.add.reduceat(normals, starts, axis=0)
+    cluster_normals /= np.maximum(np.linalg.norm(cluster_normals, axis=1), 1e-12)[:, None]
+    occlusion = np.sum((cluster_centers - center)*cluster_normals, axis=1)
+    ends = np.append(starts[1:], faces.shape[0])
+    return np.concatenate([np.arange(starts[c], ends[c]) for c in np.argsort(-occlusion, kind='stable')])
+
+
+def optimize_mesh(mesh, size=cache_size, overdraw_faces=1000, cluster_faces=64):
+    '''
+    Reorders the triangles of a mesh for the post-transform vertex cache (see tipsify()), then its vertices in the
+    order in which the triangles first use them, for the locality of vertex fetches. The levels of detail of the mesh
+    are reordered as well.
+    :param overdraw_faces: the number of faces from which the clusters of triangles are also ordered to reduce
+    overdraw (see order_clusters())
+    :param cluster_faces: the smallest number of faces of a cluster ordered for overdraw, smaller clusters are merged
+    with the next ones, which keeps the vertex cache locality
+    '''
+    if mesh.faces is None or mesh.faces.shape[1] != 3 or mesh.faces.shape[0] == 0:
+        return
+    vertex_count = mesh.vertices.shape[0]
+    (order, clusters) = tipsify(mesh.faces, vertex_count, size)
+    faces = mesh.faces[order]
+    if faces.shape[0] >= overdraw_faces:
+        starts = [0]
+        for start in clusters[1:]:
+            if start - starts[-1] >= cluster_faces:
+                starts.append(start)
+        faces = faces[order_clusters(mesh.vertices, faces, starts)]
+    #New position of each vertex: in order of first use, unused vertices last
+    (used, first) = np.unique(faces.ravel(), return_index=True)
+    unused = np.setdiff1d(np.arange(vertex_count), used)
+    permutation = np.concatenate([used[np.argsort(first, kind='stable')], unused])
+    remap = np.empty(vertex_count, dtype=np.int64)
+    remap[permutation] = np.arange(vertex_count)
+    for name in ['vertices', 'normals', 'colors', 'textureCoords', 'tangents', 'binormals']:
+        if getattr(mesh, name) is not None:
+            setattr(mesh, name, getattr(mesh, name)[permutation])
+    mesh.faces = remap[faces].astype(mesh.faces.dtype)
+    mesh.lods = [remap[lod][tipsify(remap[lod], vertex_count, size)[0]].astype(lod.dtype) for lod in mesh.lods]
+    mesh.optimized = True
@@ -0,0 +1,131 @@
+#Import ctypes to call the EGL and OSMesa functions
+import ctypes
+#Imports all openGL functions
+from OpenGL.GL import *
+import OpenGL.platform
+#Import numpy to return the frames as arrays
+import numpy as np
+#Import the framebuffer class to render offscreen
+from framebuffer import Framebuffer
+
+'''
+Headless OpenGL contexts, used to render scenes without a window (eg. on servers without a display).
+PyOpenGL loads its functions from the platform selected when OpenGL is first imported, so the environment
+variable PYOPENGL_PLATFORM must be set to 'egl' or 'osmesa' before importing any module of this project, eg.
+    PYOPENGL_PLATFORM=egl python benchmark.py
+Mesa's software rasteriser (llvmpipe) is enough for both.
+'''
+
+#EGL_PLATFORM_SURFACELESS_MESA, from the EGL_MESA_platform_surfaceless extension
+EGL_PLATFORM_SURFACELESS_MESA = 0x31DD
+
+#Name of the PyOpenGL platform class required by each backend
+platforms = {
+    'egl': 'EGLPlatform',
+    'osmesa': 'OSMesaPlatform',
+}
+
+
+class EGLContext:
+    '''
+    OpenGL context created through EGL without any surface, the scene renders to a framebuffer object.
+    '''
+    def __init__(self):
+        from OpenGL import EGL
+        self.EGL = EGL
+        #Use Mesa's surfaceless platform if available, which does not need any display or GPU
+        extensions = EGL.eglQueryString(EGL.EGL_NO_DISPLAY, EGL.EGL_EXTENSIONS) or b''
+        if b'EGL_MESA_platform_surfaceless' in extensions:
+            from OpenGL.EGL.EXT.platform_base import eglGetPlatformDisplayEXT
+            self.display = eglGetPlatformDisplayEXT(EGL_PLATFORM_SURFACELESS_MESA, None, None)
+        else:
+            self.display = EGL.eglGetDisplay(EGL.EGL_DEFAULT_DISPLAY)
+        major = EGL.EGLint()
+        minor = EGL.EGLint()
+        EGL.eglInitialize(self.display, ctypes.pointer(major), ctypes.pointer(minor))
+        print('Initialised EGL {}.{}'.format(major.value, minor.value))
+        #Choose a configuration for desktop OpenGL (without any window), the buffers themselves are in the framebuffer object
+        attributes = (EGL.EGLint * 5)(EGL.EGL_SURFACE_TYPE, EGL.EGL_PBUFFER_BIT, EGL.EGL_RENDERABLE_TYPE, EGL.EGL_OPENGL_BIT, EGL.EGL_NONE)
+        config = EGL.EGLConfig()
+        count = EGL.EGLint()
+        EGL.eglChooseConfig(self.display, attributes, ctypes.pointer(config), 1, ctypes.pointer(count))
+        if count.value == 0:
+            raise RuntimeError('(E) Error: no EGL configuration supports desktop OpenGL')
+        EGL.eglBindAPI(EGL.EGL_OPENGL_API)
+        self.context = EGL.eglCreateContext(self.display, config, EGL.EGL_NO_CONTEXT, None)
+        EGL.eglMakeCurrent(self.display, EGL.EGL_NO_SURFACE, EGL.EGL_NO_SURFACE, self.context)
+
+    def release(self):
+        self.EGL.eglMakeCurrent(self.display, self.EGL.EGL_NO_SURFACE, self.EGL.EGL_NO_SURFACE, self.EGL.EGL_NO_CONTEXT)
+        self.EGL.eglDestroyContext(self.display, self.context)
+        self.EGL.eglTerminate(self.display)
+
+
+class OSMesaContext:
+    '''
+    OpenGL context created through OSMesa, rendering in main memory. OSMesa requires a colour buffer to make the
+    context current, but the scene still renders to a framebuffer object.
+    '''
+    def __init__(self, width, height):
+        from OpenGL import osmesa
+        self.osmesa = osmesa
+        self.context = osmesa.OSMesaCreateContextExt(osmesa.OSMESA_RGBA, 24, 0, 0, None)
+        if not self.context:
+            raise RuntimeError('(E) Error: could not create the OSMesa context')
+        self.buffer = (ctypes.c_ubyte * (width * height * 4))()
+        if not osmesa.OSMesaMakeCurrent(self.context, self.buffer, GL_UNSIGNED_BYTE, width, height):
+            raise RuntimeError('(E) Error: could not make the OSMesa context current')
+
+    def release(self):
+        self.osmesa.OSMesaDestroyContext(self.context)
+
+
+def create_context(backend, width, height):
+    '''
+    Creates and makes current a headless OpenGL context.
+    :param backend: 'egl' or 'osmesa'
+    :param width: the width of the frames that will be rendered
+    :param height: the height of the frames that will be rendered
+    '''
+    if backend not in platforms:
+        raise ValueError('(E) Error: unknown headless backend {}, expected one of {}'.format(backend, list(platforms)))
+    platform = OpenGL.platform.PLATFORM.__class__.__name__
+    if platform != platforms[backend]:
+        raise RuntimeError('(E) Error: the {} backend needs PyOpenGL to use the {} platform, found {}. '
+                           'Set PYOPENGL_PLATFORM={} before starting Python.'.format(backend, platforms[backend], platform, backend))
+    if backend == 'egl':
+        context = EGLContext()
+    else:
+        context = OSMesaContext(width, height)
+    print('Headless OpenGL context: {} ({})'.format(glGetString(GL_VERSION).decode(), glGetString(GL_RENDERER).decode()))
+    return context
+
+
+class RenderTarget:
+    '''
+    Offscreen colour and depth buffers that replace the window of the scene.
+    '''
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.fbo = Framebuffer()
+        self.fbo.bind()
+        self.color = self.fbo.attach_renderbuffer(GL_COLOR_ATTACHMENT0, GL_RGBA8, width, height)
+        self.depth = self.fbo.attach_renderbuffer(GL_DEPTH_ATTACHMENT, GL_DEPTH_COMPONENT24, width, height)
+        status = glCheckFramebufferStatus(GL_FRAMEBUFFER)
+        if status != GL_FRAMEBUFFER_COMPLETE:
+            raise RuntimeError('(E) Error: offscreen framebuffer is incomplete (status {})'.format(status))
+        #Every pass that unbinds its own framebuffer will now return to this one
+        Framebuffer.default = self.fbo.fbo
+        self.fbo.bind()
+
+    def read(self):
+        '''
+        Reads the last rendered frame back from the GPU.
+        :return: a (height, width, 4) uint8 RGBA array, with the first row at the top of the image
+        '''
+        glBindFramebuffer(GL_READ_FRAMEBUFFER, self.fbo.fbo)
+        glPixelStorei(GL_PACK_ALIGNMENT, 1)
+        data = glReadPixels(0, 0, self.width, self.height, GL_RGBA, GL_UNSIGNED_BYTE)
+        glBindFramebuffer(GL_READ_FRAMEBUFFER, Framebuffer.default)
+        return np.frombuffer(data, dtype=np.uint8).reshape(self.height, self.width, 4)[::-1]
@@ -0,0 +1,120 @@
+#Import ctypes for the offsets of the index ranges
+import ctypes
+#Imports all openGL functions
+from OpenGL.GL import *
+#Import helper functions
+from matutils import *
+#Import the base model class
+from BaseModel import BaseModel
+#Import the state tracking of the render queue
+from renderQueue import bind_vertex_array, bind_texture, drawing
+from frameTimer import count
+from frustum import bounding_box
+
+
+class PackedModel(BaseModel):
+    '''
+    Model drawing all the sub-meshes of an object (eg. the material groups of an .obj file) from one interleaved
+    vertex buffer and one index buffer (see VertexLayout), in a single vertex array. Sub-meshes sharing the same
+    material and textures are submitted together with glMultiDrawElementsBaseVertex, so that the object costs one
+    draw call per material instead of one per sub-mesh. Indices stay local to each sub-mesh and are offset by the
+    base vertex, which also lets large objects use 16 bit indices.
+    The levels of detail of the meshes (see simplify.py) follow in the index buffer, and are selected for the whole
+    object at once from the largest error of its meshes (see BaseModel.select_level()); meshes with fewer levels use
+    their coarsest one.
+    '''
+    def __init__(self, scene, M, meshes, name=None, shader=None, visible=True, layout=None):
+        '''
+        Initialises the model data
+        :param meshes: the list of triangle meshes drawn by the model
+        :param layout: [optional] the VertexLayout of the vertex buffer, float32 attributes if not provided
+        '''
+        BaseModel.__init__(self, scene=scene, M=M, mesh=meshes[0], visible=visible, layout=layout)
+        if name is not None:
+            self.name = name
+        for mesh in meshes:
+            if mesh.faces is None or mesh.faces.shape[1] != 3:
+                raise ValueError('(E) Error in PackedModel.__init__(): all meshes must be indexed triangle meshes')
+        #Group the meshes by material and textures, keeping the order in which the materials first appear
+        self.groups = []
+        keys = {}
+        for mesh in meshes:
+            key = (id(mesh.material), tuple([id(texture) for texture in mesh.textures]))
+            if key not in keys:
+                keys[key] = len(self.groups)
+                self.groups.append({'mesh': mesh, 'meshes': []})
+            self.groups[keys[key]]['meshes'].append(mesh)
+        self.meshes = [mesh for group in self.groups for mesh in group['meshes']]
+        self.bind()
+        if shader is not None:
+            self.bind_shader(shader)
+
+    def bind(self):
+        '''
+        Packs the vertex arrays of all meshes in one interleaved buffer, and their faces in one index buffer.
+        Attributes present in any mesh are stored for all of them, missing arrays are filled with zeros.
+        '''
+        glBindVertexArray(self.vao)
+        self.vbos['vertices'], self.attributes, self.buffer_bytes['vertices'] = self.layout.create_vertex_buffer(self.meshes)
+        #Faces of each level of detail of each mesh, level by level
+        levels = max([len(mesh.lods) for mesh in self.meshes]) + 1
+        faces = [[mesh.faces] + list(mesh.lods) for mesh in self.meshes]
+        faces = [[lods[min(level, len(lods) - 1)] for lods in faces] for level in range(levels)]
+        errors = [[0.] + list(mesh.lod_errors) for mesh in self.meshes]
+        self.lod_errors = [max([mesh_errors[min(level, len(mesh_errors) - 1)] for mesh_errors in errors]) for level in range(levels)]
+        self.index_buffer, self.index_type, itemsize, self.buffer_bytes['indices'] = self.layout.create_index_buffer([array for level in faces for array in level])
+        glBindVertexArray(0)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+        #Index ranges of each mesh and level: number of indices, offset in bytes in the index buffer and base vertex
+        index = 0
+        ranges = {}
+        for level in range(levels):
+            start = index*itemsize
+            vertex = 0
+            for (mesh, array) in zip(self.meshes, faces[level]):
+                ranges[(id(mesh), level)] = (array.size, index*itemsize, vertex)
+                index += array.size
+                vertex += mesh.vertices.shape[0]
+            self.levels.append((sum([array.size for array in faces[level]]), start))
+        for group in self.groups:
+            group['levels'] = []
+            for level in range(levels):
+                group_ranges = [ranges[(id(mesh), level)] for mesh in group['meshes']]
+                group['levels'].append({
+                    'counts': np.array([number for (number, _, _) in group_ranges], dtype=np.int32),
+                    'offsets': (ctypes.c_void_p * len(group_ranges))(*[offset for (_, offset, _) in group_ranges]),
+                    'bases': np.array([base for (_, _, base) in group_ranges], dtype=np.int32),
+                })
+        self.vertex_count = vertex
+        self.index_count = self.levels[0][0]
+        self.bounds = bounding_box(np.vstack([mesh.vertices for mesh in self.meshes]))
+
+    def draw(self, Mp=None):
+        '''
+        Draws all meshes of the model, with one draw call per material.
+        Mp refers to the model matrix of the parent object, for composite objects.
+        '''
+        if not self.visible:
+            return
+        bind_vertex_array(self.vao)
+        M = self.pass_matrix(Mp)
+        self.level = self.select_level(M)
+        shader = self.pass_shader()
+        for group in self.groups:
+            #The shaders read the material and textures of model.mesh
+            self.mesh = group['mesh']
+            shader.bind(model=self, M=M)
+            for unit, tex in enumerate(self.mesh.textures):
+                bind_texture(unit, tex)
+            ranges = group['levels'][self.level]
+            if len(ranges['counts']) == 1:
+                glDrawElementsBaseVertex(self.primitive, int(ranges['counts'][0]), self.index_type, ctypes.c_void_p(ranges['offsets'][0]), int(ranges['bases'][0]))
+            else:
+                glMultiDrawElementsBaseVertex(self.primitive, ranges['counts'], self.index_type, ranges['offsets'], len(ranges['counts']), ranges['bases'])
+            count('draw calls')
+            count('triangles', int(np.sum(ranges['counts']))//3)
+        self.mesh = self.groups[0]['mesh']
+        #Unbind the vertex array to avoid side effects, unless the render queue draws another model next
+        if not drawing():
+            glBindVertexArray(0)
@@ -0,0 +1,97 @@
+#Imports all openGL functions
+from OpenGL.GL import *
+#Import the counters of the frame timer
+from frameTimer import count
+
+
+#State bound while a queue is being drawn: the program, the vertex array and the texture of each unit.
+#Outside of a queue it is None, and every bind is issued since other code may have changed the state in between.
+state = None
+
+
+def use_program(program):
+    ''' Makes a shader program current, unless the queue being drawn already uses it '''
+    if state is not None:
+        if state.get('program') == program:
+            return
+        state['program'] = program
+    glUseProgram(program)
+    count('program switches')
+
+
+def bind_vertex_array(vao):
+    ''' Binds a vertex array object, unless the queue being drawn already has it bound '''
+    if state is not None:
+        if state.get('vao') == vao:
+            return
+        state['vao'] = vao
+    glBindVertexArray(vao)
+
+
+def bind_texture(unit, texture):
+    '''
+    Binds a texture to a texture unit, unless the queue being drawn already has it bound there.
+    :param unit: the index of the texture unit
+    :param texture: the Texture (or CubeMap, ShadowMap) object
+    '''
+    if state is not None:
+        if state.get(unit) == (texture.target, texture.textureid):
+            return
+        state[unit] = (texture.target, texture.textureid)
+    glActiveTexture(GL_TEXTURE0 + unit)
+    texture.bind()
+    count('texture binds')
+
+
+def drawing():
+    ''' Returns whether a queue is being drawn, in which case the models leave their state bound for the next one '''
+    return state is not None
+
+
+class RenderQueue:
+    '''
+    Collects the models drawn in a pass and draws them sorted by state: shader program, textures, material and
+    vertex array, so that consecutive draws share as much state as possible. While the queue is drawn, programs,
+    vertex arrays and textures that are already bound are not bound again (see use_program(), bind_texture()),
+    and the uniforms of a shared material are not uploaded again (see Uniform.changed()).
+    The number of program switches, texture binds and draw calls are counted for each frame (see frameTimer.count).
+    Models are sorted, so this is only suitable for opaque models whose drawing order does not matter.
+    '''
+    def __init__(self):
+        self.items = []
+
+    def add(self, model, Mp=None):
+        '''
+        Adds a model to draw, if it is visible.
+        :param Mp: [optional] the model matrix of the parent object, for composite objects
+        '''
+        if model.visible:
+            self.items.append((model, Mp))
+
+    def add_models(self, models):
+        for model in models:
+            self.add(model)
+
+    @staticmethod
+    def key(item):
+        ''' Returns the sort key of a draw item: (program, textures, material, vertex array) '''
+        model = item[0]
+        program = model.shader.program if model.shader is not None else 0
+        textures = tuple([texture.textureid for texture in model.mesh.textures])
+        return (program, textures, id(model.mesh.material), model.vao)
+
+    def flush(self):
+        ''' Draws all the models added since the last flush, sorted by state, and empties the queue '''
+        global state
+        self.items.sort(key=self.key)
+        state = {}
+        try:
+            for (model, Mp) in self.items:
+                if Mp is None:
+                    model.draw()
+                else:
+                    model.draw(Mp)
+        finally:
+            state = None
+            self.items = []
+            glBindVertexArray(0)
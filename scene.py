@@ -1,5 +1,7 @@
 #Pygame is just used to create a window with the operating system on which to draw.
 import pygame
+import contextlib
+import itertools
 #Imports all openGL functions
 from OpenGL.GL import *
 #Import helper functions
@@ -8,20 +10,45 @@ from matutils import *
 from shaders import *
 from camera import Camera
 from lightSource import LightSource
+#Import the headless contexts
+import offscreen
+#Import the render queue sorting draws by state
+from renderQueue import RenderQueue
+#Import the view frustum for culling
+from frustum import Frustum
+from bvh import BVH
+from sceneGraph import SceneGraph
+from frameTimer import count
+from transforms import PassTransforms, update_model_transforms
 
 class Scene:
     '''
     This is the main class for adrawing an OpenGL scene using the PyGame library
     '''
-    def __init__(self, width=800, height=600, shaders=None):
+    def __init__(self, width=800, height=600, shaders=None, backend='pygame'):
         '''
         Initialises the scene
+        :param backend: 'pygame' to draw in a window, or 'egl'/'osmesa' to draw offscreen without any display
+        (see offscreen.py), in which case frames can be read back with read_frame()
         '''
-        #Create the pygame window, and set wireframe to off
+        #Create the pygame window (or the offscreen context), and set wireframe to off
         self.window_size = (width, height)
         self.wireframe = False
-        pygame.init()
-        screen = pygame.display.set_mode(self.window_size, pygame.OPENGL | pygame.DOUBLEBUF, 24)
+        self.backend = backend
+        self.context = None
+        self.target = None
+        if backend == 'pygame':
+            pygame.init()
+            screen = pygame.display.set_mode(self.window_size, pygame.OPENGL | pygame.DOUBLEBUF, 24)
+        else:
+            self.context = offscreen.create_context(backend, width, height)
+            self.target = offscreen.RenderTarget(width, height)
+        #Programs linked in a previous context cannot be used in this one
+        shader_cache.clear()
+        #Count the frames drawn, for running a fixed number of frames
+        self.frame = 0
+        #Optional FrameTimer measuring the passes of each frame (see frameTimer.py)
+        self.timer = None
         #Here we start initialising the window from the OpenGL side
         glViewport(0, 0, self.window_size[0], self.window_size[1])
         #This selects the background color
@@ -56,6 +83,29 @@ class Scene:
         self.mode = 1
         #Create a list of models to be drawn in the scene
         self.models = []
+        #Uniform buffer holding the projection, view and light of the current pass for all shaders
+        self.frame_uniforms = FrameUniforms()
+        #Preprocessor defines added to the shaders of the models drawn in the current pass, eg. LAYERED
+        self.shader_defines = {}
+        #Queue sorting the draws of opaque models by state, set sort_draws to False to draw them in order instead
+        self.queue = RenderQueue()
+        self.sort_draws = True
+        #Matrices of the current pass, and whether the shaders use them and the matrices cached by the models rather
+        #than computing them in every draw (see transforms.py)
+        self.transforms = None
+        self.cache_transforms = True
+        #Frustum of the current pass, models entirely outside of it are not drawn unless cull is set to False
+        self.frustum = None
+        self.cull = True
+        self.viewport = [0, 0, width, height]
+        #Name of the pass being drawn (see draw_models()), under which models remember their level of detail
+        self.pass_name = 'models'
+        #Hierarchy of the bounds of the models drawn, for culling and picking, and the models of each pass with their
+        #index in it (see bvh_items())
+        self.bvh = BVH()
+        self.pass_items = {}
+        #Hierarchy of transforms the models can be attached to, updated at the start of each frame
+        self.graph = SceneGraph()
 
     def add_model(self, model):
         '''
@@ -72,6 +122,16 @@ class Scene:
         for model in models_list:
             self.add_model(model)
 
+    def remove_model(self, model):
+        '''
+        Removes a model from the scene, and from the hierarchy used for culling. Models removed from other lists drawn
+        by the scene must be removed from the hierarchy with this method too.
+        :param model: The model object to remove
+        '''
+        if model in self.models:
+            self.models.remove(model)
+        self.bvh.remove(model)
+
     def draw(self, framebuffer=False):
         '''
         Draw all models in the scene
@@ -81,14 +141,130 @@ class Scene:
         if not framebuffer:
             glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
             self.camera.update()
-        #Loop over all models in the list and draw them
-        for model in self.models:
-            model.draw()
+            self.graph.update()
+        self.update_frame_uniforms()
+        #Draw all models in the list
+        self.draw_models(self.models)
         #Once this is done, the displayed frame is flipped
         #Essentially, this means the frame we are drawing on is displayed, and the previously displayed frame is now used for drawing again
         #This prevents viewing of the drawing process
         if not framebuffer:
+            self.present()
+
+    def draw_models(self, *lists, name='models'):
+        '''
+        Draws one or more lists of opaque models, sorted by state through the render queue if sort_draws is set
+        (see RenderQueue), in order otherwise. Models outside of the frustum of the pass are skipped if cull is set.
+        :param name: the name of the pass, under which the models culled and drawn are counted (see frameTimer.count)
+        '''
+        self.pass_name = name
+        models = list(itertools.chain(*lists))
+        if self.cull and self.frustum is not None:
+            items = self.bvh_items(name, models)
+            inside = np.flatnonzero(self.bvh.intersect_frustum(self.frustum)[items])
+            if len(inside) < len(models):
+                count('culled ({})'.format(name), len(models) - len(inside))
+            models = [models[i] for i in inside]
+        drawn = [model for model in models if model.visible]
+        if len(drawn) > 0:
+            count('drawn ({})'.format(name), len(drawn))
+        #Compute the matrices of the models that moved all at once, rather than in each draw
+        if self.cache_transforms:
+            update_model_transforms(drawn)
+        for model in drawn:
+            if self.sort_draws:
+                self.queue.add(model)
+            else:
+                model.draw()
+        if self.sort_draws:
+            self.queue.flush()
+
+    def bvh_items(self, name, models):
+        '''
+        Returns the indices in the BVH of the models drawn by a pass, adding them to it first. They are cached for each
+        pass, and only found again when its models or the numbering of the BVH changed.
+        :param name: the name of the pass
+        :param models: the models drawn by the pass, in order
+        '''
+        cached = self.pass_items.get(name)
+        #Lists compare their models by identity first, which is much faster than visiting them in Python
+        if cached is None or cached[0] != self.bvh.generation or cached[1] != models:
+            self.bvh.add_models(models)
+            cached = (self.bvh.generation, models, np.array([model.bvh_index for model in models], dtype=np.int64))
+            self.pass_items[name] = cached
+        return cached[2]
+
+    def update_frame_uniforms(self):
+        '''
+        Uploads the projection, view and light of the current pass to the frame uniform buffer, and sets the frustum
+        used for culling. This needs to be called whenever a pass changes the projection or the camera view, before
+        drawing.
+        '''
+        self.frame_uniforms.update(self.P, self.camera.V, self.light)
+        self.transforms = PassTransforms(self.P, self.camera.V)
+        self.frustum = Frustum(self.transforms.PV)
+        #The height of the viewport gives the size of objects on screen, for the levels of detail
+        self.viewport = glGetIntegerv(GL_VIEWPORT)
+
+    def pixels_per_unit(self, bounds):
+        '''
+        Returns the largest size in pixels of a unit of length within a bounding box in world coordinates in the
+        current pass, at the point of its bounding sphere nearest to the camera. It is infinite for boxes around the
+        camera.
+        :param bounds: a tuple (center, half extent)
+        '''
+        (center, extent) = bounds
+        if self.P[3, 3] == 1.:
+            #Orthographic projection, eg. of the cascades of a shadow map
+            return float(abs(self.P[1, 1])*self.viewport[3]/2.)
+        depth = -np.dot(self.camera.V[2, :3], center) - self.camera.V[2, 3] - np.linalg.norm(extent)
+        if depth <= 0.:
+            return np.inf
+        return float(abs(self.P[1, 1])*self.viewport[3]/(2.*depth))
+
+    def pick(self, x, y):
+        '''
+        Returns the model under a point of the window, from the bounding boxes of the models drawn.
+        :param x: the horizontal position in pixels, from the left of the window
+        :param y: the vertical position in pixels, from the top of the window
+        :return: the nearest model whose box is under the point, or None
+        '''
+        ndc = [2.*x/self.window_size[0] - 1., 1. - 2.*y/self.window_size[1]]
+        #Unproject the point on the near and far planes to get the ray through it
+        inverse = np.linalg.inv(np.matmul(self.P, self.camera.V))
+        near = np.matmul(inverse, [ndc[0], ndc[1], -1., 1.])
+        far = np.matmul(inverse, [ndc[0], ndc[1], 1., 1.])
+        near = near[:3]/near[3]
+        far = far[:3]/far[3]
+        hits = [(distance, model) for (distance, model) in self.bvh.intersect_ray(near, far - near) if model.visible]
+        return hits[0][1] if len(hits) > 0 else None
+
+    def measure(self, name):
+        '''
+        Returns a context manager measuring the time spent in a pass of the frame when a timer is set, eg.
+            with self.measure('skybox'):
+                self.skybox.draw()
+        '''
+        if self.timer is None:
+            return contextlib.nullcontext()
+        return self.timer.measure(name)
+
+    def present(self):
+        '''
+        Displays the frame that was just drawn. Offscreen, the frame stays in the render target until the next one.
+        '''
+        if self.target is None:
             pygame.display.flip()
+        self.frame += 1
+
+    def read_frame(self):
+        '''
+        Reads the last frame drawn offscreen back from the GPU.
+        :return: a (height, width, 4) uint8 RGBA array, with the first row at the top of the image
+        '''
+        if self.target is None:
+            raise RuntimeError('(E) Error: frames can only be read back from a headless scene')
+        return self.target.read()
 
     def keyboard(self, event):
         '''
@@ -112,7 +288,10 @@ class Scene:
                 self.keyboard(event)
             elif event.type == pygame.MOUSEBUTTONDOWN: #If a mouse button is pressed
                 mods = pygame.key.get_mods()
-                if event.button == 4: #Move the light if the scroll wheel is moved whilst holding control, or the camera if control is not held
+                if event.button == 2: #Print the model under the mouse if the middle button is clicked
+                    model = self.pick(*event.pos)
+                    print('--> picked {}'.format(model.name if model is not None else 'nothing'))
+                elif event.button == 4: #Move the light if the scroll wheel is moved whilst holding control, or the camera if control is not held
                     if mods & pygame.KMOD_CTRL: 
                         self.light.position *= 1.1
                         self.light.update()
@@ -143,11 +322,20 @@ class Scene:
                 else:
                     self.mouse_mvt = None
 
-    def run(self):
+    def run(self, frames=None):
         '''
         Draws the scene in a loop until exit.
+        :param frames: [optional] the number of frames to draw before returning, required for a headless scene
         '''
+        if frames is None and self.target is not None:
+            raise ValueError('(E) Error: a headless scene must be run for a given number of frames')
         self.running = True
-        while self.running:
-            self.pygameEvents()
-            self.draw()
\ No newline at end of file
+        last = None if frames is None else self.frame + frames
+        while self.running and (last is None or self.frame < last):
+            if self.target is None:
+                self.pygameEvents()
+            if self.timer is not None:
+                self.timer.begin_frame()
+            self.draw()
+            if self.timer is not None:
+                self.timer.end_frame()
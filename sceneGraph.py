@@ -0,0 +1,197 @@
+#Import numpy for the transform arrays
+import numpy as np
+#Import the bounding boxes of the models
+from frustum import merge_bounds
+
+
+class SceneNode:
+    '''
+    Node of a SceneGraph, with a local matrix relative to its parent. The models attached to a node are drawn with
+    its world matrix as their model matrix M, which is assigned by SceneGraph.update() when the node or one of its
+    ancestors moved, so M should not be assigned directly.
+    '''
+    def __init__(self, graph, id, parent, name):
+        self.graph = graph
+        self.id = id
+        self.parent = parent
+        self.name = name
+        self.children = []
+        self.models = []
+
+    @property
+    def local(self):
+        ''' The matrix placing the node relative to its parent, or in the scene for a root '''
+        return self.graph.local[self.id]
+
+    @local.setter
+    def local(self, M):
+        self.graph.set_local([self.id], M)
+
+    @property
+    def world(self):
+        ''' The matrix placing the node in the scene, the product of the local matrices from the root '''
+        self.graph.update()
+        return self.graph.world[self.id]
+
+    def attach(self, model):
+        ''' Attaches a model to the node, or to another node if it was attached to one '''
+        if getattr(model, 'node', None) is not None:
+            model.node.detach(model)
+        model.node = self
+        self.models.append(model)
+        self.graph.touch(self.id)
+
+    def detach(self, model):
+        ''' Detaches a model, which keeps its last model matrix '''
+        self.models.remove(model)
+        model.node = None
+        self.graph.bounds_dirty[self.graph.ancestors(self.id)] = True
+
+    def add_child(self, M=None, name=None):
+        ''' Creates a child of the node (see SceneGraph.add_node()) '''
+        return self.graph.add_node(M, parent=self, name=name)
+
+    def world_bounds(self):
+        '''
+        Returns the axis aligned bounding box in world coordinates of the models attached to the node and to its
+        descendants, or None if none of them has bounds. It is cached until one of them moves.
+        '''
+        return self.graph.world_bounds(self.id)
+
+
+class SceneGraph:
+    '''
+    Hierarchy of nodes whose world matrices are the product of the local matrices from their root, driving the model
+    matrices of the models attached to them, eg. so that moving a node moves everything attached to its subtree.
+
+    The matrices are stored in contiguous (N, 4, 4) arrays indexed by node id, along with the parent and depth of
+    each node. Setting a local matrix only flags the node as dirty, and update() then computes the world matrices of
+    the dirty nodes and of their descendants one depth at a time, with a single stacked product per depth, so that
+    static subtrees cost nothing per frame. The world bounds of the subtree of each node are cached the same way.
+    Changes made to the local matrices in place are not seen, they must be assigned (see SceneNode.local).
+    '''
+    def __init__(self, capacity=64):
+        '''
+        :param capacity: the number of nodes the arrays are first allocated for, they grow as needed
+        '''
+        self.nodes = []
+        self.local = np.zeros((capacity, 4, 4))
+        self.world = np.zeros((capacity, 4, 4))
+        self.parent = np.full(capacity, -1, dtype=np.int64)
+        self.depth = np.zeros(capacity, dtype=np.int64)
+        #Nodes whose world matrix must be computed again, and nodes whose subtree bounds must be merged again
+        self.dirty = np.zeros(capacity, dtype=bool)
+        self.bounds_dirty = np.zeros(capacity, dtype=bool)
+        #World space box of the subtree of each node, and whether it has one
+        self.lower = np.zeros((capacity, 3))
+        self.upper = np.zeros((capacity, 3))
+        self.bounded = np.zeros(capacity, dtype=bool)
+        self.any_dirty = False
+
+    def grow(self):
+        ''' Doubles the capacity of the arrays '''
+        for name in ['local', 'world', 'parent', 'depth', 'dirty', 'bounds_dirty', 'lower', 'upper', 'bounded']:
+            array = getattr(self, name)
+            grown = np.zeros((2*array.shape[0],) + array.shape[1:], dtype=array.dtype)
+            grown[:array.shape[0]] = array
+            setattr(self, name, grown)
+
+    def add_node(self, M=None, parent=None, name=None):
+        '''
+        Creates a node.
+        :param M: [optional] its local matrix, the identity by default
+        :param parent: [optional] its parent SceneNode, None for a root
+        :return: the SceneNode
+        '''
+        id = len(self.nodes)
+        if id == self.local.shape[0]:
+            self.grow()
+        node = SceneNode(self, id, parent, name)
+        self.nodes.append(node)
+        self.local[id] = np.identity(4) if M is None else M
+        self.parent[id] = -1 if parent is None else parent.id
+        self.depth[id] = 0 if parent is None else self.depth[parent.id] + 1
+        if parent is not None:
+            parent.children.append(node)
+        self.touch(id)
+        return node
+
+    def touch(self, ids):
+        ''' Flags nodes as moved, the world matrices of their subtrees are computed at the next update() '''
+        self.dirty[ids] = True
+        self.any_dirty = True
+
+    def set_local(self, ids, matrices):
+        '''
+        Sets the local matrices of several nodes at once.
+        :param ids: the ids of the nodes
+        :param matrices: a (N, 4, 4) array, or a single matrix for all of them
+        '''
+        self.local[ids] = matrices
+        self.touch(ids)
+
+    def ancestors(self, id):
+        ''' Returns the ids of a node and of its ancestors '''
+        ids = [id]
+        while self.parent[ids[-1]] >= 0:
+            ids.append(int(self.parent[ids[-1]]))
+        return ids
+
+    def update(self):
+        '''
+        Computes the world matrices of the nodes that moved and of their descendants, and assigns them to the models
+        attached to those nodes. Does nothing if no node moved since the last update.
+        :return: the ids of the nodes updated
+        '''
+        if not self.any_dirty:
+            return np.zeros(0, dtype=np.int64)
+        size = len(self.nodes)
+        dirty = self.dirty[:size]
+        parent = self.parent[:size]
+        depth = self.depth[:size]
+        updated = []
+        for level in range(int(depth.max()) + 1):
+            ids = np.flatnonzero(depth == level)
+            if level > 0:
+                #A node is dirty if its parent is, which is known once the previous depth was processed
+                dirty[ids] |= dirty[parent[ids]]
+            ids = ids[dirty[ids]]
+            if len(ids) == 0:
+                continue
+            if level == 0:
+                self.world[ids] = self.local[ids]
+            else:
+                self.world[ids] = np.matmul(self.world[parent[ids]], self.local[ids])
+            updated.append(ids)
+        updated = np.concatenate(updated) if len(updated) > 0 else np.zeros(0, dtype=np.int64)
+        for id in updated:
+            for model in self.nodes[id].models:
+                model.M = self.world[id].copy()
+        #The boxes of the nodes updated and of their ancestors change
+        self.bounds_dirty[updated] = True
+        for id in updated:
+            id = self.parent[id]
+            while id >= 0 and not self.bounds_dirty[id]:
+                self.bounds_dirty[id] = True
+                id = self.parent[id]
+        dirty[:] = False
+        self.any_dirty = False
+        return updated
+
+    def world_bounds(self, id):
+        ''' Returns the cached world bounds of the subtree of a node (see SceneNode.world_bounds()) '''
+        self.update()
+        if self.bounds_dirty[id]:
+            node = self.nodes[id]
+            boxes = [model.world_bounds() for model in node.models]
+            boxes += [self.world_bounds(child.id) for child in node.children]
+            boxes = [box for box in boxes if box is not None]
+            self.bounded[id] = len(boxes) > 0
+            if len(boxes) > 0:
+                (center, extent) = merge_bounds(np.array([box[0] for box in boxes]), np.array([box[1] for box in boxes]))
+                self.lower[id] = center - extent
+                self.upper[id] = center + extent
+            self.bounds_dirty[id] = False
+        if not self.bounded[id]:
+            return None
+        return (self.lower[id] + self.upper[id])/2., (self.upper[id] - self.lower[id])/2.
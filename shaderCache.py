@@ -0,0 +1,160 @@
+#Import ctypes to read the program binaries
+import ctypes
+#Import hashlib and os to identify and store the program binaries
+import hashlib
+import os
+#Imports all openGL functions
+from OpenGL.GL import *
+#Import the cache of the meshes, whose eviction is shared
+from meshCache import MeshCache
+
+
+class ShaderCache:
+    '''
+    Registry of the linked shader programs, so that identical shaders are only compiled and linked once.
+    A program is identified by the name of the shader, the layout of the vertex attributes and the preprocessor
+    defines. All shader objects with the same key share the same program and the same uniforms, so that the value
+    last uploaded to the program is known to all of them (see Uniform.changed()).
+
+    The binaries of the linked programs can also be saved to disk (glGetProgramBinary) so that later runs skip
+    compiling the GLSL code. A binary is only valid for the driver that produced it, so the sources and the driver
+    are part of its file name, and a binary that the driver rejects is simply compiled again. Saving a binary removes
+    the ones it supersedes, from other sources or drivers, and the folder is kept under max_bytes as for the meshes
+    (see MeshCache.evict()): binaries of shaders whose sources are gone go first, then the least recently used ones.
+    '''
+    #Extension of the binaries in the cache folder
+    extension = '.bin'
+
+    def __init__(self, folder='cache/shaders', enabled=True, binaries=True, max_bytes=32*1024*1024):
+        '''
+        Initialises the cache
+        :param folder: the folder in which the program binaries are stored
+        :param enabled: whether programs are shared at all
+        :param binaries: whether the program binaries are saved to and loaded from disk
+        :param max_bytes: the maximum size of the folder before binaries are evicted
+        '''
+        self.folder = folder
+        self.enabled = enabled
+        self.binaries = binaries
+        self.max_bytes = max_bytes
+        self.programs = {}
+        #Number of programs compiled, loaded from a binary and shared since the cache was cleared
+        self.compiled = 0
+        self.loaded = 0
+        self.reused = 0
+
+    @staticmethod
+    def key(name, attributes, defines):
+        '''
+        Returns the key identifying a program.
+        :param name: the name of the shader
+        :param attributes: the dictionary of attribute locations {name: location} bound before linking
+        :param defines: the dictionary of preprocessor defines {name: value} added to the sources
+        '''
+        return (name, tuple(sorted(attributes.items())), tuple(sorted(defines.items())))
+
+    def get(self, key):
+        '''
+        :return: a tuple (program, uniforms) if a program was already linked for this key, None otherwise
+        '''
+        if not self.enabled or key not in self.programs:
+            return None
+        self.reused += 1
+        return self.programs[key]
+
+    def add(self, key, program, uniforms):
+        ''' Registers a linked program along with the dictionary of its uniforms '''
+        if self.enabled:
+            self.programs[key] = (program, uniforms)
+
+    def path(self, key, sources):
+        '''
+        Returns the name of the binary file for a program: the name of the shader, a hash of the key and a hash of
+        the sources and the driver, so that binaries of the same program from other sources or drivers can be found.
+        '''
+        identity = ''.join(sources) + glGetString(GL_VENDOR).decode() + glGetString(GL_RENDERER).decode() + glGetString(GL_VERSION).decode()
+        #Shaders without a name are identified by their sources instead
+        name = key[0] if isinstance(key[0], str) else 'program'
+        return os.path.join(self.folder, '{}.{}.{}{}'.format(name, hashlib.sha1(repr(key).encode('utf-8')).hexdigest()[:8], hashlib.sha1(identity.encode('utf-8')).hexdigest()[:16], self.extension))
+
+    def source(self, path):
+        '''
+        Returns the folder of the GLSL sources of a binary (see BaseShaderProgram), whose binaries are evicted when it
+        is gone. Shaders without a name have their sources in the code, so their binaries are only evicted when least
+        recently used.
+        '''
+        name = os.path.basename(path).split('.')[0]
+        return self.folder if name == 'program' else os.path.join('shaders', name)
+
+    def evict(self):
+        ''' Removes binaries until the folder fits in max_bytes, as MeshCache does with its entries '''
+        MeshCache.evict(self)
+
+    def load_binary(self, key, sources):
+        '''
+        Creates a program from the binary saved by a previous run.
+        :param sources: the GLSL sources of the program
+        :return: the linked program, or None if there is no valid binary
+        '''
+        if not self.binaries:
+            return None
+        path = self.path(key, sources)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as file:
+            data = file.read()
+        program = glCreateProgram()
+        glProgramBinary(program, int.from_bytes(data[:4], 'little'), data[4:], len(data) - 4)
+        if glGetProgramiv(program, GL_LINK_STATUS) != GL_TRUE:
+            #The driver changed in a way that is not visible in its version string, compile again
+            print('(W) Warning, program binary {} rejected by the driver'.format(path))
+            glDeleteProgram(program)
+            os.remove(path)
+            return None
+        #Mark the binary as recently used for eviction
+        os.utime(path)
+        self.loaded += 1
+        return program
+
+    def store_binary(self, key, sources, program):
+        '''
+        Saves the binary of a linked program, which must have been linked with GL_PROGRAM_BINARY_RETRIEVABLE_HINT.
+        '''
+        self.compiled += 1
+        if not self.binaries:
+            return
+        size = glGetProgramiv(program, GL_PROGRAM_BINARY_LENGTH)
+        if size == 0:
+            return
+        length = GLsizei()
+        binary_format = GLenum()
+        data = (ctypes.c_ubyte * int(size))()
+        glGetProgramBinary(program, size, ctypes.byref(length), ctypes.byref(binary_format), data)
+        os.makedirs(self.folder, exist_ok=True)
+        path = self.path(key, sources)
+        #Write to a temporary file first, so that an interrupted write never leaves a corrupt binary
+        temporary = path + '.tmp'
+        with open(temporary, 'wb') as file:
+            file.write(int(binary_format.value).to_bytes(4, 'little'))
+            file.write(bytes(data)[:length.value])
+        os.replace(temporary, path)
+        #Binaries of the same program from other sources or drivers are superseded
+        prefix = os.path.basename(path).rsplit('.', 2)[0] + '.'
+        for name in os.listdir(self.folder):
+            if name.startswith(prefix) and name.endswith(self.extension) and name != os.path.basename(path):
+                os.remove(os.path.join(self.folder, name))
+        self.evict()
+
+    def clear(self, binaries=False):
+        '''
+        Forgets the linked programs, eg. when the OpenGL context is destroyed.
+        :param binaries: whether to also remove the binaries saved on disk
+        '''
+        self.programs = {}
+        self.compiled = 0
+        self.loaded = 0
+        self.reused = 0
+        if binaries and os.path.isdir(self.folder):
+            for name in os.listdir(self.folder):
+                if name.endswith('.bin'):
+                    os.remove(os.path.join(self.folder, name))
@@ -3,8 +3,17 @@ from OpenGL.GL import *
 from OpenGL.GL import shaders
 #Import helper functions
 from matutils import *
+#Import the counters of the frame timer
+from frameTimer import count
+#Import the registry of linked programs
+from shaderCache import ShaderCache
+#Import the state tracking of the render queue
+from renderQueue import use_program
 # we will use numpy to store data in arrays
 import numpy as np
+#Import copy and re to create the variants of the shaders
+import copy
+import re
 
 
 class Uniform:
@@ -20,6 +29,8 @@ class Uniform:
         self.name = name
         self.value = value
         self.location = -1
+        #The value last uploaded to the program, uniforms keep their value until it is changed
+        self.uploaded = None
 
     def link(self, program):
         '''
@@ -28,63 +39,97 @@ class Uniform:
         :param program: the GLSL program where the uniform is used
         '''
         self.location = glGetUniformLocation(program=program, name=self.name)
+        self.uploaded = None
         if self.location == -1:
             print('(E) Warning, no uniform {}'.format(self.name))
 
+    def changed(self):
+        '''
+        Checks whether the current value differs from the one last uploaded to the program, in which case it will be
+        uploaded and is remembered. The uploads issued and skipped are counted for each frame (see frameTimer.count).
+        '''
+        if isinstance(self.value, np.ndarray):
+            value = self.value.tobytes()
+        else:
+            value = self.value
+        if value == self.uploaded:
+            count('uniforms skipped')
+            return False
+        self.uploaded = value
+        count('uniforms uploaded')
+        return True
+
     def bind_matrix(self, M=None, number=1, transpose=True):
         '''
         Call this before rendering to bind the Python matrix to the GLSL uniform mat4.
         You will need different methods for different types of uniform, but for now this will
         do for the PVM matrix
-        :param number: the number of matrices sent, leave that to 1 for now
+        :param number: the number of matrices sent, leave that to 1 for now, a (N, 4, 4) stack of matrices is sent
+        to an array of N matrices
         :param transpose: Whether the matrix should be transposed
         '''
         if M is not None:
             self.value = M
-        if self.value.shape[0] == 4 and self.value.shape[1] == 4:
+        if not self.changed():
+            return False
+        if self.value.ndim == 3 and self.value.shape[1:] == (4, 4):
+            glUniformMatrix4fv(self.location, self.value.shape[0], transpose, self.value)
+        elif self.value.shape[0] == 4 and self.value.shape[1] == 4:
             glUniformMatrix4fv(self.location, number, transpose, self.value)
         elif self.value.shape[0] == 3 and self.value.shape[1] == 3:
             glUniformMatrix3fv(self.location, number, transpose, self.value)
         else:
             print('(E) Error: Trying to bind as uniform a matrix of shape {}'.format(self.value.shape))
+        return True
     
     #Here is a collection of functions that focus on binding data to a uniform, which is an attribute for a shader
     def bind(self,value):
         if value is not None:
             self.value = value
         if isinstance(self.value, int):
-            self.bind_int()
+            return self.bind_int()
         elif isinstance(self.value, float):
-            self.bind_float()
+            return self.bind_float()
         elif isinstance(self.value, np.ndarray):
             if self.value.ndim==1:
-                self.bind_vector()
-            elif self.value.ndim==2:
-                self.bind_matrix()
+                return self.bind_vector()
+            elif self.value.ndim==2 or self.value.ndim==3:
+                return self.bind_matrix()
         else:
             print('Wrong value bound: {}'.format(type(self.value)))
+        return False
 
+    #The bind functions return whether the value was uploaded, ie. whether it changed since the last upload
     def bind_int(self, value=None):
         if value is not None:
             self.value = value
+        if not self.changed():
+            return False
         glUniform1i(self.location, self.value)
+        return True
 
     def bind_float(self, value=None):
         if value is not None:
             self.value = value
+        if not self.changed():
+            return False
         glUniform1f(self.location, self.value)
+        return True
 
     def bind_vector(self, value=None):
         if value is not None:
             self.value = value
-        if value.shape[0] == 2:
-            glUniform2fv(self.location, 1, value)
-        elif value.shape[0] == 3:
-            glUniform3fv(self.location, 1, value)
-        elif value.shape[0] == 4:
-            glUniform4fv(self.location, 1, value)
+        if not self.changed():
+            return False
+        if self.value.shape[0] == 2:
+            glUniform2fv(self.location, 1, self.value)
+        elif self.value.shape[0] == 3:
+            glUniform3fv(self.location, 1, self.value)
+        elif self.value.shape[0] == 4:
+            glUniform4fv(self.location, 1, self.value)
         else:
-            print('(E) Error in Uniform.bind_vector(): Vector should be of dimension 2,3 or 4, found {}'.format(value.shape[0]))
+            print('(E) Error in Uniform.bind_vector(): Vector should be of dimension 2,3 or 4, found {}'.format(self.value.shape[0]))
+        return True
 
     def set(self, value):
         '''
@@ -93,17 +138,198 @@ class Uniform:
         self.value = value
 
 
+class FrameUniforms:
+    '''
+    Uniform buffer object holding the data shared by all shader programs during a pass: the projection and view
+    matrices, the light position in view space and the light intensities. It is declared in the shaders as
+        layout(std140, row_major) uniform Frame { mat4 P; mat4 V; vec3 light; vec3 Ia; vec3 Id; vec3 Is; };
+    and updated once per pass (main view, shadow map, each face of the environment map) instead of once per draw.
+    '''
+    #The binding point of the buffer, every program using the Frame block is linked to it (see BaseShaderProgram.compile)
+    binding = 0
+    block = 'Frame'
+    #Size of the block in floats with the std140 layout: two mat4 then four vec3, each aligned on 16 bytes
+    size = 48
+
+    def __init__(self):
+        self.data = np.zeros(self.size, 'f')
+        #Position of the light in view space, computed in the same array for every pass
+        self.light_position = np.zeros(3)
+        self.uploaded = None
+        self.ubo = glGenBuffers(1)
+        glBindBuffer(GL_UNIFORM_BUFFER, self.ubo)
+        glBufferData(GL_UNIFORM_BUFFER, self.data.nbytes, None, GL_DYNAMIC_DRAW)
+        glBindBuffer(GL_UNIFORM_BUFFER, 0)
+        glBindBufferBase(GL_UNIFORM_BUFFER, self.binding, self.ubo)
+
+    def update(self, P, V, light):
+        '''
+        Fills the buffer for a new pass, the buffer is only uploaded if its content changed.
+        :param P: the projection matrix
+        :param V: the view matrix
+        :param light: the light source, its position is transformed to view space
+        '''
+        #The matrices are declared row_major so they are stored as they are in numpy
+        self.data[0:16] = P.ravel()
+        self.data[16:32] = V.ravel()
+        np.matmul(V[:3, :3], light.position, out=self.light_position)
+        self.light_position += V[:3, 3]
+        self.data[32:35] = self.light_position
+        self.data[36:39] = light.Ia
+        self.data[40:43] = light.Id
+        self.data[44:47] = light.Is
+        data = self.data.tobytes()
+        if data == self.uploaded:
+            count('frame uniforms skipped')
+            return
+        self.uploaded = data
+        count('frame uniforms uploaded')
+        glBindBuffer(GL_UNIFORM_BUFFER, self.ubo)
+        glBufferSubData(GL_UNIFORM_BUFFER, 0, self.data.nbytes, self.data)
+        glBindBuffer(GL_UNIFORM_BUFFER, 0)
+
+
+class LayerUniforms:
+    '''
+    Uniform buffer object holding the matrices of the layers drawn by layered shaders (see layered_shaders()), and
+    the mask of the layers drawn. It is declared in the geometry shaders as
+        layout(std140, row_major) uniform Layers { mat4 layer_matrix[6]; int layer_mask; };
+    '''
+    binding = 1
+    block = 'Layers'
+    layers = 6
+    #Size of the block in floats with the std140 layout: the matrices, then the mask padded to 16 bytes
+    size = 16*layers + 4
+
+    def __init__(self):
+        self.data = np.zeros(self.size, 'f')
+        self.ubo = glGenBuffers(1)
+        glBindBuffer(GL_UNIFORM_BUFFER, self.ubo)
+        glBufferData(GL_UNIFORM_BUFFER, self.data.nbytes, None, GL_DYNAMIC_DRAW)
+        glBindBuffer(GL_UNIFORM_BUFFER, 0)
+
+    def update(self, matrices, mask):
+        '''
+        Fills the buffer and binds it for the next layered pass.
+        :param matrices: the matrices transforming the clip space position of the pass into the clip space of each layer
+        :param mask: the bit mask of the layers drawn
+        '''
+        for (layer, matrix) in enumerate(matrices):
+            self.data[16*layer:16*layer + 16] = matrix.ravel()
+        self.data[16*self.layers:].view(np.int32)[0] = mask
+        glBindBuffer(GL_UNIFORM_BUFFER, self.ubo)
+        glBufferSubData(GL_UNIFORM_BUFFER, 0, self.data.nbytes, self.data)
+        glBindBuffer(GL_UNIFORM_BUFFER, 0)
+        glBindBufferBase(GL_UNIFORM_BUFFER, self.binding, self.ubo)
+
+
+#Linked programs shared by all shader objects with the same name, attribute layout and defines
+shader_cache = ShaderCache()
+
+
+def add_defines(source, defines):
+    '''
+    Adds preprocessor defines to a GLSL source, just after the #version directive.
+    :param defines: a dictionary {name: value}
+    '''
+    if len(defines) == 0:
+        return source
+    lines = source.split('\n')
+    #Some of the shaders write the directive as '# version'
+    version = [i for (i, line) in enumerate(lines) if line.strip().replace(' ', '').startswith('#version')]
+    position = version[0] + 1 if len(version) > 0 else 0
+    lines[position:position] = ['#define {} {}'.format(name, value) for (name, value) in sorted(defines.items())]
+    return '\n'.join(lines)
+
+
+def layered_shaders(vertex_shader_source):
+    '''
+    Returns the sources of the vertex and geometry shaders drawing each triangle in several layers of a layered
+    framebuffer, eg. the six faces of a cube map in a single pass (see environmentMapping.EnvironmentMappingTexture).
+    The outputs of the vertex shader are renamed, and passed on by the geometry shader with the clip space position
+    transformed by the matrix of each layer (see LayerUniforms). Triangles entirely outside of the view of a layer are
+    not emitted in it. The preprocessor conditionals around the outputs are kept, so the defines of the vertex shader
+    must also be added to the geometry shader.
+    :return: a tuple (vertex shader source, geometry shader source)
+    '''
+    declarations = []
+    copies = []
+    renames = {}
+    for line in vertex_shader_source.split('\n'):
+        code = line.split('//')[0].strip()
+        if re.match(r'#\s*(if|ifdef|ifndef|elif|else|endif)\b', code):
+            declarations.append(code)
+            copies.append(code)
+            continue
+        output = re.match(r'((?:flat|smooth|noperspective)\s+)?out\s+(\w+)\s+(\w+)\s*;', code)
+        if output is not None:
+            (qualifier, type, name) = output.groups()
+            qualifier = '' if qualifier is None else qualifier
+            renames[name] = name + '_vertex'
+            declarations.append('{}in {} {}_vertex[];'.format(qualifier, type, name))
+            declarations.append('{}out {} {};'.format(qualifier, type, name))
+            copies.append('            {0} = {0}_vertex[i];'.format(name))
+    geometry_shader_source = '\n'.join([
+        '#version 150',
+        'layout(triangles) in;',
+        'layout(triangle_strip, max_vertices={}) out;'.format(3*LayerUniforms.layers),
+        '',
+        '//=== matrices of the layers, see shaders.LayerUniforms',
+        'layout(std140, row_major) uniform Layers {',
+        '    mat4 layer_matrix[{}];'.format(LayerUniforms.layers),
+        '    int layer_mask;',
+        '};',
+        ''] + declarations + [
+        '',
+        'void main() {',
+        '    for (int layer = 0; layer < {}; layer++) {{'.format(LayerUniforms.layers),
+        '        if ((layer_mask & (1 << layer)) == 0)',
+        '            continue;',
+        '        vec4 corners[3];',
+        '        for (int i = 0; i < 3; i++)',
+        '            corners[i] = layer_matrix[layer] * gl_in[i].gl_Position;',
+        '        // skip the triangle if it is outside of one of the clip planes of the layer',
+        '        vec3 x = vec3(corners[0].x, corners[1].x, corners[2].x);',
+        '        vec3 y = vec3(corners[0].y, corners[1].y, corners[2].y);',
+        '        vec3 z = vec3(corners[0].z, corners[1].z, corners[2].z);',
+        '        vec3 w = vec3(corners[0].w, corners[1].w, corners[2].w);',
+        '        if (all(lessThan(x, -w)) || all(greaterThan(x, w)) || all(lessThan(y, -w)) || all(greaterThan(y, w)) || all(lessThan(z, -w)) || all(greaterThan(z, w)))',
+        '            continue;',
+        '        for (int i = 0; i < 3; i++) {',
+        '            gl_Position = corners[i];',
+        '            gl_Layer = layer;'] + copies + [
+        '            EmitVertex();',
+        '        }',
+        '        EndPrimitive();',
+        '    }',
+        '}',
+        ''])
+    return add_defines(vertex_shader_source, renames), geometry_shader_source
+
+
+def normal_matrix(model, M):
+    '''
+    Returns the matrix transforming the normals of a model drawn with a model matrix: the inverse transpose of its
+    rotation part, which the model caches for its own matrix (see BaseModel.transforms()).
+    '''
+    if M is model.world:
+        return model.normal_matrix
+    return np.linalg.inv(M)[:3, :3].transpose()
+
+
 class BaseShaderProgram:
     '''
     This is the base class for loading and compiling the GLSL shaders.
     '''
-    def __init__(self, name=None, vertex_shader=None, fragment_shader=None):
+    def __init__(self, name=None, vertex_shader=None, fragment_shader=None, defines=None):
         '''
         Initialises the shaders
         :param vertex_shader: the name of the file containing the vertex shader GLSL code
         :param fragment_shader: the name of the file containing the fragment shader GLSL code
+        :param defines: [optional] a dictionary of preprocessor defines {name: value} added to both shaders
         '''
         self.name = name
+        self.defines = {} if defines is None else dict(defines)
         print('Creating shader program: {}'.format(name) )
         if name is not None: #If a name is provided, load the vertex and fragment shaders from the files
             vertex_shader = 'shaders/{}/vertex_shader.glsl'.format(name)
@@ -112,13 +338,15 @@ class BaseShaderProgram:
         if vertex_shader is None:
             self.vertex_shader_source = '''
                 #version 130
+                #extension GL_ARB_uniform_buffer_object : require
 
                 in vec3 position;   // vertex position
-                uniform mat4 PVM; // the Perspective-View-Model matrix is received as a Uniform
+                layout(std140, row_major) uniform Frame { mat4 P; mat4 V; vec3 light; vec3 Ia; vec3 Id; vec3 Is; };
+                uniform mat4 M; // the Model matrix is received as a Uniform
 
                 // main function of the shader
                 void main() {
-                    gl_Position = PVM * vec4(position, 1.0f);  // first we transform the position using PVM matrix
+                    gl_Position = P * V * M * vec4(position, 1.0f);  // first we transform the position using PVM matrix
                 }
             '''
         else:
@@ -136,9 +364,13 @@ class BaseShaderProgram:
             print('Load fragment shader from file: {}'.format(fragment_shader))
             with open(fragment_shader, 'r') as file:
                 self.fragment_shader_source = file.read()
+        self.vertex_shader_source = add_defines(self.vertex_shader_source, self.defines)
+        self.fragment_shader_source = add_defines(self.fragment_shader_source, self.defines)
+        #Shaders only have a geometry shader when drawing in layers (see variant())
+        self.geometry_shader_source = None
         #Store all uniforms in a dictionary
         self.uniforms = {
-            'PVM': Uniform('PVM'),  # project view model matrix
+            'M': Uniform('M'),  # model matrix, the projection and view are in the Frame block (see FrameUniforms)
         }
 
 
@@ -146,26 +378,73 @@ class BaseShaderProgram:
         ''' Adds a given uniform '''
         self.uniforms[name] = Uniform(name)
 
+    def variant(self, defines):
+        '''
+        Returns a copy of this shader with additional preprocessor defines, which keeps its other settings (eg. the
+        shadow map) and must be compiled. With the LAYERED define, the copy draws each triangle in the layers set
+        with LayerUniforms, through a geometry shader (see layered_shaders()).
+        :param defines: a dictionary {name: value}
+        '''
+        shader = copy.copy(self)
+        shader.defines = dict(self.defines, **defines)
+        shader.vertex_shader_source = add_defines(self.vertex_shader_source, defines)
+        shader.fragment_shader_source = add_defines(self.fragment_shader_source, defines)
+        shader.uniforms = dict([(name, Uniform(name, uniform.value)) for (name, uniform) in self.uniforms.items()])
+        if 'LAYERED' in shader.defines and self.geometry_shader_source is None:
+            (shader.vertex_shader_source, geometry_shader_source) = layered_shaders(shader.vertex_shader_source)
+            shader.geometry_shader_source = add_defines(geometry_shader_source, shader.defines)
+        return shader
+
     def compile(self, attributes):
         '''
         Call this function to compile the GLSL codes for both shaders.
+        Programs already linked with the same name, attributes and defines are shared (see ShaderCache).
         :return:
         '''
-        print('Compiling GLSL shaders [{}]...'.format(self.name))
-        try:
-            self.program = glCreateProgram()
-            glAttachShader(self.program, shaders.compileShader(self.vertex_shader_source, shaders.GL_VERTEX_SHADER))
-            glAttachShader(self.program, shaders.compileShader(self.fragment_shader_source, shaders.GL_FRAGMENT_SHADER))
-        except RuntimeError as error:
-            print('(E) An error occured while compiling {} shader:\n {}\n... forwarding exception...'.format(self.name, error)),
-            raise error
-        self.bindAttributes(attributes)
-        #Bind the attributes, then link to the program and use it
-        glLinkProgram(self.program)
+        #Shaders without a name are identified by their sources
+        name = self.name if self.name is not None else (self.vertex_shader_source, self.fragment_shader_source)
+        key = shader_cache.key(name, attributes, self.defines)
+        cached = shader_cache.get(key)
+        if cached is not None:
+            self.program, uniforms = cached
+            #Share the uniforms of the program, so that the values last uploaded are known to all shader objects
+            for (uniform_name, uniform) in self.uniforms.items():
+                if uniform_name not in uniforms:
+                    uniform.link(self.program)
+                    uniforms[uniform_name] = uniform
+            self.uniforms = uniforms
+            glUseProgram(self.program)
+            return
+        sources = [self.vertex_shader_source, self.fragment_shader_source]
+        if self.geometry_shader_source is not None:
+            sources.append(self.geometry_shader_source)
+        self.program = shader_cache.load_binary(key, sources)
+        if self.program is None:
+            print('Compiling GLSL shaders [{}]...'.format(self.name))
+            try:
+                self.program = glCreateProgram()
+                glAttachShader(self.program, shaders.compileShader(self.vertex_shader_source, shaders.GL_VERTEX_SHADER))
+                glAttachShader(self.program, shaders.compileShader(self.fragment_shader_source, shaders.GL_FRAGMENT_SHADER))
+                if self.geometry_shader_source is not None:
+                    glAttachShader(self.program, shaders.compileShader(self.geometry_shader_source, GL_GEOMETRY_SHADER))
+            except RuntimeError as error:
+                print('(E) An error occured while compiling {} shader:\n {}\n... forwarding exception...'.format(self.name, error)),
+                raise error
+            self.bindAttributes(attributes)
+            #Bind the attributes, then link to the program and keep its binary for the next runs
+            glProgramParameteri(self.program, GL_PROGRAM_BINARY_RETRIEVABLE_HINT, GL_TRUE)
+            glLinkProgram(self.program)
+            shader_cache.store_binary(key, sources, self.program)
         glUseProgram(self.program)
         #Link all uniforms
         for uniform in self.uniforms:
             self.uniforms[uniform].link(self.program)
+        #Read the per-pass data from the frame uniform buffer, and the layers from theirs
+        for buffer in [FrameUniforms, LayerUniforms]:
+            block = glGetUniformBlockIndex(self.program, buffer.block)
+            if block != GL_INVALID_INDEX:
+                glUniformBlockBinding(self.program, block, buffer.binding)
+        shader_cache.add(key, self.program, self.uniforms)
 
     def bindAttributes(self, attributes):
         #Bind all shader attributes to the correct locations in the VAO
@@ -176,39 +455,32 @@ class BaseShaderProgram:
     def bind(self, model, M):
         ''' Call this function to enable this GLSL Program '''
         #Tell OpenGL to use this shader program for rendering
-        glUseProgram(self.program)
-        P = model.scene.P
-        V = model.scene.camera.V
-        #Set the PVM matrix uniform
-        self.uniforms['PVM'].bind(np.matmul(P, np.matmul(V, M)))
+        use_program(self.program)
+        #Set the model matrix uniform
+        self.uniforms['M'].bind(M)
 
 
 class PhongShader(BaseShaderProgram):
     '''
     This is the base class for loading and compiling the GLSL shaders.
     '''
-    def __init__(self, name='phong'):
+    def __init__(self, name='phong', defines=None):
         '''
         Initialises the shaders
         :param vertex_shader: the name of the file containing the vertex shader GLSL code
         :param fragment_shader: the name of the file containing the fragment shader GLSL code
         '''
-        BaseShaderProgram.__init__(self, name=name)
+        BaseShaderProgram.__init__(self, name=name, defines=defines)
         #Create a large collection of relevant uniforms
         self.uniforms = {
-            'PVM': Uniform('PVM'),   # project view model matrix
-            'VM': Uniform('VM'),     # view model matrix (necessary for light computations)
-            'VMiT': Uniform('VMiT'),  # inverse-transpose of the view model matrix (for normal transformation)
+            'M': Uniform('M'),     # model matrix, the projection and view are in the Frame block (see FrameUniforms)
+            'MiT': Uniform('MiT'),  # inverse-transpose of the model matrix (for normal transformation)
             'mode': Uniform('mode',0),  # rendering mode (only for illustration, in general you will want one shader program per mode)
             'alpha': Uniform('alpha', 1.0),
             'Ka': Uniform('Ka'),
             'Kd': Uniform('Kd'),
             'Ks': Uniform('Ks'),
             'Ns': Uniform('Ns'),
-            'light': Uniform('light', np.array([0., 0., 0.], 'f')),
-            'Ia': Uniform('Ia'),
-            'Id': Uniform('Id'),
-            'Is': Uniform('Is'),
             'has_texture': Uniform('has_texture'),
             'textureObject': Uniform('textureObject')
         }
@@ -217,14 +489,11 @@ class PhongShader(BaseShaderProgram):
         '''
         Call this function to enable this GLSL Program (you can have multiple GLSL programs used during rendering!)
         '''
-        P = model.scene.P
-        V = model.scene.camera.V
         #Tell OpenGL to use this shader program for rendering
-        glUseProgram(self.program)
-        #Set the PVM matrix uniforms
-        self.uniforms['PVM'].bind(np.matmul(P, np.matmul(V, M)))
-        self.uniforms['VM'].bind(np.matmul(V, M))
-        self.uniforms['VMiT'].bind(np.linalg.inv(np.matmul(V, M))[:3, :3].transpose())
+        use_program(self.program)
+        #Set the model matrix uniforms, the inverse is only computed when the model matrix changed
+        if self.uniforms['M'].bind(M):
+            self.uniforms['MiT'].bind(normal_matrix(model, M))
         #Bind the mode and alpha to the program
         self.uniforms['mode'].bind(model.scene.mode)
         self.uniforms['alpha'].bind(model.mesh.material.alpha)
@@ -234,21 +503,14 @@ class PhongShader(BaseShaderProgram):
             self.uniforms['has_texture'].bind(1)
         else:
             self.uniforms['has_texture'].bind(0)
-        #Bind material properties
+        #Bind material properties, the light properties are in the Frame block (see FrameUniforms)
         self.bind_material_uniforms(model.mesh.material)
-        #Bind the light properties
-        self.bind_light_uniforms(model.scene.light, V)
-
-    def bind_light_uniforms(self, light, V):
-        self.uniforms['light'].bind_vector(unhomog(np.dot(V, homog(light.position))))
-        self.uniforms['Ia'].bind_vector(np.array(light.Ia, 'f'))
-        self.uniforms['Id'].bind_vector(np.array(light.Id, 'f'))
-        self.uniforms['Is'].bind_vector(np.array(light.Is, 'f'))
 
     def bind_material_uniforms(self, material):
-        self.uniforms['Ka'].bind_vector(np.array(material.Ka, 'f'))
-        self.uniforms['Kd'].bind_vector(np.array(material.Kd, 'f'))
-        self.uniforms['Ks'].bind_vector(np.array(material.Ks, 'f'))
+        #The material colours are already float32 arrays (see Material)
+        self.uniforms['Ka'].bind_vector(material.Ka)
+        self.uniforms['Kd'].bind_vector(material.Kd)
+        self.uniforms['Ks'].bind_vector(material.Ks)
         self.uniforms['Ns'].bind_float(material.Ns)
 
     def add_uniform(self, name):
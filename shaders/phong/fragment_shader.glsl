@@ -1,4 +1,5 @@
 # version 130 // required to use OpenGL core standard
+#extension GL_ARB_uniform_buffer_object : require
 
 //=== 'in' attributes are passed on from the vertex shader's 'out' attributes, and interpolated for each fragment
 in vec3 fragment_color;        // the fragment colour
@@ -6,6 +7,10 @@ in vec3 position_view_space;   // the position in view coordinates of this fragm
 in vec3 normal_view_space;     // the normal in view coordinates to this fragment
 in vec2 fragment_texCoord;
 
+#ifdef INSTANCED
+in vec4 fragment_tint;         // the colour of the instance, see instancedModel.InstanceBuffer
+#endif
+
 //=== 'out' attributes are the output image, usually only one for the colour of each pixel
 out vec4 final_color;
 
@@ -21,10 +26,15 @@ uniform vec3 Ks;    // specular properties of the material
 uniform float Ns;   // specular exponent
 
 // light source
-uniform vec3 light; // light position in view space
-uniform vec3 Ia;    // ambient light properties
-uniform vec3 Id;    // diffuse properties of the light source
-uniform vec3 Is;    // specular properties of the light source
+//=== per-pass data shared by all shader programs (see shaders.FrameUniforms)
+layout(std140, row_major) uniform Frame {
+    mat4 P;     // the projection matrix
+    mat4 V;     // the view matrix
+    vec3 light; // light position in view space
+    vec3 Ia;    // ambient light properties
+    vec3 Id;    // diffuse properties of the light source
+    vec3 Is;    // specular properties of the light source
+};
 
 uniform float alpha = 1.0f;
 
@@ -52,6 +62,9 @@ void main() {
     vec4 texval = vec4(1.0f);
     if(has_texture == 1)
         texval = texture2D(textureObject, fragment_texCoord);
+#ifdef INSTANCED
+    texval *= fragment_tint;
+#endif
 
     // 5. Finally, we combine the shading components
     final_color = texval*ambient + attenuation*(texval*diffuse + specular);
@@ -1,4 +1,5 @@
 #version 130		// required to use OpenGL core standard
+#extension GL_ARB_uniform_buffer_object : require
 
 //=== in attributes are read from the vertex array, one row per instance of the shader
 in vec3 position;	// the position attribute contains the vertex position
@@ -12,10 +13,26 @@ out vec3 position_view_space;   // the position of the vertex in view coordinate
 out vec3 normal_view_space;     // the normal of the vertex in view coordinates
 out vec2 fragment_texCoord;
 
+#ifdef INSTANCED
+//=== per-instance attributes, see instancedModel.InstanceBuffer
+in mat4 instance_M;     // the model matrix of the instance, relative to the model matrix M
+in vec4 instance_tint;  // the colour multiplying the texture of the instance
+out vec4 fragment_tint;
+#endif
+
+//=== per-pass data shared by all shader programs (see shaders.FrameUniforms)
+layout(std140, row_major) uniform Frame {
+    mat4 P;     // the projection matrix
+    mat4 V;     // the view matrix
+    vec3 light; // light position in view space
+    vec3 Ia;    // ambient light properties
+    vec3 Id;    // diffuse properties of the light source
+    vec3 Is;    // specular properties of the light source
+};
+
 //=== uniforms
-uniform mat4 PVM; 	// the Perspective-View-Model matrix is received as a Uniform
-uniform mat4 VM; 	// the View-Model matrix is received as a Uniform
-uniform mat3 VMiT;  // The inverse-transpose of the view model matrix, used for normals
+uniform mat4 M; 	// the Model matrix is received as a Uniform
+uniform mat3 MiT;   // The inverse-transpose of the model matrix, used for normals
 uniform int mode;	// the rendering mode (better to code different shaders!)
 
 
@@ -23,14 +40,24 @@ void main() {
     // 1. first, we transform the position using PVM matrix.
     // note that gl_Position is a standard output of the
     // vertex shader.
-    gl_Position = PVM * vec4(position, 1.0f);
+#ifdef INSTANCED
+    // instances are only rotated and uniformly scaled, so their rotation part also transforms normals
+    mat4 model = M * instance_M;
+    vec3 model_normal = MiT * (mat3(instance_M) * normal);
+    fragment_tint = instance_tint;
+#else
+    mat4 model = M;
+    vec3 model_normal = MiT * normal;
+#endif
+    vec4 position_view = V * (model * vec4(position, 1.0f));
+    gl_Position = P * position_view;
 
     // 2. calculate vectors used for shading calculations
     // those will be interpolate before being sent to the
     // fragment shader.
-    // TODO WS4
-    position_view_space = vec3(VM*vec4(position,1.0f));
-    normal_view_space = normalize(VMiT*normal);
+    // the view matrix is a rigid transform, so its rotation part also transforms normals
+    position_view_space = vec3(position_view);
+    normal_view_space = normalize(mat3(V)*model_normal);
 
     // 3. forward the texture coordinates.
     fragment_texCoord = texCoord;
@@ -1,10 +1,14 @@
 # version 130 // required to use OpenGL core standard
+#extension GL_ARB_uniform_buffer_object : require
 
 //=== 'in' attributes are passed on from the vertex shader's 'out' attributes, and interpolated for each fragment
 in vec3 fragment_color;        // the fragment colour
 in vec3 position_view_space;   // the position in view coordinates of this fragment
 in vec3 normal_view_space;     // the normal in view coordinates to this fragment
 in vec2 fragment_texCoord;
+#ifdef INSTANCED
+in vec4 fragment_tint;         // the colour of the instance, see instancedModel.InstanceBuffer
+#endif
 
 //=== 'out' attributes are the output image, usually only one for the colour of each pixel
 out vec4 final_color;
@@ -13,12 +17,20 @@ out vec4 final_color;
 uniform int mode;	// the rendering mode (better to code different shaders!)
 uniform int has_texture;
 uniform sampler2D textureObject; // texture object
+#ifdef CASCADES
+uniform sampler2DArrayShadow shadow_map;    // one layer per cascade, see ShadowMapping.CascadedShadowMap
+#else
 uniform sampler2DShadow shadow_map;
+#endif
 //uniform sampler2D old_map;
 
 // shadow map matrix
 // this shadow map matrix times the fragment shader position allows looking up the depth in the shadow map texture
+#ifdef CASCADES
+uniform mat4 shadow_map_matrix[CASCADES];
+#else
 uniform mat4 shadow_map_matrix;
+#endif
 
 // material uniforms
 uniform vec3 Ka;    // ambient reflection properties of the material
@@ -27,10 +39,15 @@ uniform vec3 Ks;    // specular properties of the material
 uniform float Ns;   // specular exponent
 
 // light source
-uniform vec3 light; // light position in view space
-uniform vec3 Ia;    // ambient light properties
-uniform vec3 Id;    // diffuse properties of the light source
-uniform vec3 Is;    // specular properties of the light source
+//=== per-pass data shared by all shader programs (see shaders.FrameUniforms)
+layout(std140, row_major) uniform Frame {
+    mat4 P;     // the projection matrix
+    mat4 V;     // the view matrix
+    vec3 light; // light position in view space
+    vec3 Ia;    // ambient light properties
+    vec3 Id;    // diffuse properties of the light source
+    vec3 Is;    // specular properties of the light source
+};
 
 uniform float alpha = 1.0f;
 
@@ -67,6 +84,9 @@ void main() {
     vec4 texval = vec4(1.0f);
     if(has_texture == 1)
         texval = texture2D(textureObject, fragment_texCoord);
+#ifdef INSTANCED
+    texval *= fragment_tint;
+#endif
 
     final_color = vec4(0.0f);
 
@@ -74,6 +94,19 @@ void main() {
 
     final_color = phong(texval);
 
+#ifdef CASCADES
+    // the cascades are orthographic and sorted from the smallest, use the first one containing the fragment
+    for (int cascade = 0; cascade < CASCADES; cascade++)
+    {
+        vec3 q = (shadow_map_matrix[cascade]*vec4(position_view_space, 1)).xyz;
+        if (all(greaterThanEqual(q, vec3(0.0))) && all(lessThanEqual(q, vec3(1.0))))
+        {
+            float val = texture(shadow_map, vec4(q.xy, float(cascade), q.z*0.999));
+            final_color.xyz = (1.0-val)*Ka*Ia*texval.xyz + val*final_color.xyz;
+            break;
+        }
+    }
+#else
     vec4 p = shadow_map_matrix*vec4(position_view_space, 1);
 
     //float zlight = texture(old_map, p.xy/p.w).r;
@@ -119,6 +152,7 @@ void main() {
         //final_color = vec4(texture(old_map, p.xy).r, 0.0f, 0.0f, 1.0f);
         //final_color = vec4(-p.z, 0.0f, 0.0f, 1.0f);
 	}
+#endif
     //*/
 
     //final_color.xyz = Ka*Ia*texval.xyz; //
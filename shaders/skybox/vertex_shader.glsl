@@ -1,4 +1,5 @@
 #version 130
+#extension GL_ARB_uniform_buffer_object : require
 
 //=== in attributes are read from the vertex array, one row per instance of the shader
 in vec3 position;	// the position attribute contains the vertex position
@@ -7,11 +8,24 @@ in vec3 position;	// the position attribute contains the vertex position
 //=== out attributes are interpolated on the face, and passed on to the fragment shader
 out vec3 fragment_texCoord;
 
-uniform mat4 PVM;
+//=== per-pass data shared by all shader programs (see shaders.FrameUniforms)
+layout(std140, row_major) uniform Frame {
+    mat4 P;     // the projection matrix
+    mat4 V;     // the view matrix
+    vec3 light; // light position in view space
+    vec3 Ia;    // ambient light properties
+    vec3 Id;    // diffuse properties of the light source
+    vec3 Is;    // specular properties of the light source
+};
+
+uniform mat4 M;
 
 void main(void)
 {
-	gl_Position = PVM*vec4(position, 1);
+	gl_Position = P*V*M*vec4(position, 1);
+#ifndef LAYERED
+	// layered shaders transform gl_Position again for each layer (see shaders.layered_shaders), so it must stay linear
 	gl_Position.z = gl_Position.w*0.9999;
+#endif
 	fragment_texCoord = -position;
 }
@@ -1,10 +1,11 @@
 #version 130		// required to use OpenGL core standard
+#extension GL_ARB_uniform_buffer_object : require
 
 //=== in attributes are read from the vertex array, one row per instance of the shader
 in vec3 position;	// the position attribute contains the vertex position
 in vec3 normal;		// store the vertex normal
-in vec3 tangent;
-in vec3 binormal;
+in vec4 tangent;	// the tangent, with the handedness of the binormal in w in the compact layouts
+in vec3 binormal;	// the binormal, only stored by the float layout (see vertexLayout.py)
 in vec3 color; 		// store the vertex colour
 in vec2 texCoord;
 
@@ -14,18 +15,38 @@ out vec3 view_normal;
 out vec3 view_tangent;
 out vec3 view_binormal;
 
+//=== per-pass data shared by all shader programs (see shaders.FrameUniforms)
+layout(std140, row_major) uniform Frame {
+    mat4 P;     // the projection matrix
+    mat4 V;     // the view matrix
+    vec3 light; // light position in view space
+    vec3 Ia;    // ambient light properties
+    vec3 Id;    // diffuse properties of the light source
+    vec3 Is;    // specular properties of the light source
+};
+
 //=== uniforms
-uniform mat4 PVM; 	// the Perspective-View-Model matrix is received as a Uniform
-uniform mat3 VMiT;
+uniform mat4 M; 	// the Model matrix is received as a Uniform
+uniform mat3 MiT;   // The inverse-transpose of the model matrix, used for normals
 
 
 void main(){
     // 1. first, we transform the position using PVM matrix.
     // note that gl_Position is a standard output of the
     // vertex shader.
-    gl_Position = PVM * vec4(position, 1.0f);
+    gl_Position = P * V * M * vec4(position, 1.0f);
 
 
     // 2. forward the texture coordinates.
     fragment_texCoord = texCoord;
+
+    // 3. transform the tangent basis to view coordinates. Attributes missing from the layout read as zero, in which
+    // case the binormal is derived from the normal, the tangent and its handedness (see tangents_with_handedness)
+    vec3 model_binormal = binormal;
+    if (binormal == vec3(0.0f)) {
+        model_binormal = cross(normal, tangent.xyz)*tangent.w;
+    }
+    view_normal = normalize(mat3(V)*(MiT*normal));
+    view_tangent = normalize(mat3(V*M)*tangent.xyz);
+    view_binormal = normalize(mat3(V*M)*model_binormal);
 }
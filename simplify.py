@@ -0,0 +1,165 @@
+#Import heapq for the queue of edge collapses
+import heapq
+#Import numpy for the quadrics
+import numpy as np
+
+
+def face_quadrics(positions, faces):
+    '''
+    Returns the error quadric of the plane of each face, weighted by the area of the face.
+    :return: a tuple (quadrics, normals) of (F, 4, 4) and (F, 3) arrays, the normals being of unit length
+    '''
+    corners = positions[faces]
+    normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+    lengths = np.linalg.norm(normals, axis=1)
+    normals = normals/np.maximum(lengths, 1e-12)[:, None]
+    planes = np.hstack([normals, -np.sum(normals*corners[:, 0], axis=1)[:, None]])
+    return 0.5*lengths[:, None, None]*planes[:, :, None]*planes[:, None, :], normals
+
+
+def boundary_quadrics(positions, faces, normals, weight):
+    '''
+    Returns the quadrics of the planes through the boundary edges of a mesh, perpendicular to their face, which keep
+    borders (including the seams where vertices are split by their texture coordinates) in place.
+    :return: a tuple (edges, quadrics) of the (E, 2) boundary edges and (E, 4, 4) quadrics
+    '''
+    edges = np.stack([faces, np.roll(faces, -1, axis=1)], axis=2).reshape(-1, 2)
+    owner = np.repeat(np.arange(faces.shape[0]), 3)
+    (_, inverse, counts) = np.unique(np.sort(edges, axis=1), axis=0, return_inverse=True, return_counts=True)
+    boundary = counts[inverse.ravel()] == 1
+    edges = edges[boundary]
+    owner = owner[boundary]
+    direction = positions[edges[:, 1]] - positions[edges[:, 0]]
+    lengths = np.linalg.norm(direction, axis=1)
+    normal = np.cross(direction, normals[owner])
+    normal = normal/np.maximum(np.linalg.norm(normal, axis=1), 1e-12)[:, None]
+    planes = np.hstack([normal, -np.sum(normal*positions[edges[:, 0]], axis=1)[:, None]])
+    return edges, weight*(lengths**2)[:, None, None]*planes[:, :, None]*planes[:, None, :]
+
+
+def simplify(vertices, faces, target, boundary_weight=100., merged=None):
+    '''
+    Simplifies a triangle mesh with quadric error metrics (Garland and Heckbert): the edges whose collapse adds the
+    least error are collapsed first, until the mesh has the target number of faces or no edge can be collapsed
+    without flipping a face. Edges are collapsed onto one of their vertices rather than onto a new position, so that
+    the simplified faces index the original vertex arrays, whose normals and texture coordinates stay valid, and
+    all levels of detail of a mesh can share the same vertex buffer.
+    :param vertices: the (V, 3) array of the vertex positions
+    :param faces: the (F, 3) array of the triangles
+    :param target: the number of faces to reach
+    :param boundary_weight: the weight of the error of moving boundary edges, relative to moving faces
+    :param merged: [optional] a (V,) array holding for each vertex the vertex it was merged into (itself if none),
+    updated in place with each collapse; it can hold chains, which resolve_merges() follows
+    :return: the (F', 3) array of the remaining triangles, indexing the same vertices
+    '''
+    positions = np.asarray(vertices, dtype='f8')[:, :3]
+    faces = np.array(faces, dtype=np.int64)
+    if faces.shape[0] <= target:
+        return faces
+    (quadrics, normals) = face_quadrics(positions, faces)
+    Q = np.zeros((positions.shape[0], 4, 4))
+    for corner in range(3):
+        np.add.at(Q, faces[:, corner], quadrics)
+    (edges, quadrics) = boundary_quadrics(positions, faces, normals, boundary_weight)
+    for end in range(2):
+        np.add.at(Q, edges[:, end], quadrics)
+    homogeneous = np.hstack([positions, np.ones((positions.shape[0], 1))])
+
+    vertex_faces = [set() for _ in range(positions.shape[0])]
+    for (face, triangle) in enumerate(faces):
+        for vertex in triangle:
+            vertex_faces[vertex].add(face)
+    alive = np.ones(faces.shape[0], dtype=bool)
+    remaining = faces.shape[0]
+    version = np.zeros(positions.shape[0], dtype=np.int64)
+
+    def collapse(a, b):
+        ''' Returns the queue entry of the cheapest direction of collapsing the edge (a, b) '''
+        error = Q[a] + Q[b]
+        to_b = homogeneous[b] @ error @ homogeneous[b]
+        to_a = homogeneous[a] @ error @ homogeneous[a]
+        if to_b <= to_a:
+            return (to_b, a, b, version[a], version[b])
+        return (to_a, b, a, version[b], version[a])
+
+    edges = np.unique(np.sort(np.stack([faces, np.roll(faces, -1, axis=1)], axis=2).reshape(-1, 2), axis=1), axis=0)
+    queue = [collapse(a, b) for (a, b) in edges]
+    heapq.heapify(queue)
+    while remaining > target and len(queue) > 0:
+        (_, a, b, version_a, version_b) = heapq.heappop(queue)
+        if version[a] != version_a or version[b] != version_b:
+            continue
+        #Faces of a that would be removed (they contain the edge) and moved
+        shared = [face for face in vertex_faces[a] if b in faces[face]]
+        if len(shared) == 0:
+            continue
+        moved = [face for face in vertex_faces[a] if b not in faces[face]]
+        #Reject collapses that would flip or squash a face
+        flipped = False
+        for face in moved:
+            corners = positions[np.where(faces[face] == a, b, faces[face])]
+            normal = np.cross(corners[1] - corners[0], corners[2] - corners[0])
+            length = np.linalg.norm(normal)
+            if length < 1e-12 or np.dot(normal, normals[face]) < 0.2*length:
+                flipped = True
+                break
+        if flipped:
+            continue
+        for face in shared:
+            alive[face] = False
+            remaining -= 1
+            for vertex in faces[face]:
+                vertex_faces[vertex].discard(face)
+        for face in moved:
+            faces[face][faces[face] == a] = b
+            vertex_faces[b].add(face)
+            corners = positions[faces[face]]
+            normal = np.cross(corners[1] - corners[0], corners[2] - corners[0])
+            normals[face] = normal/np.linalg.norm(normal)
+        vertex_faces[a] = set()
+        if merged is not None:
+            merged[a] = b
+        Q[b] += Q[a]
+        version[a] += 1
+        version[b] += 1
+        for vertex in set(faces[list(vertex_faces[b])].ravel()) - {b}:
+            heapq.heappush(queue, collapse(vertex, b))
+    return faces[alive]
+
+
+def resolve_merges(merged):
+    '''
+    Follows the chains of merges recorded by simplify(), in place, so that each vertex gives the vertex that is left
+    in its place.
+    '''
+    while True:
+        target = merged[merged]
+        if np.array_equal(target, merged):
+            return merged
+        merged[:] = target
+
+
+def generate_lods(mesh, ratios=(0.5, 0.25, 0.125)):
+    '''
+    Generates the levels of detail of a mesh, each simplified from the previous one, and stores them in mesh.lods.
+    The error of each level, stored in mesh.lod_errors, is the largest distance between a vertex of the full mesh and
+    the vertex it was merged into, in model coordinates, which bounds how far the surface moved.
+    :param mesh: a Mesh, only indexed triangle meshes get levels of detail
+    :param ratios: the fraction of the faces of the mesh kept at each level
+    :return: the list of the face arrays of each level after the full mesh, indexing the vertices of the mesh
+    '''
+    mesh.lods = []
+    mesh.lod_errors = []
+    mesh.lod_ratios = tuple(ratios)
+    if mesh.faces is None or mesh.faces.shape[1] != 3:
+        return mesh.lods
+    positions = np.asarray(mesh.vertices, dtype='f8')[:, :3]
+    used = np.unique(mesh.faces)
+    merged = np.arange(positions.shape[0])
+    faces = mesh.faces
+    for ratio in ratios:
+        faces = simplify(mesh.vertices, faces, int(mesh.faces.shape[0]*ratio), merged=merged).astype(mesh.faces.dtype)
+        resolve_merges(merged)
+        mesh.lods.append(faces)
+        mesh.lod_errors.append(float(np.max(np.linalg.norm(positions[used] - positions[merged[used]], axis=1), initial=0.)))
+    return mesh.lods
@@ -12,13 +12,8 @@ class SkyBoxShader(BaseShaderProgram):
         self.add_uniform('sampler_cube')
 
     def bind(self, model, M):
+        #The projection and view matrices are in the Frame block (see FrameUniforms)
         BaseShaderProgram.bind(self, model, M)
-        P = model.scene.P  # get projection matrix from the scene
-        V = model.scene.camera.V  # get view matrix from the camera
-        Vr = np.identity(4)
-        Vr[:3, :3] = V[:3, :3]
-        self.uniforms['PVM'].bind(np.matmul(P, np.matmul(V, M)))
-
 
 
 class SkyBox(DrawModelFromMesh):
@@ -1,6 +1,27 @@
 import pygame
 from OpenGL.GL import *
+from OpenGL.GL.EXT.texture_compression_s3tc import GL_COMPRESSED_RGB_S3TC_DXT1_EXT, GL_COMPRESSED_RGBA_S3TC_DXT5_EXT
 import numpy as np
+#Import the cache of the converted textures
+from textureCache import TextureCache
+
+#Textures loaded with their mip chain are converted once and stored in this cache (see Texture())
+texture_cache = TextureCache()
+#OpenGL formats of the block compressions of the cache
+compressed_formats = {'bc1': GL_COMPRESSED_RGB_S3TC_DXT1_EXT, 'bc3': GL_COMPRESSED_RGBA_S3TC_DXT5_EXT}
+#Whether the context supports those formats, None until it is checked (see s3tc_supported())
+s3tc = None
+
+
+def s3tc_supported():
+    ''' Returns whether the context supports GL_EXT_texture_compression_s3tc, the extensions are only listed once '''
+    global s3tc
+    if s3tc is None:
+        extensions = [glGetStringi(GL_EXTENSIONS, index) for index in range(glGetIntegerv(GL_NUM_EXTENSIONS))]
+        s3tc = b'GL_EXT_texture_compression_s3tc' in extensions
+        if not s3tc:
+            print('(W) Warning, GL_EXT_texture_compression_s3tc is not supported, textures are loaded uncompressed')
+    return s3tc
 
 
 class ImageWrapper:
@@ -22,12 +43,25 @@ class ImageWrapper:
         elif format == GL_RGB:
             return pygame.image.tostring(self.img, "RGB", 1)
 
+    def pixels(self):
+        ''' Returns the (height, width, 4) uint8 array of the RGBA texels, with the first row at the bottom '''
+        return np.frombuffer(self.data(GL_RGBA), dtype=np.uint8).reshape(self.height(), self.width(), 4)
+
 
 class Texture:
     '''
     Class to handle texture loading.
     '''
-    def __init__(self, name, img=None, wrap=GL_REPEAT, sample=GL_NEAREST, format=GL_RGBA, type=GL_UNSIGNED_BYTE, target=GL_TEXTURE_2D):
+    #Number of mip levels uploaded, and the size of the texels uploaded in bytes
+    levels = 1
+    bytes = 0
+
+    def __init__(self, name, img=None, wrap=GL_REPEAT, sample=GL_NEAREST, format=GL_RGBA, type=GL_UNSIGNED_BYTE, target=GL_TEXTURE_2D, mipmaps=False):
+        '''
+        :param mipmaps: whether the image is loaded with its full mip chain, through texture_cache, and minified with
+        the mipmaps (only for RGBA images loaded from a file). The chain is compressed as set in texture_cache, unless
+        the context does not support S3TC.
+        '''
         self.name = name
         self.format = format
         self.type = type
@@ -41,14 +75,23 @@ class Texture:
 
         self.bind()
 
-        if img is None:
+        if img is None and mipmaps:
+            compression = texture_cache.compression
+            if compression is not None and not s3tc_supported():
+                compression = None
+            (header, levels) = texture_cache.get('./textures/{}'.format(name), lambda: ImageWrapper(name).pixels(), compression)
+            self.upload_levels(header, levels)
+        elif img is None:
             img = ImageWrapper(name)
 
             # load the texture in the buffer
-            glTexImage2D(self.target, 0, format, img.width(), img.height(), 0, format, type, img.data(format))
+            data = img.data(format)
+            glTexImage2D(self.target, 0, format, img.width(), img.height(), 0, format, type, data)
+            self.bytes = len(data)
         else:
             # if a data array is provided use this
             glTexImage2D(self.target, 0, format, img.shape[0], img.shape[1], 0, format, type, img)
+            self.bytes = img.nbytes
 
 
         # set what happens for texture coordinates outside [0,1]
@@ -57,10 +100,33 @@ class Texture:
 
         # set how sampling from the texture is done.
         glTexParameteri(self.target, GL_TEXTURE_MAG_FILTER, sample)
-        glTexParameteri(self.target, GL_TEXTURE_MIN_FILTER, sample)
+        glTexParameteri(self.target, GL_TEXTURE_MIN_FILTER, self.min_filter(sample))
 
         self.unbind()
 
+    def upload_levels(self, header, levels):
+        '''
+        Uploads a mip chain to the texture that is bound, one level at a time.
+        :param header: the description of the levels (see TextureCache.convert())
+        :param levels: the uint8 arrays of the texels or compressed blocks of each level
+        '''
+        compression = header['compression']
+        self.bytes = 0
+        for (index, (level, data)) in enumerate(zip(header['levels'], levels)):
+            if compression is None:
+                glTexImage2D(self.target, index, self.format, level['width'], level['height'], 0, GL_RGBA, GL_UNSIGNED_BYTE, data)
+            else:
+                glCompressedTexImage2D(self.target, index, compressed_formats[compression], level['width'], level['height'], 0, data)
+            self.bytes += level['bytes']
+        self.levels = len(levels)
+        glTexParameteri(self.target, GL_TEXTURE_MAX_LEVEL, self.levels - 1)
+
+    def min_filter(self, sample):
+        ''' Returns the minifying filter for a sampling, which also blends the two nearest mipmaps if there are any '''
+        if self.levels == 1:
+            return sample
+        return GL_LINEAR_MIPMAP_LINEAR if sample == GL_LINEAR else GL_NEAREST_MIPMAP_LINEAR
+
     def set_shadow_comparison(self):
         self.set_parameter(GL_TEXTURE_COMPARE_MODE, GL_COMPARE_REF_TO_TEXTURE)
 
@@ -80,7 +146,7 @@ class Texture:
         self.sample = sample
         self.bind()
         glTexParameteri(self.target, GL_TEXTURE_MAG_FILTER, sample)
-        glTexParameteri(self.target, GL_TEXTURE_MIN_FILTER, sample)
+        glTexParameteri(self.target, GL_TEXTURE_MIN_FILTER, self.min_filter(sample))
         self.unbind()
 
     def set_data_from_image(self, data, width=None, height=None):
@@ -0,0 +1,273 @@
+#Import json and os to describe and store the converted textures
+import json
+import os
+#Import numpy for the mip chain and the block compression
+import numpy as np
+#Import the cache of the meshes, whose validation and eviction are shared
+from meshCache import MeshCache
+
+
+def generate_mipmaps(pixels):
+    '''
+    Returns the full mip chain of an image, each level averaging the blocks of 2x2 texels of the previous one down to
+    a single texel. Odd rows or columns are dropped, as the size of each level is half the previous one rounded down.
+    :param pixels: a (height, width, channels) uint8 array
+    :return: the list of the levels as uint8 arrays, the image first
+    '''
+    levels = [pixels]
+    level = pixels.astype(np.uint16)
+    while level.shape[0] > 1 or level.shape[1] > 1:
+        height = max(level.shape[0]//2, 1)
+        width = max(level.shape[1]//2, 1)
+        if level.shape[0] > 1:
+            level = level[0:2*height:2] + level[1:2*height:2]
+        else:
+            level = 2*level
+        if level.shape[1] > 1:
+            level = level[:, 0:2*width:2] + level[:, 1:2*width:2]
+        else:
+            level = 2*level
+        level = (level + 2)//4
+        levels.append(level.astype(np.uint8))
+    return levels
+
+
+def image_blocks(pixels):
+    '''
+    Splits an image into the blocks of 4x4 texels of block compression, repeating its last row and column when its
+    size is not a multiple of 4.
+    :return: a (blocks, 16, channels) float32 array, the blocks in rows from the first row of the image
+    '''
+    (height, width, channels) = pixels.shape
+    rows = -(-height//4)*4
+    columns = -(-width//4)*4
+    pixels = np.pad(pixels, ((0, rows - height), (0, columns - width), (0, 0)), mode='edge')
+    blocks = pixels.reshape(rows//4, 4, columns//4, 4, channels).transpose(0, 2, 1, 3, 4)
+    return blocks.reshape(-1, 16, channels).astype('f')
+
+
+def encode_bc1(blocks, four_colors=False):
+    '''
+    Encodes blocks of RGB texels in the BC1 (DXT1) format: two RGB565 end points and a 2 bit index per texel choosing
+    between them and two colours in between. The end points are the extremes of the colours along their principal
+    axis.
+    :param blocks: a (blocks, 16, 3) array
+    :param four_colors: whether the end points are always ordered for the four colour mode, as BC3 requires
+    :return: a (blocks, 8) uint8 array
+    '''
+    mean = blocks.mean(axis=1, keepdims=True)
+    centered = blocks - mean
+    covariance = np.matmul(centered.transpose(0, 2, 1), centered)
+    #Principal axis by power iteration
+    axis = np.ones((blocks.shape[0], 3, 1), dtype='f')
+    for i in range(4):
+        axis = np.matmul(covariance, axis)
+        axis /= np.maximum(np.abs(axis).max(axis=1, keepdims=True), 1e-6)
+    axis = axis[:, :, 0]
+    axis /= np.maximum(np.linalg.norm(axis, axis=1, keepdims=True), 1e-6)
+    projection = np.sum(centered*axis[:, None, :], axis=2)
+    ends = [mean[:, 0] + axis*projection.max(axis=1, keepdims=True), mean[:, 0] + axis*projection.min(axis=1, keepdims=True)]
+    #Quantise the end points to RGB565, then expand them back to the colours the GPU decodes
+    packed = []
+    decoded = []
+    for end in ends:
+        end = np.clip(np.rint(end*[31./255., 63./255., 31./255.]), 0, [31, 63, 31]).astype(np.uint16)
+        packed.append((end[:, 0] << 11) | (end[:, 1] << 5) | end[:, 2])
+        decoded.append(np.stack([(end[:, 0] << 3) | (end[:, 0] >> 2), (end[:, 1] << 2) | (end[:, 1] >> 4), (end[:, 2] << 3) | (end[:, 2] >> 2)], axis=1).astype('f'))
+    #The four colour mode needs the first end point to be greater, equal end points only use the first colour
+    swap = packed[0] < packed[1]
+    (packed[0], packed[1]) = (np.where(swap, packed[1], packed[0]), np.where(swap, packed[0], packed[1]))
+    (decoded[0], decoded[1]) = (np.where(swap[:, None], decoded[1], decoded[0]), np.where(swap[:, None], decoded[0], decoded[1]))
+    palette = np.stack([decoded[0], decoded[1], (2.*decoded[0] + decoded[1])/3., (decoded[0] + 2.*decoded[1])/3.], axis=1)
+    distance = np.sum((blocks[:, :, None, :] - palette[:, None, :, :])**2, axis=3)
+    indices = np.argmin(distance, axis=2).astype(np.uint32)
+    if not four_colors:
+        indices[packed[0] == packed[1]] = 0
+    bits = np.bitwise_or.reduce(indices << (2*np.arange(16, dtype=np.uint32)), axis=1)
+    encoded = np.empty((blocks.shape[0], 8), dtype=np.uint8)
+    encoded[:, 0:2] = packed[0].astype('<u2').view(np.uint8).reshape(-1, 2)
+    encoded[:, 2:4] = packed[1].astype('<u2').view(np.uint8).reshape(-1, 2)
+    encoded[:, 4:8] = bits.astype('<u4').view(np.uint8).reshape(-1, 4)
+    return encoded
+
+
+def encode_bc3_alpha(alpha):
+    '''
+    Encodes the alpha of blocks of texels in the alpha block of the BC3 (DXT5) format: two 8 bit end points, the
+    largest first, and a 3 bit index per texel choosing between them and six values in between.
+    :param alpha: a (blocks, 16) array
+    :return: a (blocks, 8) uint8 array
+    '''
+    high = alpha.max(axis=1)
+    low = alpha.min(axis=1)
+    weights = np.array([0., 7., 1., 2., 3., 4., 5., 6.], dtype='f')/7.
+    palette = high[:, None]*(1. - weights) + low[:, None]*weights
+    indices = np.argmin(np.abs(alpha[:, :, None] - palette[:, None, :]), axis=2).astype(np.uint64)
+    bits = np.bitwise_or.reduce(indices << (3*np.arange(16, dtype=np.uint64)), axis=1)
+    encoded = np.empty((alpha.shape[0], 8), dtype=np.uint8)
+    encoded[:, 0] = high
+    encoded[:, 1] = low
+    encoded[:, 2:8] = bits.astype('<u8').view(np.uint8).reshape(-1, 8)[:, :6]
+    return encoded
+
+
+def compress_level(pixels, compression, chunk_blocks=65536):
+    '''
+    Block compresses an RGBA level of a mip chain.
+    :param compression: 'bc1' for opaque textures, or 'bc3' to keep the alpha
+    :param chunk_blocks: the approximate number of blocks encoded at once, which bounds the memory used
+    :return: the uint8 array of the blocks
+    '''
+    rows = 4*max(chunk_blocks//max(-(-pixels.shape[1]//4), 1), 1)
+    encoded = []
+    for start in range(0, pixels.shape[0], rows):
+        blocks = image_blocks(pixels[start:start + rows])
+        if compression == 'bc1':
+            encoded.append(encode_bc1(blocks[:, :, :3]))
+        else:
+            encoded.append(np.hstack([encode_bc3_alpha(blocks[:, :, 3]), encode_bc1(blocks[:, :, :3], four_colors=True)]))
+    return np.concatenate(encoded).ravel()
+
+
+class TextureCache(MeshCache):
+    '''
+    Cache of the textures converted for upload, so that each image file is only decoded once.
+    Each image and compression gets one file holding a JSON header (the key of the source file, as for the meshes,
+    and the size, offset and length of each level) followed by the full mip chain of the image as RGBA texels or
+    block compressed (see generate_mipmaps() and compress_level()). The levels are memory mapped when loaded, so
+    that they are read from the file as they are uploaded, one level at a time.
+    '''
+    version = 1
+    extension = '.tex'
+    #Start of each file, followed by the length of the header as a 32 bit integer
+    magic = b'TEXC'
+    alignment = 16
+
+    def __init__(self, folder='cache/textures', max_bytes=1024*1024*1024, enabled=True, compression=None):
+        '''
+        Initialises the cache
+        :param compression: None to keep the texels as they are, 'bc1', 'bc3', or 'auto' for BC1 when the image is
+        opaque and BC3 otherwise
+        '''
+        MeshCache.__init__(self, folder=folder, max_bytes=max_bytes, enabled=enabled)
+        self.compression = compression
+
+    def path(self, file_name, compression=None):
+        ''' Returns the name of the cache file for a given source file and compression '''
+        path = MeshCache.path(self, file_name)
+        return '{}.{}{}'.format(path[:-len(self.extension)], compression or 'rgba', self.extension)
+
+    def read_header(self, path):
+        ''' Returns the header of an entry and the offset of its levels in the file '''
+        with open(path, 'rb') as file:
+            start = file.read(8)
+            if start[:4] != self.magic:
+                raise ValueError('not a texture cache entry')
+            length = int(np.frombuffer(start[4:], dtype='<u4')[0])
+            header = json.loads(file.read(length).decode('utf-8'))
+        return header, -(-(8 + length)//self.alignment)*self.alignment
+
+    def source(self, path):
+        try:
+            return self.read_header(path)[0]['source']
+        except Exception:
+            return None
+
+    def convert(self, image, compression=None):
+        '''
+        Converts an image to the levels of its mip chain.
+        :param image: the (height, width, 4) uint8 array of the RGBA texels
+        :param compression: see TextureCache(), 'auto' being resolved here
+        :return: a tuple (header, levels) where levels is the list of the uint8 arrays of the levels
+        '''
+        if compression == 'auto':
+            compression = 'bc1' if np.all(image[:, :, 3] == 255) else 'bc3'
+        mipmaps = generate_mipmaps(image)
+        levels = [level.ravel() if compression is None else compress_level(level, compression) for level in mipmaps]
+        header = {'width': image.shape[1], 'height': image.shape[0], 'compression': compression, 'levels': []}
+        offset = 0
+        for (mipmap, level) in zip(mipmaps, levels):
+            header['levels'].append({'width': mipmap.shape[1], 'height': mipmap.shape[0], 'offset': offset, 'bytes': level.nbytes})
+            offset += level.nbytes
+        return header, levels
+
+    def load(self, file_name, compression=None):
+        '''
+        Loads the mip chain of an image from the cache.
+        :return: a tuple (header, levels) where levels is the list of the memory mapped uint8 arrays of the levels,
+        or None if there is no valid entry
+        '''
+        if not self.enabled:
+            return None
+        path = self.path(file_name, compression)
+        if not os.path.exists(path):
+            return None
+        try:
+            (header, offset) = self.read_header(path)
+        except Exception as e:
+            print('(W) Warning, could not read texture cache {}: {}'.format(path, e))
+            return None
+
+        key = self.key(file_name)
+        if header['version'] != key['version'] or header['source'] != key['source'] or header['size'] != key['size']:
+            return None
+        if header['mtime'] != key['mtime']:
+            #The file was touched, check whether its content actually changed
+            key = self.key(file_name, content_hash=True)
+            if header['hash'] != key['hash']:
+                return None
+            header.update(key)
+            data = np.fromfile(path, dtype=np.uint8, offset=offset)
+            self.write(path, header, [data])
+
+        #Mark the entry as recently used for eviction
+        os.utime(path)
+        print('Loaded {} texture level(s) from cache: {}'.format(len(header['levels']), path))
+        data = np.memmap(path, dtype=np.uint8, mode='r', offset=offset)
+        levels = [data[level['offset']:level['offset'] + level['bytes']] for level in header['levels']]
+        return header, levels
+
+    def store(self, file_name, header, levels, compression=None):
+        '''
+        Stores the mip chain of an image in the cache.
+        :param header: the description of the levels returned by convert()
+        :param levels: the uint8 arrays of the levels
+        :param compression: the compression requested, which names the entry ('auto' is not resolved)
+        '''
+        if not self.enabled:
+            return
+        header = dict(header)
+        header.update(self.key(file_name, content_hash=True))
+        os.makedirs(self.folder, exist_ok=True)
+        self.write(self.path(file_name, compression), header, levels)
+        self.evict()
+
+    def write(self, path, header, levels):
+        ''' Writes an entry to a temporary file first, so that an interrupted write never leaves a corrupt entry '''
+        encoded = json.dumps(header).encode('utf-8')
+        padding = -(8 + len(encoded)) % self.alignment
+        temporary = path + '.tmp'
+        with open(temporary, 'wb') as file:
+            file.write(self.magic)
+            file.write(np.array([len(encoded)], dtype='<u4').tobytes())
+            file.write(encoded + b' '*padding)
+            for level in levels:
+                file.write(np.ascontiguousarray(level).tobytes())
+        os.replace(temporary, path)
+
+    def get(self, file_name, image, compression='default'):
+        '''
+        Returns the mip chain of an image from the cache, converting and storing it first if needed.
+        :param image: a function returning the (height, width, 4) uint8 array of the RGBA texels, only called when
+        the image has to be converted
+        :param compression: see TextureCache(), or 'default' for the compression of the cache
+        :return: see load()
+        '''
+        if compression == 'default':
+            compression = self.compression
+        cached = self.load(file_name, compression)
+        if cached is not None:
+            return cached
+        (header, levels) = self.convert(image(), compression)
+        self.store(file_name, header, levels, compression)
+        return header, levels
@@ -0,0 +1,44 @@
+#Import numpy for the stacked matrix products
+import numpy as np
+
+
+class PassTransforms:
+    '''
+    Matrices of a pass that do not depend on the models, computed once when the pass starts (see
+    Scene.update_frame_uniforms()) instead of in every draw: the product PV, the inverse of V, and the matrices that
+    shaders derive from them, such as the shadow map lookup matrix, which are cached under a key (see get()).
+    '''
+    def __init__(self, P, V):
+        self.P = P
+        self.V = V
+        self.PV = np.matmul(P, V)
+        self.V_inverse = np.linalg.inv(V)
+        self.derived = {}
+
+    def get(self, key, compute):
+        '''
+        Returns a matrix derived from the matrices of the pass, computed the first time it is asked for.
+        :param key: identifies the matrix, it must change when anything else the matrix depends on changes
+        :param compute: the function computing the matrix from this object
+        '''
+        if key not in self.derived:
+            self.derived[key] = compute(self)
+        return self.derived[key]
+
+
+def update_model_transforms(models):
+    '''
+    Computes the float32 model matrix and normal matrix (the inverse transpose of the rotation part of M) that the
+    shaders use for each model (see BaseModel.transforms()), for the models whose matrix M was assigned since they
+    were last computed, with one stacked inversion for all of them.
+    '''
+    stale = [model for model in models if model.transforms_version != model.M_version]
+    if len(stale) == 0:
+        return
+    M = np.stack([model.M for model in stale]).astype('f8')
+    normals = np.linalg.inv(M[:, :3, :3]).transpose(0, 2, 1).astype('f')
+    M = M.astype('f')
+    for (model, matrix, normal) in zip(stale, M, normals):
+        model.world = matrix
+        model.normal_matrix = normal
+        model.transforms_version = model.M_version
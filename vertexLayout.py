@@ -0,0 +1,202 @@
+#Import ctypes for the offsets of the attributes
+import ctypes
+#Imports all openGL functions
+from OpenGL.GL import *
+#Import numpy to pack the vertex data
+import numpy as np
+
+
+def pack_2_10_10_10(data):
+    '''
+    Packs vectors with components in [-1, 1] in the GL_INT_2_10_10_10_REV format: x, y and z are stored as signed
+    normalised 10 bit integers, and w as a signed 2 bit integer (-1, 0 or 1).
+    :param data: a (N, 3) or (N, 4) array, missing w components are 0
+    :return: a (N,) uint32 array
+    '''
+    xyz = np.clip(np.rint(data[:, :3]*511.), -511, 511).astype(np.int32) & 0x3FF
+    if data.shape[1] > 3:
+        w = np.clip(np.rint(data[:, 3]), -1, 1).astype(np.int32) & 0x3
+    else:
+        w = np.zeros(data.shape[0], dtype=np.int32)
+    xyz = xyz.astype(np.uint32)
+    return xyz[:, 0] | (xyz[:, 1] << 10) | (xyz[:, 2] << 20) | (w.astype(np.uint32) << 30)
+
+
+def tangents_with_handedness(mesh):
+    '''
+    Returns the tangents of a mesh with their handedness in w, so that the binormal can be derived in the shader
+    as cross(normal, tangent.xyz)*tangent.w instead of being stored (see Mesh.calculate_normals).
+    '''
+    if mesh.tangents is None or mesh.binormals is None or mesh.normals is None:
+        return None
+    handedness = np.where(np.sum(np.cross(mesh.normals, mesh.tangents)*mesh.binormals, axis=1) < 0, -1., 1.)
+    return np.hstack([mesh.tangents, handedness[:, None]]).astype('f')
+
+
+class VertexAttribute:
+    '''
+    Describes how one vertex attribute is stored in an interleaved vertex buffer.
+    '''
+    #Number of bytes per component of each type
+    itemsizes = {GL_FLOAT: 4, GL_HALF_FLOAT: 2, GL_UNSIGNED_BYTE: 1, GL_INT_2_10_10_10_REV: 1}
+
+    def __init__(self, name, array, type=GL_FLOAT, size=None, normalized=False):
+        '''
+        :param name: the name of the attribute in the GLSL code
+        :param array: the name of the Mesh array holding the data, or a function returning it from a mesh
+        :param type: GL_FLOAT, GL_HALF_FLOAT, GL_UNSIGNED_BYTE (normalised colours) or GL_INT_2_10_10_10_REV
+        :param size: the number of components, by default the number of columns of the data
+        (always 4 for GL_INT_2_10_10_10_REV, which takes 4 bytes per vertex)
+        :param normalized: whether integer data is normalised to [-1, 1] or [0, 1] when read by the shader
+        '''
+        self.name = name
+        self.array = array
+        self.type = type
+        self.size = 4 if type == GL_INT_2_10_10_10_REV else size
+        self.normalized = normalized
+
+    def read(self, mesh):
+        ''' Returns the data of this attribute for a mesh, or None if the mesh does not have it '''
+        if callable(self.array):
+            return self.array(mesh)
+        return getattr(mesh, self.array)
+
+    def format(self, columns):
+        '''
+        Returns the numpy format of this attribute for data with a given number of columns.
+        '''
+        size = self.size if self.size is not None else columns
+        if self.type == GL_INT_2_10_10_10_REV:
+            return ('<u4', ()), 4
+        if self.type == GL_HALF_FLOAT:
+            return ('<f2', (size,)), size
+        if self.type == GL_UNSIGNED_BYTE:
+            return ('u1', (size,)), size
+        return ('<f4', (size,)), size
+
+    def convert(self, data, size):
+        '''
+        Converts float data to the storage type of this attribute.
+        '''
+        if self.type == GL_INT_2_10_10_10_REV:
+            return pack_2_10_10_10(data)
+        if data.shape[1] < size:
+            #Missing components are read as (.., 0, 1) by the shader
+            padding = np.zeros((data.shape[0], size - data.shape[1]), dtype=data.dtype)
+            padding[:, -1] = 1.
+            data = np.hstack([data, padding])
+        if self.type == GL_UNSIGNED_BYTE:
+            return np.rint(np.clip(data[:, :size], 0., 1.)*255.).astype(np.uint8)
+        if self.type == GL_HALF_FLOAT:
+            return data[:, :size].astype(np.float16)
+        return data[:, :size].astype(np.float32)
+
+
+class VertexLayout:
+    '''
+    Layout of the vertex data of a model: the attributes stored, in which format, interleaved in a single vertex
+    buffer, and the type of the indices. Attributes whose data is missing from the meshes are not stored, and get
+    consecutive locations in the order of the layout (see BaseShaderProgram.compile()).
+    Each attribute starts on a multiple of 4 bytes, as some drivers are slow or wrong otherwise.
+    '''
+    def __init__(self, name, attributes, compact_indices=False):
+        '''
+        :param name: the name of the layout, for reports
+        :param attributes: the list of VertexAttribute stored
+        :param compact_indices: whether to store indices as uint16 when all of them fit
+        '''
+        self.name = name
+        self.attributes = attributes
+        self.compact_indices = compact_indices
+
+    def pack(self, meshes):
+        '''
+        Interleaves the vertex data of one or more meshes, one after the other.
+        Data missing from some of the meshes is filled with zeros.
+        :return: a tuple (data, fields) where data is a structured array with one element per vertex, and fields the
+        list of (attribute, size) stored, in order
+        '''
+        arrays = []
+        fields = []
+        names = []
+        formats = []
+        offsets = []
+        offset = 0
+        for attribute in self.attributes:
+            data = [attribute.read(mesh) for mesh in meshes]
+            present = [array for array in data if array is not None]
+            if len(present) == 0:
+                continue
+            columns = present[0].shape[1]
+            data = [array if array is not None else np.zeros((mesh.vertices.shape[0], columns), dtype='f') for (mesh, array) in zip(meshes, data)]
+            (format, size) = attribute.format(columns)
+            arrays.append(np.concatenate(data))
+            fields.append((attribute, size))
+            names.append(attribute.name)
+            formats.append(format)
+            offsets.append(offset)
+            offset += (np.dtype(format).itemsize + 3)//4*4
+        dtype = np.dtype({'names': names, 'formats': formats, 'offsets': offsets, 'itemsize': offset})
+        vertices = np.zeros(sum([mesh.vertices.shape[0] for mesh in meshes]), dtype=dtype)
+        for ((attribute, size), array) in zip(fields, arrays):
+            vertices[attribute.name] = attribute.convert(array, size)
+        return vertices, fields
+
+    def create_vertex_buffer(self, meshes):
+        '''
+        Packs the meshes in a new vertex buffer and sets the attribute pointers of the vertex array that is bound.
+        :return: a tuple (vbo, attributes, bytes) where attributes is the dictionary {name: location}
+        '''
+        vertices, fields = self.pack(meshes)
+        vbo = glGenBuffers(1)
+        glBindBuffer(GL_ARRAY_BUFFER, vbo)
+        glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, vertices, GL_STATIC_DRAW)
+        attributes = {}
+        for (location, (attribute, size)) in enumerate(fields):
+            attributes[attribute.name] = location
+            glEnableVertexAttribArray(location)
+            glVertexAttribPointer(index=location, size=size, type=attribute.type, normalized=attribute.normalized,
+                                  stride=vertices.dtype.itemsize, pointer=ctypes.c_void_p(vertices.dtype.fields[attribute.name][1]))
+        return vbo, attributes, vertices.nbytes
+
+    def index_type(self, largest):
+        '''
+        Returns the numpy and OpenGL types of the indices, given the largest index stored.
+        '''
+        if self.compact_indices and largest < 65536:
+            return np.uint16, GL_UNSIGNED_SHORT
+        return np.uint32, GL_UNSIGNED_INT
+
+    def create_index_buffer(self, faces):
+        '''
+        Stores one or more index arrays one after the other in a new index buffer, bound to the vertex array.
+        :param faces: the list of index arrays
+        :return: a tuple (ibo, type, itemsize, bytes) where type is the OpenGL type of the indices
+        '''
+        (dtype, type) = self.index_type(max([int(np.max(array)) if array.size > 0 else 0 for array in faces]))
+        indices = np.ascontiguousarray(np.concatenate([array.ravel() for array in faces]), dtype=dtype)
+        ibo = glGenBuffers(1)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, ibo)
+        glBufferData(GL_ELEMENT_ARRAY_BUFFER, indices.nbytes, indices, GL_STATIC_DRAW)
+        return ibo, type, indices.itemsize, indices.nbytes
+
+
+#Every attribute in float32, as the meshes store them
+float_layout = VertexLayout('float', [
+    VertexAttribute('position', 'vertices'),
+    VertexAttribute('normal', 'normals'),
+    VertexAttribute('color', 'colors'),
+    VertexAttribute('texCoord', 'textureCoords'),
+    VertexAttribute('tangent', 'tangents'),
+    VertexAttribute('binormal', 'binormals'),
+])
+
+#Compact layout: 10 bit normals and tangents (with the handedness of the binormal, which is not stored), half float
+#texture coordinates, 8 bit colours and 16 bit indices when possible
+compact_layout = VertexLayout('compact', [
+    VertexAttribute('position', 'vertices'),
+    VertexAttribute('normal', 'normals', type=GL_INT_2_10_10_10_REV, normalized=True),
+    VertexAttribute('color', 'colors', type=GL_UNSIGNED_BYTE, size=4, normalized=True),
+    VertexAttribute('texCoord', 'textureCoords', type=GL_HALF_FLOAT),
+    VertexAttribute('tangent', tangents_with_handedness, type=GL_INT_2_10_10_10_REV, normalized=True),
+], compact_indices=True)